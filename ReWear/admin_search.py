@@ -0,0 +1,269 @@
+"""Admin typeahead for users and transactions.
+
+Users are found by id, by email prefix (a lower(email) text_pattern_ops
+b-tree) and by substring of email or name (pg_trgm GIN indexes, which serve
+LIKE '%...%' directly). On SQLite the substring search goes through an FTS5
+table with the trigram tokenizer, kept in sync by triggers.
+
+Every search runs against a deadline of SEARCH_BUDGET_MS: on Postgres each
+statement gets the remaining budget as its statement_timeout, on SQLite a
+progress handler interrupts it. A step that runs out of time is dropped and
+the results found so far are returned with "complete": false, so the
+endpoint answers within the budget whatever the table size.
+
+    python admin_search.py --benchmark 10000000   # seed users, time queries, clean up
+"""
+import os
+import re
+from time import perf_counter
+from sqlalchemy import select, text, or_, func
+from sqlalchemy.exc import OperationalError
+from database import engine, User, Transaction
+
+SEARCH_BUDGET_MS = int(os.getenv("ADMIN_SEARCH_BUDGET_MS", "200"))
+MAX_RESULTS = 20
+MIN_SUBSTRING = 3  # trigram indexes need at least one full trigram
+
+POSTGRES_INDEXES = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_email_prefix ON users (lower(email) text_pattern_ops)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_email_trgm ON users USING gin (lower(email) gin_trgm_ops)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_name_trgm ON users USING gin (lower(name) gin_trgm_ops)",
+)
+
+SQLITE_FTS = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5("
+    "email, name, content='users', content_rowid='uid', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN "
+    "INSERT INTO users_fts(rowid, email, name) VALUES (new.uid, new.email, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN "
+    "INSERT INTO users_fts(users_fts, rowid, email, name) VALUES ('delete', old.uid, old.email, old.name); END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF email, name ON users BEGIN "
+    "INSERT INTO users_fts(users_fts, rowid, email, name) VALUES ('delete', old.uid, old.email, old.name); "
+    "INSERT INTO users_fts(rowid, email, name) VALUES (new.uid, new.email, new.name); END",
+)
+
+
+def ensure_search_indexes():
+    """Create the search indexes if missing (CONCURRENTLY on Postgres, so writes aren't blocked)."""
+    if engine.dialect.name == "postgresql":
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for statement in POSTGRES_INDEXES:
+                conn.execute(text(statement))
+    elif engine.dialect.name == "sqlite":
+        with engine.begin() as conn:
+            exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'users_fts'")).first()
+            for statement in SQLITE_FTS:
+                conn.execute(text(statement))
+            if not exists:
+                conn.execute(text("INSERT INTO users_fts(users_fts) VALUES ('rebuild')"))
+
+
+def _cancelled(error):
+    # 57014 = query_canceled (statement_timeout); SQLite reports "interrupted"
+    return getattr(error.orig, "pgcode", None) == "57014" or "interrupted" in str(error.orig)
+
+
+def run_within(deadline, statement, params=None):
+    """Execute a read-only statement, giving up at `deadline` (perf_counter); None when out of time."""
+    remaining_ms = int((deadline - perf_counter()) * 1000)
+    if remaining_ms <= 0:
+        return None
+
+    with engine.connect() as conn:
+        raw = None
+        try:
+            if engine.dialect.name == "postgresql":
+                conn.execute(text("SELECT set_config('statement_timeout', :ms, true)"), {"ms": str(remaining_ms)})
+            elif engine.dialect.name == "sqlite":
+                raw = conn.connection.driver_connection
+                raw.set_progress_handler(lambda: perf_counter() > deadline, 1000)
+            rows = conn.execute(statement, params or {}).all()
+            return rows
+        except OperationalError as e:
+            if _cancelled(e):
+                return None
+            raise
+        finally:
+            if raw is not None:
+                raw.set_progress_handler(None, 0)
+            # Read-only: rolling back also ends the SET LOCAL
+            conn.rollback()
+
+
+def _escape_like(value):
+    return re.sub(r"([\\%_])", r"\\\1", value)
+
+
+_USER_COLUMNS = (User.uid, User.name, User.email, User.role, User.points, User.created_at)
+
+
+def _user_substring_query(q, limit):
+    if engine.dialect.name == "sqlite":
+        # FTS5 trigram: a quoted phrase matches as a substring; rank orders by relevance
+        phrase = '"' + q.replace('"', '""') + '"'
+        return (
+            select(*_USER_COLUMNS)
+            .select_from(text("users_fts JOIN users ON users.uid = users_fts.rowid"))
+            .where(text("users_fts MATCH :phrase"))
+            .order_by(text("users_fts.rank"))
+            .limit(limit)
+        ), {"phrase": phrase}
+
+    pattern = f"%{_escape_like(q)}%"
+    condition = or_(func.lower(User.email).like(pattern), func.lower(User.name).like(pattern))
+    if engine.dialect.name == "postgresql":
+        closeness = func.greatest(func.similarity(func.lower(User.email), q), func.similarity(func.lower(User.name), q))
+        return select(*_USER_COLUMNS).where(condition).order_by(closeness.desc()).limit(limit), {}
+    return select(*_USER_COLUMNS).where(condition).limit(limit), {}
+
+
+def _user_row(row):
+    return {
+        "uid": row.uid,
+        "name": row.name,
+        "email": row.email,
+        "role": row.role,
+        "points": row.points,
+        "created_at": row.created_at,
+    }
+
+
+def search_users(q, limit=10, budget_ms=SEARCH_BUDGET_MS):
+    """Typeahead over users; returns {"data", "complete", "elapsed_ms"}."""
+    started = perf_counter()
+    deadline = started + budget_ms / 1000
+    q = q.strip().lower()
+    limit = max(1, min(limit, MAX_RESULTS))
+    found = {}
+    complete = True
+
+    def collect(rows):
+        nonlocal complete
+        if rows is None:
+            complete = False
+            return
+        for row in rows:
+            if len(found) < limit:
+                found.setdefault(row.uid, _user_row(row))
+
+    if q:
+        if q.isdigit():
+            collect(run_within(deadline, select(*_USER_COLUMNS).where(User.uid == int(q))))
+
+        # Email prefix: the cheapest useful step, and usually what support types first
+        collect(run_within(deadline, select(*_USER_COLUMNS).where(
+            func.lower(User.email).like(_escape_like(q) + "%")
+        ).order_by(func.lower(User.email)).limit(limit)))
+
+        if len(found) < limit and len(q) >= MIN_SUBSTRING:
+            statement, params = _user_substring_query(q, limit)
+            rows = run_within(deadline, statement, params)
+            if rows is None and engine.dialect.name == "postgresql":
+                # Ranking every match was too slow (a very common substring): take any matches instead
+                statement = statement.order_by(None)
+                rows = run_within(deadline, statement, params)
+            collect(rows)
+
+    return {"data": list(found.values()), "complete": complete,
+            "elapsed_ms": round((perf_counter() - started) * 1000, 1)}
+
+
+_TRANSACTION_COLUMNS = (
+    Transaction.tid, Transaction.transaction_type, Transaction.status, Transaction.requester_uid,
+    Transaction.receiver_uid, Transaction.points_exchanged, Transaction.created_at
+)
+
+
+def search_transactions(q, limit=10, budget_ms=SEARCH_BUDGET_MS):
+    """Transactions by tid or by user (id, email or name); newest first."""
+    started = perf_counter()
+    deadline = started + budget_ms / 1000
+    q = q.strip()
+    limit = max(1, min(limit, MAX_RESULTS))
+    complete = True
+
+    if q.isdigit():
+        n = int(q)
+        condition = or_(Transaction.tid == n, Transaction.requester_uid == n, Transaction.receiver_uid == n)
+        # An exact tid first, then that user's transactions
+        order = [(Transaction.tid == n).desc(), Transaction.created_at.desc()]
+    else:
+        users = search_users(q, limit=5, budget_ms=budget_ms / 2)
+        complete = users["complete"]
+        uids = [user["uid"] for user in users["data"]]
+        if not uids:
+            return {"data": [], "complete": complete, "elapsed_ms": round((perf_counter() - started) * 1000, 1)}
+        condition = or_(Transaction.requester_uid.in_(uids), Transaction.receiver_uid.in_(uids))
+        order = [Transaction.created_at.desc()]
+
+    rows = run_within(deadline, select(*_TRANSACTION_COLUMNS).where(condition).order_by(*order).limit(limit)) if q else []
+    if rows is None:
+        complete, rows = False, []
+    return {
+        "data": [dict(row._mapping) for row in rows],
+        "complete": complete,
+        "elapsed_ms": round((perf_counter() - started) * 1000, 1),
+    }
+
+
+def benchmark(count, queries=200, seed=5):
+    """Seed `count` users on Postgres, time random typeahead queries, then remove them."""
+    import random
+
+    if engine.dialect.name != "postgresql":
+        print("the benchmark seeds with generate_series and needs Postgres")
+        return
+
+    ensure_search_indexes()
+    print(f"seeding {count:,} users ...")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO users (name, email, password, role, points, created_at) "
+            "SELECT 'Bench ' || (ARRAY['Asha','Ravi','Meera','Kiran','Dev','Isha','Arjun','Tara'])[1 + g % 8] "
+            "|| ' ' || g, 'bench' || g || '@search-bench' || (g % 97) || '.example', 'x', 'user', 0, now() "
+            "FROM generate_series(1, :count) AS g"
+        ), {"count": count})
+        conn.execute(text("ANALYZE users"))
+
+    rng = random.Random(seed)
+    samples = []
+    for _ in range(queries):
+        n = rng.randint(1, count)
+        samples.append(rng.choice([
+            f"bench{n}",                  # email prefix
+            f"{n}@search",                # email substring
+            f"meera {n}"[:rng.randint(4, 12)],  # name substring
+            "search-bench",               # matches everyone
+            "zzqx",                       # matches no one
+        ]))
+
+    try:
+        timings, partial = [], 0
+        for q in samples:
+            result = search_users(q)
+            timings.append(result["elapsed_ms"])
+            partial += not result["complete"]
+        timings.sort()
+        p50 = timings[len(timings) // 2]
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        print(f"{queries} queries on {count:,} extra users, budget {SEARCH_BUDGET_MS} ms: "
+              f"p50 {p50:.1f} ms, p99 {p99:.1f} ms, max {timings[-1]:.1f} ms, {partial} partial")
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM users WHERE email LIKE 'bench%@search-bench%.example'"))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Admin search tools")
+    parser.add_argument("--create-indexes", action="store_true")
+    parser.add_argument("--benchmark", type=int, metavar="USERS")
+    args = parser.parse_args()
+
+    if args.create_indexes:
+        ensure_search_indexes()
+        print("search indexes ready")
+    if args.benchmark:
+        benchmark(args.benchmark)
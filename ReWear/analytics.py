@@ -0,0 +1,351 @@
+"""Daily analytics rollups for the admin dashboard.
+
+Three rollup tables, one row per day and key (see database.py):
+
+  daily_transaction_stats  completed swaps and redemptions, points exchanged
+  daily_point_stats        ledger entries, points minted and burned per
+                           point_transactions.transaction_type
+  daily_category_flow      completed transactions by the category the
+                           requester gave ('points' for a redemption) and
+                           the category they received
+
+The dashboard reads only these, so its cost depends on the number of days
+shown, not on the size of transactions / point_transactions.
+
+refresh() keeps them current. Each rollup has a high-water mark in
+rollup_watermarks on its time column: created_at for the ledger, completed_at
+for transactions (they are counted when they complete). A refresh recomputes
+every day from the mark's day onwards with one INSERT ... SELECT ... GROUP BY
+over the indexed range and replaces those days' rows in the same
+transaction, then moves the mark to now - SETTLE_SECONDS. Recomputing whole
+days makes a refresh safe to repeat and picks up rows that were committed a
+little after their timestamp. On Postgres an advisory lock keeps refreshes
+from overlapping.
+
+backfill() builds the history once, without a GROUP BY over every row: it
+streams the rows before today by primary key in chunks, aggregates each
+chunk with NumPy (days as datetime64[D], keys factorized, sums with
+np.bincount), writes all days before today and sets the marks to midnight
+for refresh() to continue from.
+
+    python analytics.py backfill
+    python analytics.py refresh [--every 60]
+    python analytics.py show [--days 30]
+    python analytics.py benchmark [--days 30]   # rollup reads vs aggregating the raw tables
+"""
+import os
+from datetime import datetime, timedelta, time as day_start
+from time import perf_counter, sleep
+from sqlalchemy import select, insert, delete, func, case, literal_column
+from sqlalchemy.orm import aliased
+from database import (
+    engine,
+    Transaction,
+    PointTransaction,
+    Product,
+    DailyTransactionStats,
+    DailyPointStats,
+    DailyCategoryFlow,
+    RollupWatermark,
+)
+
+SETTLE_SECONDS = int(os.getenv("ROLLUP_SETTLE_SECONDS", "60"))
+REFRESH_INTERVAL = float(os.getenv("ROLLUP_REFRESH_INTERVAL", "60"))
+BACKFILL_CHUNK = 200000
+INSERT_CHUNK = 5000
+DASHBOARD_MAX_DAYS = 366
+ADVISORY_LOCK_KEY = 48_150_001  # pg_try_advisory_xact_lock key for refresh()
+
+GivenProduct = aliased(Product)
+ReceivedProduct = aliased(Product)
+GIVEN_CATEGORY = case(
+    (Transaction.transaction_type == literal_column("'redemption'"), literal_column("'points'")),
+    else_=func.coalesce(GivenProduct.category, literal_column("'unknown'"))
+)
+RECEIVED_CATEGORY = func.coalesce(ReceivedProduct.category, literal_column("'unknown'"))
+
+
+# Aggregates over the raw tables from `since`, in the rollup tables' column order
+def transaction_stats(since):
+    day = func.date(Transaction.completed_at)
+    return (
+        select(day.label("day"), Transaction.transaction_type, func.count(),
+               func.coalesce(func.sum(Transaction.points_exchanged), 0))
+        .where(Transaction.status == "completed", Transaction.completed_at >= since)
+        .group_by(day, Transaction.transaction_type)
+    )
+
+
+def point_stats(since):
+    day = func.date(PointTransaction.created_at)
+    return (
+        select(
+            day.label("day"), PointTransaction.transaction_type, func.count(),
+            func.coalesce(func.sum(case((PointTransaction.amount > 0, PointTransaction.amount), else_=0)), 0),
+            func.coalesce(func.sum(case((PointTransaction.amount < 0, -PointTransaction.amount), else_=0)), 0),
+        )
+        .where(PointTransaction.created_at >= since)
+        .group_by(day, PointTransaction.transaction_type)
+    )
+
+
+def category_flow(since):
+    day = func.date(Transaction.completed_at)
+    return (
+        select(day.label("day"), Transaction.transaction_type, GIVEN_CATEGORY.label("given_category"),
+               RECEIVED_CATEGORY.label("received_category"), func.count())
+        .select_from(Transaction)
+        .outerjoin(GivenProduct, GivenProduct.pid == Transaction.requester_pid)
+        .outerjoin(ReceivedProduct, ReceivedProduct.pid == Transaction.receiver_pid)
+        .where(Transaction.status == "completed", Transaction.completed_at >= since)
+        .group_by(day, Transaction.transaction_type, GIVEN_CATEGORY, RECEIVED_CATEGORY)
+    )
+
+
+# name -> (rollup table, its columns in aggregate order, aggregate)
+ROLLUPS = {
+    "transactions": (DailyTransactionStats, ["day", "transaction_type", "completed", "points_exchanged"],
+                     transaction_stats),
+    "points": (DailyPointStats, ["day", "transaction_type", "entries", "minted", "burned"], point_stats),
+    "category_flow": (DailyCategoryFlow, ["day", "transaction_type", "given_category", "received_category",
+                                          "transactions"], category_flow),
+}
+EPOCH = datetime(2000, 1, 1)
+
+
+def _set_watermark(conn, name, high_water):
+    conn.execute(delete(RollupWatermark).where(RollupWatermark.name == name))
+    conn.execute(insert(RollupWatermark).values(name=name, high_water=high_water, refreshed_at=datetime.utcnow()))
+
+
+def refresh(now=None):
+    """Bring every rollup up to now - SETTLE_SECONDS; returns rows written per rollup (None if one is running)."""
+    until = (now or datetime.utcnow()) - timedelta(seconds=SETTLE_SECONDS)
+    written = {}
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql" and \
+                not conn.execute(select(func.pg_try_advisory_xact_lock(ADVISORY_LOCK_KEY))).scalar():
+            return None
+        marks = dict(conn.execute(select(RollupWatermark.name, RollupWatermark.high_water)).all())
+        for name, (table, columns, aggregate) in ROLLUPS.items():
+            # Whole days from the mark's day: repeatable, and late commits land in a recomputed day
+            since = datetime.combine(marks.get(name, EPOCH).date(), day_start.min)
+            conn.execute(delete(table).where(table.day >= since.date()))
+            result = conn.execute(insert(table).from_select(columns, aggregate(since)))
+            written[name] = result.rowcount
+            _set_watermark(conn, name, until)
+    return written
+
+
+# Backfill
+def _group_sums(keys, sums):
+    """Totals of each array in `sums` per distinct combination of the `keys` arrays: {key tuple: [totals]}."""
+    import numpy as np
+
+    uniques, codes = [], []
+    for key in keys:
+        unique, code = np.unique(key, return_inverse=True)
+        uniques.append(unique)
+        codes.append(code.reshape(-1))
+    shape = tuple(len(unique) for unique in uniques)
+    groups, inverse = np.unique(np.ravel_multi_index(codes, shape), return_inverse=True)
+    inverse = inverse.reshape(-1)
+    totals = [np.bincount(inverse, weights=values, minlength=len(groups)).astype(np.int64) for values in sums]
+    positions = np.unravel_index(groups, shape)
+    return {
+        tuple(unique[position].item() for unique, position in zip(uniques, key_positions)):
+            [int(total[g]) for total in totals]
+        for g, key_positions in enumerate(zip(*[p.tolist() for p in positions]))
+    }
+
+
+def _merge(into, chunk_totals):
+    for key, totals in chunk_totals.items():
+        existing = into.get(key)
+        if existing is None:
+            into[key] = totals
+        else:
+            for i, total in enumerate(totals):
+                existing[i] += total
+
+
+def _chunks(statement, key_column, chunk_size):
+    """Rows of `statement` in primary-key order, `chunk_size` at a time (keyset pagination)."""
+    last = 0
+    while True:
+        with engine.connect() as conn:
+            rows = conn.execute(statement.where(key_column > last).order_by(key_column).limit(chunk_size)).all()
+        if not rows:
+            return
+        last = rows[-1][0]
+        yield rows
+
+
+def _days(timestamps):
+    import numpy as np
+
+    return np.array(timestamps, dtype="datetime64[us]").astype("datetime64[D]")
+
+
+def backfill(chunk_size=BACKFILL_CHUNK):
+    """Rebuild every day before today from the raw tables; returns rows scanned per source."""
+    import numpy as np
+
+    cutoff = datetime.combine(datetime.utcnow().date(), day_start.min)
+    rollups = {name: {} for name in ROLLUPS}
+    scanned = {"point_transactions": 0, "transactions": 0}
+
+    ledger = select(PointTransaction.transaction_id, PointTransaction.created_at, PointTransaction.transaction_type,
+                    PointTransaction.amount).where(PointTransaction.created_at < cutoff)
+    for rows in _chunks(ledger, PointTransaction.transaction_id, chunk_size):
+        scanned["point_transactions"] += len(rows)
+        _, created, types, amounts = zip(*rows)
+        amounts = np.asarray(amounts, dtype=np.int64)
+        _merge(rollups["points"], _group_sums(
+            [_days(created), np.asarray(types, dtype=str)],
+            [np.ones(len(rows)), np.maximum(amounts, 0), np.maximum(-amounts, 0)]
+        ))
+
+    completed = (
+        select(Transaction.tid, Transaction.completed_at, Transaction.transaction_type, Transaction.points_exchanged,
+               GIVEN_CATEGORY, RECEIVED_CATEGORY)
+        .select_from(Transaction)
+        .outerjoin(GivenProduct, GivenProduct.pid == Transaction.requester_pid)
+        .outerjoin(ReceivedProduct, ReceivedProduct.pid == Transaction.receiver_pid)
+        .where(Transaction.status == "completed", Transaction.completed_at < cutoff)
+    )
+    for rows in _chunks(completed, Transaction.tid, chunk_size):
+        scanned["transactions"] += len(rows)
+        _, completed_at, types, points, given, received = zip(*rows)
+        days, types = _days(completed_at), np.asarray(types, dtype=str)
+        ones = np.ones(len(rows))
+        _merge(rollups["transactions"], _group_sums(
+            [days, types], [ones, np.asarray([p or 0 for p in points], dtype=np.int64)]
+        ))
+        _merge(rollups["category_flow"], _group_sums(
+            [days, types, np.asarray(given, dtype=str), np.asarray(received, dtype=str)], [ones]
+        ))
+
+    with engine.begin() as conn:
+        for name, (table, columns, _) in ROLLUPS.items():
+            conn.execute(delete(table).where(table.day < cutoff.date()))
+            rows = [dict(zip(columns, key + tuple(totals))) for key, totals in rollups[name].items()]
+            for start in range(0, len(rows), INSERT_CHUNK):
+                conn.execute(insert(table), rows[start:start + INSERT_CHUNK])
+            # refresh() recomputes today and continues from midnight
+            _set_watermark(conn, name, cutoff)
+    return scanned
+
+
+# Dashboard
+def dashboard(days=30):
+    """The last `days` days from the rollups only."""
+    days = max(1, min(days, DASHBOARD_MAX_DAYS))
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    with engine.connect() as conn:
+        transactions = conn.execute(
+            select(DailyTransactionStats.day, DailyTransactionStats.transaction_type,
+                   DailyTransactionStats.completed, DailyTransactionStats.points_exchanged)
+            .where(DailyTransactionStats.day >= since)
+            .order_by(DailyTransactionStats.day, DailyTransactionStats.transaction_type)
+        ).all()
+        points = conn.execute(
+            select(DailyPointStats.day, DailyPointStats.transaction_type, DailyPointStats.entries,
+                   DailyPointStats.minted, DailyPointStats.burned)
+            .where(DailyPointStats.day >= since)
+            .order_by(DailyPointStats.day, DailyPointStats.transaction_type)
+        ).all()
+        flow = conn.execute(
+            select(DailyCategoryFlow.transaction_type, DailyCategoryFlow.given_category,
+                   DailyCategoryFlow.received_category, func.sum(DailyCategoryFlow.transactions))
+            .where(DailyCategoryFlow.day >= since)
+            .group_by(DailyCategoryFlow.transaction_type, DailyCategoryFlow.given_category,
+                      DailyCategoryFlow.received_category)
+        ).all()
+        as_of = conn.execute(select(func.min(RollupWatermark.high_water))).scalar()
+
+    return {
+        "since": since.isoformat(),
+        "as_of": as_of.isoformat() if as_of else None,
+        "transactions": [
+            {"day": str(day), "type": kind, "completed": completed, "points_exchanged": exchanged}
+            for day, kind, completed, exchanged in transactions
+        ],
+        "points": [
+            {"day": str(day), "type": kind, "entries": entries, "minted": minted, "burned": burned}
+            for day, kind, entries, minted, burned in points
+        ],
+        "category_flow": sorted(
+            ({"type": kind, "given": given, "received": received, "transactions": int(count)}
+             for kind, given, received, count in flow),
+            key=lambda entry: -entry["transactions"]
+        ),
+    }
+
+
+def benchmark(days=30):
+    """The dashboard from the rollups against the same numbers aggregated from the raw tables."""
+    started = perf_counter()
+    dashboard(days)
+    from_rollups = perf_counter() - started
+
+    since = datetime.combine(datetime.utcnow().date() - timedelta(days=days - 1), day_start.min)
+    started = perf_counter()
+    with engine.connect() as conn:
+        for _, _, aggregate in ROLLUPS.values():
+            conn.execute(aggregate(since)).all()
+    from_raw = perf_counter() - started
+
+    with engine.connect() as conn:
+        history = conn.execute(select(func.count()).select_from(PointTransaction)).scalar() + \
+            conn.execute(select(func.count()).select_from(Transaction)).scalar()
+    print(f"{days} days, {history} raw rows: rollups {from_rollups * 1000:.1f} ms, "
+          f"raw aggregation {from_raw * 1000:.1f} ms")
+
+
+def run_refresher(interval=REFRESH_INTERVAL):
+    while True:
+        try:
+            written = refresh()
+            if written is None:
+                print("Another refresh is running")
+            else:
+                print(f"[{datetime.now():%H:%M:%S}] refreshed rollups: "
+                      + ", ".join(f"{name} {rows}" for name, rows in written.items()))
+        except Exception as e:
+            print(f"Error refreshing rollups: {e}")
+        sleep(interval)
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Analytics rollups")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("backfill", help="rebuild every day before today from the raw tables")
+    run = commands.add_parser("refresh", help="bring the rollups up to date")
+    run.add_argument("--every", type=float, metavar="SECONDS", help="keep refreshing at this interval")
+    show = commands.add_parser("show", help="print the dashboard data")
+    show.add_argument("--days", type=int, default=30)
+    bench = commands.add_parser("benchmark", help="rollup reads vs raw aggregation")
+    bench.add_argument("--days", type=int, default=30)
+    args = parser.parse_args()
+
+    try:
+        if args.command == "backfill":
+            started = perf_counter()
+            scanned = backfill()
+            print(f"Backfilled from {scanned['point_transactions']} ledger entries and "
+                  f"{scanned['transactions']} transactions in {perf_counter() - started:.1f}s")
+        elif args.command == "refresh":
+            if args.every:
+                run_refresher(args.every)
+            else:
+                print(refresh())
+        elif args.command == "show":
+            print(json.dumps(dashboard(args.days), indent=2))
+        else:
+            benchmark(args.days)
+    except Exception as e:
+        print(f"Error: {e}")
@@ -0,0 +1,264 @@
+import base64
+import json
+from datetime import datetime
+from flask import Blueprint, request, session, make_response
+from database import (
+    get_product,
+    get_products_by_ids,
+    get_available_products_page,
+    get_user_products,
+    get_user_transactions,
+    get_user_notifications,
+    get_unread_count,
+    create_saved_search,
+    delete_saved_search,
+    get_user_saved_searches,
+    BASE_POINTS,
+    CONDITION_MULTIPLIERS,
+)
+
+from read_models import trending_products, category_facets
+from counters import decayed_score
+from saved_searches import register_saved_search, index as saved_search_index
+
+try:
+    import orjson
+except ImportError:  # plain json works, just slower
+    orjson = None
+
+
+api_v1 = Blueprint("api_v1", __name__, url_prefix="/api/v1")
+
+MAX_BATCH_SIZE = 100
+MAX_PAGE_SIZE = 100
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def dumps(payload):
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, default=_json_default, separators=(",", ":")).encode()
+
+
+def json_response(payload, status=200):
+    """Serialize payload and answer If-None-Match with a 304 when the ETag matches."""
+    response = make_response(dumps(payload), status)
+    response.mimetype = "application/json"
+    if status == 200:
+        response.add_etag()
+        response.make_conditional(request)
+    return response
+
+
+def error_response(message, status):
+    return json_response({"error": message}, status)
+
+
+def requested_fields():
+    """Parse ?fields=a,b,c into a set, or None when every field is wanted."""
+    raw = request.args.get("fields")
+    if not raw:
+        return None
+    return {field.strip() for field in raw.split(",") if field.strip()}
+
+
+def select_fields(row, fields):
+    if fields is None:
+        return row
+    return {key: value for key, value in row.items() if key in fields}
+
+
+def parse_ids(raw):
+    try:
+        ids = [int(part) for part in raw.split(",") if part.strip()]
+    except ValueError:
+        return None
+    # Drop duplicates but keep the caller's order
+    return list(dict.fromkeys(ids))
+
+
+def page_size():
+    try:
+        limit = int(request.args.get("limit", 20))
+    except ValueError:
+        return 20
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def encode_cursor(after):
+    created_at, pid = after
+    raw = f"{created_at.isoformat()}|{pid}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, pid = base64.urlsafe_b64decode(padded).decode().split("|")
+        return datetime.fromisoformat(created_at), int(pid)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def current_uid():
+    return session.get("uid")
+
+
+@api_v1.after_request
+def private_responses(response):
+    # /me/* is per-user data behind the session cookie: no shared cache may store or reuse it
+    if request.path.startswith(f"{api_v1.url_prefix}/me/"):
+        response.headers["Cache-Control"] = "private, no-cache"
+        response.vary.add("Cookie")
+    return response
+
+
+@api_v1.route("/products")
+def products():
+    fields = requested_fields()
+
+    # Batch fetch: /api/v1/products?ids=1,2,3
+    if "ids" in request.args:
+        ids = parse_ids(request.args["ids"])
+        if ids is None:
+            return error_response("ids must be a comma separated list of integers", 400)
+        if len(ids) > MAX_BATCH_SIZE:
+            return error_response(f"At most {MAX_BATCH_SIZE} ids per request", 400)
+
+        rows = get_products_by_ids(ids)
+        found = {row["pid"] for row in rows}
+        return json_response({
+            "data": [select_fields(row, fields) for row in rows],
+            "missing": [pid for pid in ids if pid not in found]
+        })
+
+    # Listing with cursor pagination
+    after = None
+    cursor = request.args.get("cursor")
+    if cursor:
+        after = decode_cursor(cursor)
+        if after is None:
+            return error_response("Invalid cursor", 400)
+
+    rows, next_after = get_available_products_page(
+        limit=page_size(),
+        after=after,
+        category=request.args.get("category")
+    )
+    return json_response({
+        "data": [select_fields(row, fields) for row in rows],
+        "next_cursor": encode_cursor(next_after) if next_after else None
+    })
+
+
+@api_v1.route("/products/trending")
+def trending():
+    fields = requested_fields()
+    rows = []
+    for record in trending_products(page_size()):
+        row = record._asdict()
+        row["trending_score"] = round(decayed_score(record.trending_score), 3)
+        rows.append(select_fields(row, fields))
+    return json_response({"data": rows})
+
+
+@api_v1.route("/products/facets")
+def facets():
+    response = json_response({"data": category_facets()})
+    response.headers["Cache-Control"] = "public, max-age=30"
+    return response
+
+
+@api_v1.route("/products/<int:pid>")
+def product(pid):
+    row = get_product(pid)
+    if not row:
+        return error_response("Product not found", 404)
+    return json_response({"data": select_fields(row, requested_fields())})
+
+
+@api_v1.route("/me/products")
+def my_products():
+    uid = current_uid()
+    if not uid:
+        return error_response("Login required", 401)
+    fields = requested_fields()
+    return json_response({"data": [select_fields(row, fields) for row in get_user_products(uid)]})
+
+
+@api_v1.route("/me/transactions")
+def my_transactions():
+    uid = current_uid()
+    if not uid:
+        return error_response("Login required", 401)
+    fields = requested_fields()
+    return json_response({"data": [select_fields(row, fields) for row in get_user_transactions(uid)]})
+
+
+@api_v1.route("/me/notifications")
+def my_notifications():
+    uid = current_uid()
+    if not uid:
+        return error_response("Login required", 401)
+
+    before = None
+    cursor = request.args.get("cursor")
+    if cursor:
+        before = decode_cursor(cursor)
+        if before is None:
+            return error_response("Invalid cursor", 400)
+
+    limit = page_size()
+    rows = get_user_notifications(uid, limit=limit, before=before)
+
+    fields = requested_fields()
+    last = rows[-1] if len(rows) == limit else None
+    return json_response({
+        "data": [select_fields(row, fields) for row in rows],
+        "unread_count": get_unread_count(uid),
+        "next_cursor": encode_cursor((last["created_at"], last["notification_id"])) if last else None
+    })
+
+
+@api_v1.route("/me/saved-searches", methods=["GET", "POST"])
+def my_saved_searches():
+    uid = current_uid()
+    if not uid:
+        return error_response("Login required", 401)
+
+    if request.method == "GET":
+        return json_response({"data": get_user_saved_searches(uid)})
+
+    body = request.get_json(silent=True) or {}
+    criteria = {field: body.get(field) or None for field in ("category", "size", "condition")}
+    if criteria["category"] is not None and criteria["category"] not in BASE_POINTS:
+        return error_response(f"category must be one of {', '.join(BASE_POINTS)}", 400)
+    if criteria["condition"] is not None and criteria["condition"] not in CONDITION_MULTIPLIERS:
+        return error_response(f"condition must be one of {', '.join(CONDITION_MULTIPLIERS)}", 400)
+    max_points = body.get("max_points")
+    if max_points is not None and (not isinstance(max_points, int) or max_points < 0):
+        return error_response("max_points must be a non-negative integer", 400)
+    if not any(criteria.values()) and max_points is None:
+        return error_response("At least one criterion is required", 400)
+
+    search_id = create_saved_search(uid, max_points=max_points, **criteria)
+    if search_id is None:
+        return error_response("Could not save search", 500)
+    register_saved_search(search_id, max_points=max_points, **criteria)
+    return json_response({"data": {"search_id": search_id, "max_points": max_points, **criteria}}, 201)
+
+
+@api_v1.route("/me/saved-searches/<int:search_id>", methods=["DELETE"])
+def delete_my_saved_search(search_id):
+    uid = current_uid()
+    if not uid:
+        return error_response("Login required", 401)
+    if not delete_saved_search(search_id, uid):
+        return error_response("Saved search not found", 404)
+    saved_search_index.forget([search_id])
+    return json_response({"deleted": search_id})
@@ -1,24 +1,59 @@
 from datetime import datetime
 import bcrypt
-from flask import Flask, render_template, request, redirect, flash, url_for, session, flash, abort
-from database import Transaction, create_user, get_user_by_email, SessionLocal, User, get_available_products,SessionLocal, User, Product
+from flask import Flask, render_template, request, redirect, flash, url_for, session, flash, abort, jsonify, Response, make_response
+from database import Transaction, create_user, get_user_by_email, SessionLocal, User, get_available_products,SessionLocal, User, Product, create_product
+import io
 import os
 import secrets
 import smtplib
 from email.message import EmailMessage
 from dotenv import load_dotenv
 from functools import wraps
-from sqlalchemy.orm import joinedload
+from time import perf_counter
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload, selectinload
+from api import api_v1
+from assets import init_assets
+from images import init_images, save_product_image, UploadError, MAX_IMAGES_PER_PRODUCT
+from http_cache import conditional_page, product_validator, catalog_validator
+from notifications import notifications_bp
+from moderation import bulk_moderate, ACTIONS as MODERATION_ACTIONS
+from bulk_import import import_listings
+from exports import EXPORTS, FORMATS as EXPORT_FORMATS, iter_export, gzip_stream, export_filename
+from read_models import iter_order_history
+from counters import record_product_view, record_login
+from saved_searches import load_saved_searches
+from autocomplete import suggest_bp, load_suggestions, syncer as suggestion_syncer
+from duplicates import get_open_flags
+from admin_search import search_users, search_transactions
+from analytics import dashboard as analytics_dashboard
+from profiling import init_profiling, toggles as profiling_toggles
+from overload import init_overload
+from streaming import init_compression, stream_page
+import outbox
 
 load_dotenv()
 
 app = Flask(__name__)
 app.secret_key = os.getenv("SECRET_KEY", "supersecret")
+app.register_blueprint(api_v1)
+app.register_blueprint(notifications_bp)
+app.register_blueprint(suggest_bp)
+init_overload(app)
+init_assets(app)
+init_images(app)
+init_compression(app)
 
 # === Email sender ===
 EMAIL_USER = os.getenv("EMAIL_USER")
 EMAIL_PASS = os.getenv("EMAIL_PASS")
 
+# Users and transactions listed on the admin panel before searching
+ADMIN_RECENT_LIMIT = 50
+# Listings read (and checked for duplicate flags) per fetch while the admin panel streams
+ADMIN_LISTINGS_BATCH = 200
+
 
 def send_recovery_email(to_email, code):
     msg = EmailMessage()
@@ -48,6 +83,19 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def current_user_is_admin():
+    uid = session.get("uid")
+    if not uid:
+        return False
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter_by(uid=uid).first()
+        return bool(user and user.role == "admin")
+    finally:
+        db.close()
+
+init_profiling(app, is_admin=current_user_is_admin)
+
 
 def login_required(f):
     @wraps(f)
@@ -63,6 +111,17 @@ def login_required(f):
 def index():
     return render_template("index.html")  # Show about, login, signup buttons
 
+def admin_listings(db):
+    """(product, open duplicate flags) for every listing, a batch at a time, for the streamed admin panel."""
+    products = db.execute(
+        select(Product).options(selectinload(Product.images)).order_by(Product.pid)
+        .execution_options(yield_per=ADMIN_LISTINGS_BATCH)
+    ).scalars()
+    for batch in products.partitions():
+        flags = get_open_flags([product.pid for product in batch if product.status == "pending"])
+        for product in batch:
+            yield product, flags.get(product.pid, [])
+
 @app.route("/admin")
 @login_required
 def admin_panel():
@@ -70,21 +129,120 @@ def admin_panel():
     
     current_user = db.query(User).filter(User.uid == session["uid"]).first()
     if not current_user or current_user.role != "admin":
+        db.close()
         flash("Access denied: Admins only", "danger")
         return redirect(url_for("landing_page"))
 
-    users = db.query(User).all()
-    transactions = db.query(Transaction).all()
-    products = db.query(Product).options(joinedload(Product.images)).all()
+    # Only the newest rows; anything older is found through the search boxes
+    users = db.query(User).order_by(User.uid.desc()).limit(ADMIN_RECENT_LIMIT).all()
+    transactions = db.query(Transaction).order_by(Transaction.tid.desc()).limit(ADMIN_RECENT_LIMIT).all()
 
-    return render_template("admin_panel.html", 
+    # Listings are read while the page streams; the session lives until the response is closed
+    response = stream_page("admin_panel.html",
                            users=users,
                            transactions=transactions,
-                           products=products,
+                           listings=admin_listings(db),
                            current_user=current_user)
+    response.call_on_close(db.close)
+    return response
+
+@app.route("/admin/search/users")
+@admin_required
+def admin_search_users():
+    return jsonify(search_users(request.args.get("q", ""), request.args.get("limit", 10, type=int)))
+
+@app.route("/admin/search/transactions")
+@admin_required
+def admin_search_transactions():
+    return jsonify(search_transactions(request.args.get("q", ""), request.args.get("limit", 10, type=int)))
+
+@app.route("/admin/analytics")
+@admin_required
+def admin_analytics():
+    """Daily swaps, redemptions, points and category flow, read from the rollups (analytics.py)."""
+    return jsonify(analytics_dashboard(request.args.get("days", 30, type=int)))
+
+@app.route("/admin/profiling", methods=["GET", "POST"])
+@admin_required
+def admin_profiling():
+    """Per-endpoint profiling rates; POST {"endpoint": ..., "rate": 0..1} (0 switches it off)."""
+    if request.method == "POST":
+        payload = request.get_json(silent=True) or {}
+        endpoint = payload.get("endpoint")
+        if endpoint not in app.view_functions:
+            return jsonify({"error": "unknown endpoint"}), 400
+        try:
+            rate = float(payload.get("rate", 1.0))
+        except (TypeError, ValueError):
+            return jsonify({"error": "rate must be a number between 0 and 1"}), 400
+        if not 0 <= rate <= 1:
+            return jsonify({"error": "rate must be a number between 0 and 1"}), 400
+        profiling_toggles.set(endpoint, rate)
+    return jsonify({"data": profiling_toggles.all()})
+
+@app.route("/admin/products/moderate", methods=["POST"])
+@admin_required
+def moderate_products():
+    payload = request.get_json(silent=True) or {}
+    pids = payload.get("pids")
+    action = payload.get("action")
+
+    if action not in MODERATION_ACTIONS:
+        return jsonify({"error": f"action must be one of {', '.join(MODERATION_ACTIONS)}"}), 400
+    if not isinstance(pids, list) or not pids:
+        return jsonify({"error": "pids must be a non-empty list"}), 400
+    try:
+        pids = [int(pid) for pid in pids]
+    except (TypeError, ValueError):
+        return jsonify({"error": "pids must be integers"}), 400
+
+    outcomes = bulk_moderate(pids, action)
+    summary = {}
+    for outcome in outcomes.values():
+        summary[outcome] = summary.get(outcome, 0) + 1
+    return jsonify({
+        "summary": summary,
+        "results": [{"pid": pid, "outcome": outcome} for pid, outcome in outcomes.items()]
+    })
+
+@app.route("/admin/products/import", methods=["POST"])
+@admin_required
+def import_products():
+    upload = request.files.get("file")
+    if not upload or not upload.filename:
+        return jsonify({"error": "Upload a CSV or JSONL file as 'file'"}), 400
+
+    fmt = request.form.get("format") or ("jsonl" if upload.filename.endswith((".jsonl", ".ndjson")) else "csv")
+    if fmt not in ("csv", "jsonl"):
+        return jsonify({"error": "format must be csv or jsonl"}), 400
+
+    # Parse straight from the spooled upload, chunk by chunk
+    stream = io.TextIOWrapper(upload.stream, encoding="utf-8", newline="")
+    report = import_listings(stream, fmt, default_uid=request.form.get("uid", type=int))
+    report.pop("pids")
+    return jsonify(report)
+
+@app.route("/admin/export/<name>.<fmt>")
+@admin_required
+def export_table(name, fmt):
+    if name not in EXPORTS or fmt not in EXPORT_FORMATS:
+        abort(404)
+
+    gzipped = request.args.get("gzip") in ("1", "true", "yes")
+    chunks = iter_export(name, fmt)
+    if gzipped:
+        chunks = gzip_stream(chunks)
+
+    mimetype = "application/gzip" if gzipped else ("text/csv" if fmt == "csv" else "application/x-ndjson")
+    return Response(chunks, mimetype=mimetype, headers={
+        "Content-Disposition": f"attachment; filename={export_filename(name, fmt, gzipped)}",
+        "Cache-Control": "no-store",
+        "X-Accel-Buffering": "no"
+    })
 
 @app.route("/home")
 @login_required
+@conditional_page(catalog_validator)
 def landing_page():
     now = datetime.now()
     db = SessionLocal()
@@ -99,7 +257,19 @@ def landing_page():
         now=now
     )
 
+def count_product_view(f):
+    """Count the view for full renders and 304 revalidations alike (not for missing products)."""
+    @wraps(f)
+    def decorated_function(pid):
+        response = make_response(f(pid=pid))
+        if response.status_code in (200, 304):
+            record_product_view(pid)
+        return response
+    return decorated_function
+
 @app.route("/product/<int:pid>")
+@count_product_view
+@conditional_page(product_validator)
 def product_detail(pid):
     db = SessionLocal()
     product = db.query(Product).filter(Product.pid == pid).first()
@@ -109,43 +279,51 @@ def product_detail(pid):
     now = datetime.now()
     return render_template("product_detail.html", product=product, images=images, now = now)
 
+@app.route("/add-product", methods=["GET", "POST"])
+@login_required
+def add_product():
+    if request.method == "POST":
+        uploads = [f for f in request.files.getlist("images") if f and f.filename]
+        if not uploads:
+            flash("Please upload at least one image.", "danger")
+            return render_template("add_product.html")
+        if len(uploads) > MAX_IMAGES_PER_PRODUCT:
+            flash(f"You can upload at most {MAX_IMAGES_PER_PRODUCT} images.", "danger")
+            return render_template("add_product.html")
+
+        pid = create_product(session["uid"], {
+            "title": request.form["title"],
+            "description": request.form["description"],
+            "category": request.form["category"],
+            "subcategory": request.form["subcategory"],
+            "size": request.form["size"],
+            "condition": request.form["condition"]
+        })
+        if not pid:
+            flash("Could not create the product, please try again.", "danger")
+            return render_template("add_product.html")
+
+        # The first image is the primary one; thumbnails are rendered in the background
+        for position, upload in enumerate(uploads):
+            try:
+                save_product_image(pid, upload, is_primary=(position == 0))
+            except UploadError as e:
+                flash(f"{upload.filename}: {e}", "warning")
+
+        flash("Product submitted for approval!", "success")
+        return redirect(url_for("product_detail", pid=pid))
+    return render_template("add_product.html")
+
 @app.route("/my-orders")
 @login_required
 def my_orders():
-    db = SessionLocal()
     uid = session.get("uid")
 
-    # All swaps involving the current user
-    all_swaps = db.query(Transaction).filter(
-        (Transaction.requester.has(uid=uid)) |
-        (Transaction.receiver.has(uid=uid))
-    ).order_by(Transaction.created_at.desc()).all()
-
-    # Sent swaps (where user is requester)
-    sent_swaps = db.query(Transaction).filter(
-        Transaction.requester.has(uid=uid)
-    ).order_by(Transaction.created_at.desc()).all()
-
-    # Received swaps (where user is receiver)
-    received_swaps = db.query(Transaction).filter(
-        Transaction.receiver.has(uid=uid)
-    ).order_by(Transaction.created_at.desc()).all()
-
-    # Completed swaps (status = 'completed')
-    completed_swaps = db.query(Transaction).filter(
-        ((Transaction.requester.has(uid=uid)) | (Transaction.receiver.has(uid=uid))) &
-        (Transaction.status == 'completed')
-    ).order_by(Transaction.created_at.desc()).all()
-
-    now = datetime.now()
-
-    return render_template(
+    # One index range scan on transaction_summaries, read batch by batch as the page streams
+    return stream_page(
         "my_orders.html",
-        all_swaps=all_swaps,
-        sent_swaps=sent_swaps,
-        received_swaps=received_swaps,
-        completed_swaps=completed_swaps,
-        now=now
+        all_swaps=iter_order_history(uid),
+        now=datetime.now()
     )
 
 
@@ -175,6 +353,7 @@ def login():
         if user and bcrypt.checkpw(password.encode(), user["password"].encode()):
             session["uid"] = user["uid"]
             session["name"] = user["name"]
+            record_login(user["uid"])
             return redirect("/home")
         else:
             flash("Invalid email or password!")
@@ -263,6 +442,86 @@ def logout():
     session.clear()
     return redirect("/")
 
+def precompile_templates(flask_app):
+    """Compile every template into the Jinja cache; returns (count, seconds)."""
+    started = perf_counter()
+    names = flask_app.jinja_env.list_templates()
+    for name in names:
+        flask_app.jinja_env.get_template(name)
+    return len(names), perf_counter() - started
+
+
+def track_first_request(flask_app):
+    """Log how long the first request of each worker process takes."""
+    reported = {"pid": None}
+
+    @flask_app.before_request
+    def start_first_request_timer():
+        if reported["pid"] != os.getpid():
+            request.environ["rewear.started"] = perf_counter()
+
+    @flask_app.after_request
+    def report_first_request(response):
+        started = request.environ.get("rewear.started")
+        if started is not None and reported["pid"] != os.getpid():
+            reported["pid"] = os.getpid()
+            elapsed_ms = (perf_counter() - started) * 1000
+            flask_app.logger.info("[worker %d] first request %s took %.1f ms", os.getpid(), request.path, elapsed_ms)
+        return response
+
+
+def start_background_threads():
+    """Start this process's background workers; safe to call more than once."""
+    # Delivers events left pending by a crash or deploy, or queued by other processes
+    outbox.dispatcher.ensure_running()
+    # Keeps the suggestion index current from the first request on
+    suggestion_syncer.ensure_running()
+
+
+def configure_app(config: dict = None, precompile: bool = True):
+    """Apply deployment settings to the module-level app.
+
+    Routes, blueprints and request hooks (overload, compression, profiling)
+    are attached to `app` at import; this layers the production setup on top:
+    config overrides, the persistent Jinja bytecode cache, template
+    precompilation, the saved-search and suggestion indexes and first-request
+    timing. It runs once per process, so wsgi.py, asgi.py and tests can all
+    call it; a later call asking for different settings raises instead of
+    being silently ignored.
+    """
+    if app.extensions.get("rewear_configured"):
+        conflicting = sorted(key for key, value in (config or {}).items() if app.config.get(key) != value)
+        if conflicting:
+            raise RuntimeError(f"configure_app() already ran in this process; cannot change {conflicting}")
+        return
+
+    app.config.update(config or {})
+    app.logger.setLevel(os.getenv("LOG_LEVEL", "INFO"))
+
+    # Templates never change in a running deployment, skip the per-render stat()
+    app.jinja_env.auto_reload = app.config.get("TEMPLATES_AUTO_RELOAD", False)
+
+    cache_dir = os.getenv("JINJA_CACHE_DIR", os.path.join(app.instance_path, "jinja_cache"))
+    os.makedirs(cache_dir, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+    if precompile:
+        count, seconds = precompile_templates(app)
+        app.logger.info("Precompiled %d templates in %.1f ms", count, seconds * 1000)
+
+    app.logger.info("Loaded %d saved searches", load_saved_searches())
+    app.logger.info("Indexed %d products for suggestions", load_suggestions())
+
+    # With gunicorn's preload_app this runs in the master, which only forks:
+    # the workers start their own threads in post_fork
+    if os.getenv("REWEAR_THREADS_AFTER_FORK") != "1":
+        start_background_threads()
+
+    track_first_request(app)
+    app.extensions["rewear_configured"] = True
+
+
 if __name__ == "__main__":
-     app.run(host='0.0.0.0', port=5000, debug=True)
+    configure_app({"TEMPLATES_AUTO_RELOAD": True}, precompile=False)
+    app.run(host='0.0.0.0', port=5000, debug=True)
 
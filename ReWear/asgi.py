@@ -0,0 +1,266 @@
+"""Async serving mode.
+
+The read-heavy pages (landing, product detail, orders, notifications) and the
+notification stream are served by a Quart app backed by async SQLAlchemy sessions on asyncpg, sharing
+the models from database.py. Every other path falls through to the regular
+Flask app, so both modes stay feature-complete.
+
+The Quart pages do the same work as their Flask versions: the same template
+context, conditional GET with the same validators and ETags (http_cache.py;
+the validator query runs in a worker thread) and the same response
+compression (streaming.py). Two differences remain, by design:
+
+  - Pages are rendered whole rather than streamed: the async session's rows
+    can't feed Jinja's synchronous loops while the page renders.
+  - No admission control or per-request deadlines (overload.py). Those bound
+    the threads of a sync worker; here concurrency is bounded by the async
+    pool (ASYNC_POOL_SIZE + ASYNC_MAX_OVERFLOW) instead.
+
+Run with:  uvicorn asgi:app --workers 2
+"""
+from datetime import datetime
+import os
+from functools import wraps
+from quart import Quart, render_template, session, redirect, url_for, flash, abort, jsonify, request, make_response
+from quart.utils import run_sync
+from asgiref.wsgi import WsgiToAsgi
+from sqlalchemy import select, or_, and_
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import selectinload
+from werkzeug.exceptions import NotFound, MethodNotAllowed
+from werkzeug.routing import Rule, RequestRedirect
+from database import (
+    DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, DB_NAME, Product, TransactionSummary, Notification,
+    get_latest_notification_id,
+)
+from app import app as flask_app, configure_app
+from api import encode_cursor, decode_cursor
+from assets import asset_url
+from images import image_srcset, image_src
+from counters import record_product_view
+from notifications import event_stream
+from http_cache import product_validator, catalog_validator, page_etag, is_not_modified, tag_response
+from streaming import COMPRESSIBLE_TYPES, MIN_COMPRESS_BYTES, choose_encoding, compress_bytes, mark_encoded
+
+configure_app()
+
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+# asyncpg takes ssl through connect_args rather than the sslmode query parameter
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    connect_args={"ssl": "require"},
+    pool_size=int(os.getenv("ASYNC_POOL_SIZE", "10")),
+    max_overflow=int(os.getenv("ASYNC_MAX_OVERFLOW", "20")),
+    pool_pre_ping=True,
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+quart_app = Quart(__name__)
+# Same key and cookie format as the Flask app, so logins work across both modes
+quart_app.secret_key = flask_app.secret_key
+quart_app.jinja_env.globals["asset_url"] = asset_url
+quart_app.jinja_env.globals["image_srcset"] = image_srcset
+quart_app.jinja_env.globals["image_src"] = image_src
+
+
+def login_required(f):
+    @wraps(f)
+    async def decorated_function(*args, **kwargs):
+        if "uid" not in session:
+            await flash("Please log in to access this page.", "warning")
+            return redirect(url_for("login"))
+        return await f(*args, **kwargs)
+    return decorated_function
+
+
+def conditional_page(validator):
+    """http_cache.conditional_page for Quart views."""
+    def decorator(f):
+        @wraps(f)
+        async def decorated_function(*args, **kwargs):
+            # Pending flash messages must be rendered, not answered with 304
+            if request.method != "GET" or session.get("_flashes"):
+                return await f(*args, **kwargs)
+
+            # The validators are sync queries; keep them off the event loop
+            stamps = await run_sync(validator)(**kwargs)
+            if stamps is None:
+                return await f(*args, **kwargs)
+
+            etag, last_modified = page_etag(stamps, session.get("uid"))
+            if is_not_modified(request, etag, last_modified):
+                response = await make_response("", 304)
+            else:
+                response = await make_response(await f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            return tag_response(response, etag, last_modified)
+        return decorated_function
+    return decorator
+
+
+@quart_app.after_request
+async def compress(response):
+    """streaming.init_compression for the Quart pages, whose bodies are rendered whole."""
+    if (request.method == "HEAD" or response.status_code != 200 or response.mimetype not in COMPRESSIBLE_TYPES
+            or "Content-Encoding" in response.headers):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+    data = await response.get_data()
+    if len(data) < MIN_COMPRESS_BYTES:
+        return response
+    response.set_data(compress_bytes(data, encoding))
+    return mark_encoded(response, encoding)
+
+
+@quart_app.route("/home")
+@login_required
+@conditional_page(catalog_validator)
+async def landing_page():
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Product)
+            .options(selectinload(Product.images))
+            .where(Product.status == "available")
+            .order_by(Product.created_at.desc())
+            .limit(4)
+        )
+        products = result.scalars().all()
+
+    return await render_template("landing_page.html", products=products, now=datetime.now())
+
+
+def count_product_view(f):
+    """app.count_product_view for Quart views."""
+    @wraps(f)
+    async def decorated_function(pid):
+        response = await make_response(await f(pid=pid))
+        if response.status_code in (200, 304):
+            record_product_view(pid)
+        return response
+    return decorated_function
+
+
+@quart_app.route("/product/<int:pid>")
+@count_product_view
+@conditional_page(product_validator)
+async def product_detail(pid):
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Product).options(selectinload(Product.images)).where(Product.pid == pid)
+        )
+        product = result.scalars().first()
+
+    if not product:
+        abort(404)
+    images = sorted(product.images, key=lambda i: not i.is_primary)
+    return await render_template("product_detail.html", product=product, images=images, now=datetime.now())
+
+
+@quart_app.route("/my-orders")
+@login_required
+async def my_orders():
+    uid = session.get("uid")
+
+    # One index range scan on transaction_summaries; the same context app.my_orders passes
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(TransactionSummary)
+            .where(TransactionSummary.uid == uid)
+            .order_by(TransactionSummary.created_at.desc())
+        )
+        all_swaps = result.scalars().all()
+
+    return await render_template("my_orders.html", all_swaps=all_swaps, now=datetime.now())
+
+
+@quart_app.route("/notifications")
+async def notifications():
+    uid = session.get("uid")
+    if not uid:
+        return jsonify({"error": "Login required"}), 401
+
+    limit = max(1, min(request.args.get("limit", 20, type=int), 100))
+    query = select(
+        Notification.notification_id,
+        Notification.message,
+        Notification.is_read,
+        Notification.notification_type,
+        Notification.reference_id,
+        Notification.created_at,
+    ).where(Notification.uid == uid)
+
+    # Same cursor as /api/v1/me/notifications: the (created_at, id) pair the rows are ordered by
+    cursor = request.args.get("cursor")
+    if cursor:
+        before = decode_cursor(cursor)
+        if before is None:
+            return jsonify({"error": "Invalid cursor"}), 400
+        query = query.where(or_(
+            Notification.created_at < before[0],
+            and_(Notification.created_at == before[0], Notification.notification_id < before[1]),
+        ))
+
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            query.order_by(Notification.created_at.desc(), Notification.notification_id.desc()).limit(limit)
+        )
+        rows = [dict(row._mapping) for row in result]
+
+    next_cursor = encode_cursor((rows[-1]["created_at"], rows[-1]["notification_id"])) if len(rows) == limit else None
+    for row in rows:
+        row["created_at"] = row["created_at"].isoformat() if row["created_at"] else None
+    response = jsonify({"data": rows, "next_cursor": next_cursor})
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.vary.add("Cookie")
+    return response
+
+
+@quart_app.route("/notifications/stream")
+async def notification_stream():
+    """notifications.stream without the per-worker cap: an idle stream here holds no thread."""
+    uid = session.get("uid")
+    if not uid:
+        return jsonify({"error": "Login required"}), 401
+
+    last_id = request.headers.get("Last-Event-ID", type=int)
+    if last_id is None:
+        last_id = await run_sync(get_latest_notification_id)(uid)
+
+    response = await make_response(event_stream(uid, last_id), 200, {
+        "Content-Type": "text/event-stream", "Cache-Control": "no-cache", "X-Accel-Buffering": "no",
+    })
+    # The stream lasts as long as the tab; Quart would otherwise cut it after RESPONSE_TIMEOUT
+    response.timeout = None
+    return response
+
+
+@quart_app.after_serving
+async def dispose_engine():
+    await async_engine.dispose()
+
+
+# Templates link to pages that only the Flask app serves; register those
+# endpoints as build-only so url_for() resolves them without routing here.
+for rule in flask_app.url_map.iter_rules():
+    if rule.endpoint not in quart_app.view_functions and rule.endpoint != "static":
+        quart_app.url_map.add(Rule(rule.rule, endpoint=rule.endpoint, build_only=True))
+
+_wsgi_fallback = WsgiToAsgi(flask_app)
+
+
+async def app(scope, receive, send):
+    """Route paths served natively by Quart there, everything else to Flask."""
+    if scope["type"] == "http":
+        adapter = quart_app.url_map.bind("")
+        try:
+            adapter.match(scope["path"], method=scope["method"])
+        except (NotFound, MethodNotAllowed):
+            return await _wsgi_fallback(scope, receive, send)
+        except RequestRedirect:
+            pass
+    return await quart_app(scope, receive, send)
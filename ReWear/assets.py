@@ -0,0 +1,238 @@
+"""Static asset pipeline.
+
+Styles and scripts live in assets_src/. `python assets.py` bundles them,
+minifies, fingerprints each bundle with its content hash and writes gzip and
+brotli variants next to it in static/dist/, plus a manifest mapping bundle
+names to fingerprinted files. Templates reference bundles through
+asset_url('base.css'); the /assets/ route serves the precompressed variant
+the client accepts with a one-year immutable Cache-Control.
+
+A build keeps the previous build's files, so pages rendered (or cached) just
+before a deploy still find their stylesheets and scripts; anything older is
+removed. Run the build in the deploy step. init_assets() only rebuilds when the
+manifest is stale, under a file lock, so several processes starting at once
+build once and never delete files another one just wrote.
+"""
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+import re
+from flask import request, send_from_directory, abort
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:  # fall back to the conservative minifier below
+    rjsmin = None
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIR = os.path.join(BASE_DIR, "assets_src")
+DIST_DIR = os.path.join(BASE_DIR, "static", "dist")
+MANIFEST_PATH = os.path.join(DIST_DIR, "manifest.json")
+URL_PREFIX = "/assets/"
+
+# Bundle name -> source files, concatenated in order
+BUNDLES = {
+    "base.css": ["css/base.css"],
+    "base.js": ["js/base.js"],
+    "index.css": ["css/index.css"],
+    "landing_page.css": ["css/landing_page.css"],
+    "landing_page.js": ["js/landing_page.js"],
+    "product_detail.css": ["css/product_detail.css"],
+    "product_detail.js": ["js/product_detail.js"],
+    "my_orders.css": ["css/my_orders.css"],
+    "my_orders.js": ["js/my_orders.js"],
+    "add_product.css": ["css/add_product.css"],
+    "add_product.js": ["js/add_product.js"],
+    "admin_panel.css": ["css/admin_panel.css"],
+    "admin_panel.js": ["js/admin_panel.js"],
+    "profile.css": ["css/profile.css"],
+    "profile.js": ["js/profile.js"],
+    "reset_password.js": ["js/reset_password.js"],
+}
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_manifest = {}
+_manifest_version = ""
+
+
+def minify_css(source):
+    source = re.sub(r"/\*.*?\*/", "", source, flags=re.S)
+    source = re.sub(r"\s+", " ", source)
+    # Only strip around tokens where whitespace is never significant;
+    # the space before ':' is kept since "a :hover" differs from "a:hover"
+    source = re.sub(r"\s*([{};,>])\s*", r"\1", source)
+    source = re.sub(r":\s+", ":", source)
+    source = source.replace(";}", "}")
+    return source.strip()
+
+
+def minify_js(source):
+    if rjsmin is not None:
+        return rjsmin.jsmin(source)
+    # Without a real tokenizer only drop what is unambiguous:
+    # indentation, blank lines and whole-line // comments
+    lines = []
+    for line in source.splitlines():
+        stripped = line.strip()
+        if stripped and not stripped.startswith("//"):
+            lines.append(stripped)
+    return "\n".join(lines)
+
+
+def _read_manifest():
+    try:
+        with open(MANIFEST_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def build(verbose=False):
+    """Build every bundle into DIST_DIR and write the manifest; returns the manifest."""
+    os.makedirs(DIST_DIR, exist_ok=True)
+    previous = _read_manifest()
+    manifest = {}
+
+    for name, sources in BUNDLES.items():
+        parts = []
+        for source in sources:
+            with open(os.path.join(SOURCE_DIR, source), encoding="utf-8") as f:
+                parts.append(f.read())
+        content = "\n".join(parts)
+
+        stem, ext = os.path.splitext(name)
+        minified = minify_css(content) if ext == ".css" else minify_js(content)
+        data = minified.encode("utf-8")
+
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        filename = f"{stem}.{digest}{ext}"
+        path = os.path.join(DIST_DIR, filename)
+
+        with open(path, "wb") as f:
+            f.write(data)
+        gz = gzip.compress(data, compresslevel=9, mtime=0)
+        with open(path + ".gz", "wb") as f:
+            f.write(gz)
+        br = None
+        if brotli is not None:
+            br = brotli.compress(data, quality=11)
+            with open(path + ".br", "wb") as f:
+                f.write(br)
+
+        manifest[name] = filename
+        if verbose:
+            print(f"{name:<22} {len(content.encode()):>7} B -> {len(data):>7} B min, "
+                  f"{len(gz):>6} B gz" + (f", {len(br):>6} B br" if br is not None else ""))
+
+    # Write-then-rename: a process loading the manifest never sees half of it
+    with open(MANIFEST_PATH + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(MANIFEST_PATH + ".tmp", MANIFEST_PATH)
+
+    # Drop fingerprints referenced by neither this build nor the one before it
+    live = set(manifest.values()) | set(previous.values())
+    for entry in os.listdir(DIST_DIR):
+        base = entry[:-3] if entry.endswith((".gz", ".br")) else entry
+        if not _is_bundle_file(entry) or base in live:
+            continue
+        os.remove(os.path.join(DIST_DIR, entry))
+
+    return manifest
+
+
+def load_manifest():
+    global _manifest, _manifest_version
+    with open(MANIFEST_PATH, "rb") as f:
+        raw = f.read()
+    _manifest = json.loads(raw)
+    _manifest_version = hashlib.sha1(raw).hexdigest()[:12]
+    return _manifest
+
+
+def manifest_version():
+    """Digest of the loaded manifest: changes whenever a build changes any fingerprint."""
+    return _manifest_version
+
+
+def asset_url(name):
+    """Fingerprinted URL of a bundle, e.g. asset_url('base.css')."""
+    return URL_PREFIX + _manifest.get(name, name)
+
+
+def _is_bundle_file(entry):
+    return entry.endswith((".css", ".js", ".css.gz", ".js.gz", ".css.br", ".js.br"))
+
+
+def serve_asset(filename):
+    # The current build's files and the previous build's, which build() keeps on disk
+    if (filename not in _manifest.values()
+            and ("/" in filename or not filename.endswith((".css", ".js"))
+                 or not os.path.isfile(os.path.join(DIST_DIR, filename)))):
+        abort(404)
+
+    accepted = request.accept_encodings
+    encoding = None
+    served = filename
+    if accepted["br"] and os.path.exists(os.path.join(DIST_DIR, filename + ".br")):
+        encoding, served = "br", filename + ".br"
+    elif accepted["gzip"] and os.path.exists(os.path.join(DIST_DIR, filename + ".gz")):
+        encoding, served = "gzip", filename + ".gz"
+
+    mimetype = "text/css" if filename.endswith(".css") else "application/javascript"
+    response = send_from_directory(DIST_DIR, served, mimetype=mimetype, conditional=True)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
+def is_stale():
+    """True when the manifest is missing or older than any source file."""
+    if not os.path.exists(MANIFEST_PATH):
+        return True
+    built_at = os.path.getmtime(MANIFEST_PATH)
+    for sources in BUNDLES.values():
+        for source in sources:
+            if os.path.getmtime(os.path.join(SOURCE_DIR, source)) > built_at:
+                return True
+    return False
+
+
+def build_if_stale():
+    """Rebuild when the sources changed, once across processes starting together."""
+    if not is_stale():
+        return False
+    os.makedirs(DIST_DIR, exist_ok=True)
+    with open(os.path.join(DIST_DIR, ".build.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            # Whoever held the lock before us may have built already
+            if not is_stale():
+                return False
+            build()
+            return True
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def init_assets(app):
+    """Register the asset route and template helper, rebuilding stale bundles first."""
+    build_if_stale()
+    load_manifest()
+    app.add_url_rule(URL_PREFIX + "<path:filename>", "assets", serve_asset)
+    app.jinja_env.globals["asset_url"] = asset_url
+
+
+if __name__ == "__main__":
+    build(verbose=True)
+    print(f"Wrote {MANIFEST_PATH}")
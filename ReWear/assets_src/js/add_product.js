@@ -0,0 +1,114 @@
+document.addEventListener('DOMContentLoaded', function() {
+    // Profile Popup Toggle
+    const profileToggle = document.getElementById('profileToggle');
+    const profilePopup = document.getElementById('profilePopup');
+
+    profileToggle.addEventListener('click', function() {
+        profilePopup.classList.toggle('active');
+    });
+
+    document.addEventListener('click', function(event) {
+        if (!profileToggle.contains(event.target) && !profilePopup.contains(event.target)) {
+            profilePopup.classList.remove('active');
+        }
+    });
+
+    // Point Value Slider
+    const pointSlider = document.getElementById('point_value');
+    const pointValueDisplay = document.getElementById('pointValueDisplay');
+
+    pointSlider.addEventListener('input', function() {
+        pointValueDisplay.textContent = this.value + ' points';
+    });
+
+    // Category and Subcategory Relationship
+    const categorySelect = document.getElementById('category');
+    const subcategorySelect = document.getElementById('subcategory');
+
+    const subcategories = {
+        'Tops': ['T-Shirt', 'Blouse', 'Shirt', 'Tank Top', 'Sweater', 'Hoodie'],
+        'Bottoms': ['Jeans', 'Pants', 'Shorts', 'Skirts', 'Leggings'],
+        'Dresses': ['Mini Dress', 'Midi Dress', 'Maxi Dress', 'Formal Dress', 'Casual Dress'],
+        'Outerwear': ['Jacket', 'Coat', 'Blazer', 'Cardigan', 'Vest']
+    };
+
+    categorySelect.addEventListener('change', function() {
+        // Clear existing options
+        subcategorySelect.innerHTML = '<option value="" disabled selected>Select a subcategory</option>';
+
+        // Populate subcategories based on selected category
+        const selectedCategory = this.value;
+        if (selectedCategory && subcategories[selectedCategory]) {
+            subcategories[selectedCategory].forEach(function(subcategory) {
+                const option = document.createElement('option');
+                option.value = subcategory;
+                option.textContent = subcategory;
+                subcategorySelect.appendChild(option);
+            });
+        }
+    });
+
+    // Image Upload Preview
+    const imageInputs = document.querySelectorAll('input[type="file"]');
+
+    imageInputs.forEach(function(input) {
+        input.addEventListener('change', function(event) {
+            const file = event.target.files[0];
+            if (file) {
+                const reader = new FileReader();
+                const uploadBox = this.parentElement;
+
+                reader.onload = function(e) {
+                    // Remove existing preview if any
+                    const existingPreview = uploadBox.querySelector('.image-preview');
+                    const existingRemove = uploadBox.querySelector('.image-remove');
+
+                    if (existingPreview) {
+                        uploadBox.removeChild(existingPreview);
+                    }
+
+                    if (existingRemove) {
+                        uploadBox.removeChild(existingRemove);
+                    }
+
+                    // Create and add image preview
+                    const img = document.createElement('img');
+                    img.src = e.target.result;
+                    img.classList.add('image-preview');
+                    uploadBox.appendChild(img);
+
+                    // Create and add remove button
+                    const removeBtn = document.createElement('div');
+                    removeBtn.classList.add('image-remove');
+                    removeBtn.innerHTML = '<i class="fas fa-times"></i>';
+                    uploadBox.appendChild(removeBtn);
+
+                    // Hide the icon and text
+                    const icon = uploadBox.querySelector('i:not(.fa-times)');
+                    const span = uploadBox.querySelector('span');
+
+                    if (icon) icon.style.display = 'none';
+                    if (span) span.style.display = 'none';
+
+                    // Add remove functionality
+                    removeBtn.addEventListener('click', function(e) {
+                        e.stopPropagation();
+                        uploadBox.removeChild(img);
+                        uploadBox.removeChild(removeBtn);
+                        input.value = '';
+
+                        if (icon) icon.style.display = 'block';
+                        if (span) span.style.display = 'block';
+                    });
+                };
+
+                reader.readAsDataURL(file);
+            }
+        });
+
+        const uploadBox = input.parentElement;
+        uploadBox.addEventListener('click', function() {
+            input.click();
+        });
+    });
+});
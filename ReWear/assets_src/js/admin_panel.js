@@ -0,0 +1,68 @@
+document.addEventListener('DOMContentLoaded', () => {
+    const tabs = document.querySelectorAll('.admin-tab');
+    const sections = document.querySelectorAll('.content-section');
+
+    tabs.forEach(tab => {
+        tab.addEventListener('click', () => {
+            tabs.forEach(t => t.classList.remove('active'));
+            tab.classList.add('active');
+            const target = tab.dataset.tab;
+            sections.forEach(section => {
+                section.classList.remove('active');
+                if (section.id === target) section.classList.add('active');
+            });
+        });
+    });
+});
+
+// Typeahead over users and transactions
+document.addEventListener('DOMContentLoaded', () => {
+    const describe = {
+        users: user => `#${user.uid} ${user.name} <${user.email}> · ${user.points} pts${user.role === 'admin' ? ' · admin' : ''}`,
+        transactions: tx => `#${tx.tid} ${tx.transaction_type} · ${tx.status} · user ${tx.requester_uid} → ${tx.receiver_uid}`
+            + (tx.points_exchanged ? ` · ${tx.points_exchanged} pts` : ''),
+    };
+
+    document.querySelectorAll('.admin-search-input').forEach(input => {
+        const results = input.parentElement.querySelector('.admin-search-results');
+        const render = describe[input.dataset.kind];
+        let timer = null;
+        let controller = null;
+
+        input.addEventListener('input', () => {
+            clearTimeout(timer);
+            timer = setTimeout(() => {
+                const query = input.value.trim();
+                if (controller) controller.abort();
+                if (!query) {
+                    results.innerHTML = '';
+                    return;
+                }
+                controller = new AbortController();
+
+                fetch(`${input.dataset.searchUrl}?q=${encodeURIComponent(query)}`, { signal: controller.signal })
+                    .then(response => response.json())
+                    .then(payload => {
+                        results.innerHTML = '';
+                        payload.data.forEach(row => {
+                            const item = document.createElement('li');
+                            item.textContent = render(row);
+                            results.appendChild(item);
+                        });
+                        if (!payload.complete) {
+                            const note = document.createElement('li');
+                            note.className = 'admin-search-partial';
+                            note.textContent = 'More matches may exist; keep typing to narrow the search.';
+                            results.appendChild(note);
+                        } else if (!payload.data.length) {
+                            const note = document.createElement('li');
+                            note.className = 'admin-search-partial';
+                            note.textContent = 'No matches';
+                            results.appendChild(note);
+                        }
+                    })
+                    .catch(() => { /* aborted by a newer keystroke */ });
+            }, 120);
+        });
+    });
+});
@@ -0,0 +1,16 @@
+// Mobile menu toggle
+document.getElementById('mobileMenuToggle').addEventListener('click', function () {
+    document.getElementById('navMenu').classList.toggle('active');
+});
+
+// Close mobile menu when clicking outside
+document.addEventListener('click', function (event) {
+    const navMenu = document.getElementById('navMenu');
+    const mobileMenuToggle = document.getElementById('mobileMenuToggle');
+
+    if (navMenu.classList.contains('active') &&
+        !navMenu.contains(event.target) &&
+        !mobileMenuToggle.contains(event.target)) {
+        navMenu.classList.remove('active');
+    }
+});
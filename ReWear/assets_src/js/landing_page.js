@@ -0,0 +1,45 @@
+// Search suggestions as you type
+document.addEventListener('DOMContentLoaded', function () {
+    const input = document.querySelector('.search-input');
+    const list = document.getElementById('search-suggestions');
+    if (!input || !list) {
+        return;
+    }
+
+    let timer = null;
+    let lastQuery = '';
+    let controller = null;
+
+    input.addEventListener('input', function () {
+        clearTimeout(timer);
+        timer = setTimeout(function () {
+            const query = input.value.trim();
+            if (query === lastQuery) {
+                return;
+            }
+            lastQuery = query;
+            if (!query) {
+                list.innerHTML = '';
+                return;
+            }
+
+            // Only the latest keystroke's answer matters
+            if (controller) {
+                controller.abort();
+            }
+            controller = new AbortController();
+
+            fetch('/api/suggest?q=' + encodeURIComponent(query), { signal: controller.signal })
+                .then(function (response) { return response.json(); })
+                .then(function (payload) {
+                    list.innerHTML = '';
+                    payload.data.forEach(function (suggestion) {
+                        const option = document.createElement('option');
+                        option.value = suggestion.text;
+                        list.appendChild(option);
+                    });
+                })
+                .catch(function () { /* aborted or offline: keep the old list */ });
+        }, 80);
+    });
+});
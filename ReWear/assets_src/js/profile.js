@@ -0,0 +1,30 @@
+// Avatar upload preview
+document.addEventListener('DOMContentLoaded', function () {
+    const avatarInput = document.getElementById('avatar-input');
+    const avatarContainer = document.querySelector('.profile-avatar');
+
+    avatarInput.addEventListener('change', function (e) {
+        if (e.target.files && e.target.files[0]) {
+            const reader = new FileReader();
+
+            reader.onload = function (e) {
+                // Remove icon if present
+                const icon = avatarContainer.querySelector('i');
+                if (icon) {
+                    icon.remove();
+                }
+
+                // Check if image already exists
+                let img = avatarContainer.querySelector('img');
+                if (!img) {
+                    img = document.createElement('img');
+                    avatarContainer.prepend(img);
+                }
+
+                img.src = e.target.result;
+            }
+
+            reader.readAsDataURL(e.target.files[0]);
+        }
+    });
+});
@@ -0,0 +1,39 @@
+document.addEventListener('DOMContentLoaded', function () {
+  const togglePassword = document.getElementById('togglePassword');
+  const passwordInput = document.getElementById('new_password');
+
+  togglePassword.addEventListener('click', function () {
+    const type = passwordInput.getAttribute('type') === 'password' ? 'text' : 'password';
+    passwordInput.setAttribute('type', type);
+    this.classList.toggle('fa-eye');
+    this.classList.toggle('fa-eye-slash');
+  });
+
+  const passwordRequirements = {
+    length: document.getElementById('length'),
+    uppercase: document.getElementById('uppercase'),
+    lowercase: document.getElementById('lowercase'),
+    number: document.getElementById('number'),
+    special: document.getElementById('special')
+  };
+
+  passwordInput.addEventListener('input', function () {
+    const password = this.value;
+
+    passwordRequirements.length.classList.toggle('valid', password.length >= 8);
+    passwordRequirements.uppercase.classList.toggle('valid', /[A-Z]/.test(password));
+    passwordRequirements.lowercase.classList.toggle('valid', /[a-z]/.test(password));
+    passwordRequirements.number.classList.toggle('valid', /\d/.test(password));
+    passwordRequirements.special.classList.toggle('valid', /[!@#$%^&*(),.?":{}|<>]/.test(password));
+
+    for (let key in passwordRequirements) {
+      const item = passwordRequirements[key];
+      const icon = item.querySelector('i');
+      if (item.classList.contains('valid')) {
+        icon.classList.replace('fa-circle', 'fa-check-circle');
+      } else {
+        icon.classList.replace('fa-check-circle', 'fa-circle');
+      }
+    }
+  });
+});
@@ -0,0 +1,345 @@
+"""Search-as-you-type suggestions over available products.
+
+Each process keeps a sorted list of normalized phrases (product titles,
+categories and subcategories of available products). A phrase weighs the
+popularity of the products behind it: 1 + views per product. A lookup bisects
+the list for the prefix range; ranges up to SCAN_LIMIT phrases are ranked on
+the spot, larger ones (short prefixes) come from a cache of top results. That
+cache is filled bottom-up at build time (a prefix's top results are the best
+of its children's), and a change only recomputes the prefixes of the phrases
+it touched, so no lookup ever scans more than SCAN_LIMIT phrases.
+
+A background thread keeps the index current: every SYNC_INTERVAL seconds it
+reads products whose updated_at moved past its high-water mark (an indexed
+range scan), re-reading the last SYNC_OVERLAP seconds below the mark for rows
+that committed late, and adds or drops them. It starts with the process
+(app.start_background_threads). View flushes leave updated_at alone, so
+popularity is refreshed by full rebuilds every REBUILD_INTERVAL seconds. A
+build reads the shared catalog snapshot (catalog_snapshot.py) while it is
+fresh, and the database otherwise.
+
+    python autocomplete.py --benchmark 1000000
+"""
+import heapq
+import os
+import threading
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from time import monotonic, sleep
+from flask import Blueprint, request
+from sqlalchemy import select, func
+from database import engine, Product
+from api import json_response
+from catalog_snapshot import current_snapshot
+
+SYNC_INTERVAL = float(os.getenv("SUGGEST_SYNC_INTERVAL", "2"))
+# updated_at is set before commit: a row can become visible after rows stamped later,
+# so each sync re-reads this far below the high-water mark
+SYNC_OVERLAP = timedelta(seconds=float(os.getenv("SUGGEST_SYNC_OVERLAP", "5")))
+REBUILD_INTERVAL = float(os.getenv("SUGGEST_REBUILD_INTERVAL", "3600"))
+SCAN_LIMIT = 256
+MAX_SUGGESTIONS = 10
+MAX_TITLE_KEY = 60  # longer titles are indexed by their first 60 characters
+END = "\uffff"  # sorts after any character in a normalized phrase
+
+KIND_ORDER = {"category": 0, "subcategory": 1, "title": 2}
+
+
+def normalize(text):
+    return " ".join(text.lower().split())
+
+
+def _rank(entry):
+    return entry.weight, -KIND_ORDER[entry.kind]
+
+
+class _Entry:
+    __slots__ = ("text", "kind", "products", "weight")
+
+    def __init__(self, text, kind):
+        self.text = text
+        self.kind = kind
+        self.products = 0
+        self.weight = 0
+
+
+class SuggestionIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._keys = []       # sorted normalized phrases
+        self._entries = {}    # phrase -> _Entry
+        self._products = {}   # pid -> (phrase keys, weight)
+        self._top = {}        # prefix -> best entries, for prefixes matching > SCAN_LIMIT phrases
+        self.high_water = None
+        self.loaded = False
+        self.built_at = 0.0
+
+    # Callers of the underscore methods hold the lock
+    def _add(self, pid, title, category, subcategory, weight, keep_sorted=True):
+        phrases = [(normalize(title)[:MAX_TITLE_KEY], title[:MAX_TITLE_KEY], "title")]
+        if category:
+            phrases.append((normalize(category), category, "category"))
+        if subcategory:
+            phrases.append((normalize(subcategory), subcategory, "subcategory"))
+
+        for key, text, kind in phrases:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(text, kind)
+                if keep_sorted:
+                    insort(self._keys, key)
+            elif KIND_ORDER[kind] < KIND_ORDER[entry.kind]:
+                entry.kind, entry.text = kind, text
+            entry.products += 1
+            entry.weight += weight
+        self._products[pid] = (tuple(key for key, _, _ in phrases), weight)
+        return [key for key, _, _ in phrases]
+
+    def _remove(self, pid):
+        keys, weight = self._products.pop(pid)
+        for key in keys:
+            entry = self._entries[key]
+            entry.products -= 1
+            entry.weight -= weight
+            if entry.products <= 0:
+                del self._entries[key]
+                del self._keys[bisect_left(self._keys, key)]
+        return list(keys)
+
+    def _range(self, prefix):
+        low = bisect_left(self._keys, prefix)
+        return low, bisect_left(self._keys, prefix + END, low)
+
+    def _best(self, prefix, low, high, reuse=True):
+        """Top entries for the phrases in keys[low:high], which all start with `prefix`."""
+        if reuse and prefix in self._top:
+            return self._top[prefix]
+        if high - low <= SCAN_LIMIT:
+            return heapq.nlargest(MAX_SUGGESTIONS, (self._entries[k] for k in self._keys[low:high]), key=_rank)
+
+        # Merge the children's results; the phrase equal to the prefix itself sorts first
+        candidates = []
+        position = low
+        if self._keys[position] == prefix:
+            candidates.append(self._entries[prefix])
+            position += 1
+        depth = len(prefix) + 1
+        while position < high:
+            child = self._keys[position][:depth]
+            child_high = bisect_left(self._keys, child + END, position, high)
+            best = self._best(child, position, child_high, reuse)
+            # Children are cached too, so a later change only rescans the one it touched
+            self._top[child] = best
+            candidates.extend(best)
+            position = child_high
+
+        best = heapq.nlargest(MAX_SUGGESTIONS, candidates, key=_rank)
+        self._top[prefix] = best
+        return best
+
+    def _refresh_prefixes(self, keys):
+        """Recompute the cached top results above changed phrases, deepest first."""
+        stale = {key[:length] for key in keys for length in range(len(key) + 1)}
+        for prefix in stale:
+            self._top.pop(prefix, None)
+        for prefix in sorted(stale, key=len, reverse=True):
+            low, high = self._range(prefix)
+            if high - low > SCAN_LIMIT:
+                self._best(prefix, low, high)
+
+    def build(self, rows, high_water=None):
+        """Replace the index with rows of (pid, title, category, subcategory, view_count)."""
+        fresh = SuggestionIndex()
+        for pid, title, category, subcategory, view_count in rows:
+            fresh._add(pid, title, category, subcategory, 1 + (view_count or 0), keep_sorted=False)
+        fresh._keys = sorted(fresh._entries)
+        fresh._best("", 0, len(fresh._keys), reuse=False)
+
+        with self._lock:
+            self._keys, self._entries = fresh._keys, fresh._entries
+            self._products, self._top = fresh._products, fresh._top
+            self.high_water = high_water
+            self.loaded = True
+            self.built_at = monotonic()
+
+    def apply(self, pid, available, title=None, category=None, subcategory=None, view_count=None):
+        """Bring one product in line with its current status."""
+        with self._lock:
+            changed = self._remove(pid) if pid in self._products else []
+            if available:
+                changed += self._add(pid, title, category, subcategory, 1 + (view_count or 0))
+            if changed:
+                self._refresh_prefixes(changed)
+
+    def suggest(self, prefix, limit=MAX_SUGGESTIONS):
+        prefix = normalize(prefix)[:MAX_TITLE_KEY]
+        if not prefix:
+            return []
+        with self._lock:
+            low, high = self._range(prefix)
+            best = self._best(prefix, low, high)
+            return [
+                {"text": entry.text, "kind": entry.kind, "products": entry.products}
+                for entry in best[:limit]
+            ]
+
+    # Database
+    def rebuild(self):
+        # Build from the shared catalog snapshot when it's fresh, without a query per worker
+        snapshot = current_snapshot()
+        if snapshot is not None:
+            self.build(
+                ((card.pid, card.title, card.category, card.subcategory, card.view_count) for card in snapshot.cards()),
+                snapshot.high_water
+            )
+            return len(self._products)
+
+        statement = select(
+            Product.pid, Product.title, Product.category, Product.subcategory, Product.view_count
+        ).where(Product.status == "available")
+        with engine.connect() as conn:
+            high_water = conn.execute(select(func.max(Product.updated_at))).scalar()
+            rows = conn.execution_options(stream_results=True, yield_per=10000).execute(statement)
+            self.build(rows, high_water)
+        return len(self._products)
+
+    def sync(self):
+        """Apply status changes since the high-water mark, or rebuild when due."""
+        if not self.loaded or monotonic() - self.built_at >= REBUILD_INTERVAL:
+            self.rebuild()
+            return
+
+        # Rows in the overlap window are re-applied every time, which is harmless
+        statement = select(
+            Product.pid, Product.status, Product.title, Product.category, Product.subcategory,
+            Product.view_count, Product.updated_at
+        ).order_by(Product.updated_at)
+        if self.high_water is not None:
+            statement = statement.where(Product.updated_at >= self.high_water - SYNC_OVERLAP)
+        with engine.connect() as conn:
+            changed = conn.execute(statement).all()
+        for row in changed:
+            self.apply(row.pid, row.status == "available", row.title, row.category, row.subcategory, row.view_count)
+        if changed:
+            self.high_water = max(self.high_water or datetime.min, changed[-1].updated_at)
+
+
+index = SuggestionIndex()
+
+
+class _Syncer:
+    """Per-process background thread running index.sync()."""
+
+    def __init__(self):
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def after_fork(self):
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def ensure_running(self):
+        if self.thread is not None:
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="suggest-sync", daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                index.sync()
+            except Exception as e:
+                print(f"Error syncing suggestions: {e}")
+            sleep(SYNC_INTERVAL)
+
+
+syncer = _Syncer()
+os.register_at_fork(after_in_child=syncer.after_fork)
+
+
+def load_suggestions():
+    """Build the index at startup (in the gunicorn master, so workers inherit it)."""
+    try:
+        return index.rebuild()
+    except Exception as e:
+        print(f"Error loading suggestions: {e}")
+        return 0
+
+
+suggest_bp = Blueprint("suggest", __name__, url_prefix="/api")
+
+
+@suggest_bp.route("/suggest")
+def suggest():
+    limit = request.args.get("limit", MAX_SUGGESTIONS, type=int)
+    response = json_response({"data": index.suggest(request.args.get("q", ""), max(1, min(limit, MAX_SUGGESTIONS)))})
+    response.headers["Cache-Control"] = "private, max-age=30"
+    return response
+
+
+def benchmark(count=1000000, lookups=100000, changes=1000, seed=11):
+    """Build an index of `count` synthetic titles and time lookups and status changes (no database)."""
+    import random
+    import tracemalloc
+    from time import perf_counter
+
+    rng = random.Random(seed)
+    adjectives = ["vintage", "classic", "summer", "oversized", "slim", "cropped", "wool", "linen",
+                  "denim", "silk", "floral", "striped", "leather", "cotton", "knit", "pleated"]
+    nouns = ["jacket", "dress", "shirt", "jeans", "skirt", "coat", "blazer", "sweater",
+             "hoodie", "trousers", "top", "cardigan", "shorts", "parka", "blouse", "jumpsuit"]
+    categories = ["Tops", "Bottoms", "Dresses", "Outerwear"]
+
+    def title():
+        return f"{rng.choice(adjectives)} {rng.choice(adjectives)} {rng.choice(nouns)} {rng.randrange(100000)}"
+
+    rows = [
+        (pid, title(), rng.choice(categories), rng.choice(["Casual", "Formal", "Sports"]), int(rng.paretovariate(1.2)))
+        for pid in range(1, count + 1)
+    ]
+
+    bench = SuggestionIndex()
+    tracemalloc.start()
+    started = perf_counter()
+    bench.build(rows)
+    build_seconds = perf_counter() - started
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del rows
+
+    words = adjectives + nouns
+    timings = []
+    for _ in range(lookups):
+        prefix = rng.choice(words)[:rng.randint(1, 8)]
+        started = perf_counter()
+        bench.suggest(prefix)
+        timings.append(perf_counter() - started)
+    timings.sort()
+
+    started = perf_counter()
+    for _ in range(changes):
+        pid = rng.randint(1, count)
+        bench.apply(pid, False)
+        bench.apply(pid, True, title(), rng.choice(categories), "Casual", 1)
+    change_seconds = perf_counter() - started
+
+    def percentile(p):
+        return timings[min(len(timings) - 1, int(len(timings) * p))] * 1e6
+
+    print(f"{count:,} titles -> {len(bench._keys):,} phrases, {len(bench._top):,} cached prefixes, "
+          f"built in {build_seconds:.1f} s")
+    print(f"index memory {memory / 1e6:,.0f} MB ({memory / count:,.0f} bytes per title)")
+    print(f"lookup p50 {percentile(0.5):.1f} us  p99 {percentile(0.99):.1f} us  max {timings[-1] * 1e6:,.0f} us")
+    print(f"status change (remove + add) {change_seconds / changes * 1e6:,.0f} us")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Autocomplete index benchmark")
+    parser.add_argument("--benchmark", type=int, metavar="TITLES", default=1000000)
+    parser.add_argument("--lookups", type=int, default=100000)
+    args = parser.parse_args()
+    benchmark(args.benchmark, args.lookups)
@@ -0,0 +1,245 @@
+"""Bulk listing import from CSV or JSONL.
+
+Input is parsed as a stream and processed in chunks. Per chunk: rows are
+validated (bad rows are reported and skipped, the rest still go in), points
+are computed for the whole chunk with calculate_points_batch, and products,
+images, the +10 listing-bonus ledger rows and the near-duplicate fingerprints
+are written in one transaction.
+On Postgres products and images go through COPY with ids reserved from the
+sequences up front; elsewhere an executemany INSERT ... RETURNING is used.
+
+    python bulk_import.py listings.csv --uid 12
+    python bulk_import.py listings.jsonl --format jsonl
+
+Columns / keys: uid (optional with --uid), title, description, category,
+subcategory, size, condition, image_urls (CSV: '|' separated; JSONL: list).
+New listings are "pending" until approved.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from time import perf_counter
+from sqlalchemy import insert, select, text
+from database import (
+    SessionLocal,
+    Product,
+    ProductImage,
+    User,
+    BASE_POINTS,
+    calculate_points_batch,
+    queue_point_transactions,
+)
+from duplicates import fingerprint_listings
+
+CHUNK_SIZE = 5000
+LISTING_BONUS = 10
+REQUIRED_FIELDS = ("title", "description", "category", "subcategory", "size", "condition")
+MAX_LENGTHS = {"title": 100, "category": 50, "subcategory": 50, "size": 20, "condition": 50}
+
+
+def read_rows(stream, fmt):
+    """Yield (line_number, dict) from a text stream without loading it whole."""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == "jsonl":
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_number, {"_error": f"invalid JSON: {e.msg}"}
+    else:
+        raise ValueError("format must be csv or jsonl")
+
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def validate(row, default_uid):
+    """Return (clean_row, None) or (None, error message)."""
+    if not isinstance(row, dict):
+        return None, "row must be an object"
+    if "_error" in row:
+        return None, row["_error"]
+
+    clean = {}
+    for field in REQUIRED_FIELDS:
+        value = row.get(field)
+        if value is not None and not isinstance(value, str):
+            return None, f"{field} must be text"
+        value = value.strip() if value else value
+        if not value:
+            return None, f"missing {field}"
+        if field in MAX_LENGTHS and len(value) > MAX_LENGTHS[field]:
+            return None, f"{field} longer than {MAX_LENGTHS[field]} characters"
+        clean[field] = value
+
+    if clean["category"] not in BASE_POINTS:
+        return None, f"unknown category {clean['category']!r}"
+
+    uid = row.get("uid") or default_uid
+    try:
+        clean["uid"] = int(uid)
+    except (TypeError, ValueError):
+        return None, "missing or invalid uid"
+
+    images = row.get("image_urls") or []
+    if isinstance(images, str):
+        images = [url.strip() for url in images.split("|") if url.strip()]
+    if not isinstance(images, list) or not all(isinstance(url, str) for url in images):
+        return None, "image_urls must be a list of URLs"
+    clean["image_urls"] = images
+    return clean, None
+
+
+def _copy_rows(db, table, columns, rows):
+    """COPY rows into a table through the session's psycopg2 connection."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(rows)
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def _reserve_ids(db, sequence, count):
+    return [row[0] for row in db.execute(
+        text(f"SELECT nextval('{sequence}') FROM generate_series(1, :count)"), {"count": count}
+    )]
+
+
+def insert_chunk(db, rows):
+    """Insert validated rows with their images and listing bonus; returns the new pids."""
+    now = datetime.utcnow()
+    points = calculate_points_batch(
+        [row["category"] for row in rows],
+        [row["subcategory"] for row in rows],
+        [row["condition"] for row in rows],
+    )
+    product_columns = ("uid", "title", "description", "category", "subcategory", "size",
+                       "condition", "point_value", "status", "is_featured", "created_at", "updated_at")
+    product_values = [
+        (row["uid"], row["title"], row["description"], row["category"], row["subcategory"], row["size"],
+         row["condition"], int(point_value), "pending", False, now, now)
+        for row, point_value in zip(rows, points)
+    ]
+
+    copy = db.get_bind().dialect.name == "postgresql"
+    if copy:
+        pids = _reserve_ids(db, "products_pid_seq", len(rows))
+        _copy_rows(db, "products", ("pid",) + product_columns,
+                   [(pid,) + values for pid, values in zip(pids, product_values)])
+    else:
+        pids = list(db.scalars(
+            insert(Product).returning(Product.pid, sort_by_parameter_order=True),
+            [dict(zip(product_columns, values)) for values in product_values]
+        ))
+
+    image_values = [
+        (pid, url, position == 0, now)
+        for pid, row in zip(pids, rows)
+        for position, url in enumerate(row["image_urls"])
+    ]
+    if image_values:
+        if copy:
+            _copy_rows(db, "product_images", ("pid", "image_url", "is_primary", "created_at"), image_values)
+        else:
+            db.execute(insert(ProductImage), [
+                {"pid": pid, "image_url": url, "is_primary": is_primary, "created_at": created_at}
+                for pid, url, is_primary, created_at in image_values
+            ])
+
+    queue_point_transactions(db, [
+        (row["uid"], LISTING_BONUS, "item_listing", pid, "Points for listing an item")
+        for pid, row in zip(pids, rows)
+    ])
+
+    # Flag re-listed items against the catalog (and the rest of the chunk) for moderators
+    fingerprint_listings(db, [(pid, row["title"], row["description"]) for pid, row in zip(pids, rows)])
+    return pids
+
+
+def import_listings(stream, fmt="csv", default_uid=None, chunk_size=CHUNK_SIZE):
+    """Import listings from a text stream; returns a report dict.
+
+    Validation errors are collected per line and never abort the import; if a
+    chunk fails in the database, all of its rows are reported and the import
+    moves on to the next chunk.
+    """
+    report = {"imported": 0, "failed": 0, "errors": [], "pids": []}
+    started = perf_counter()
+
+    for chunk in chunked(read_rows(stream, fmt), chunk_size):
+        valid = []
+        for line_number, row in chunk:
+            clean, error = validate(row, default_uid)
+            if error:
+                report["errors"].append({"line": line_number, "error": error})
+            else:
+                clean["line"] = line_number
+                valid.append(clean)
+        if not valid:
+            continue
+
+        db = SessionLocal()
+        try:
+            # Unknown owners are row errors, not a reason to fail the chunk
+            uids = {row["uid"] for row in valid}
+            known = set(db.scalars(select(User.uid).where(User.uid.in_(uids))))
+            rows = []
+            for row in valid:
+                if row["uid"] in known:
+                    rows.append(row)
+                else:
+                    report["errors"].append({"line": row["line"], "error": f"unknown uid {row['uid']}"})
+
+            if rows:
+                report["pids"].extend(insert_chunk(db, rows))
+                db.commit()
+                report["imported"] += len(rows)
+        except Exception as e:
+            db.rollback()
+            print(f"Error importing listings chunk: {e}")
+            for row in valid:
+                report["errors"].append({"line": row["line"], "error": f"chunk failed: {e}"})
+        finally:
+            db.close()
+
+    report["failed"] = len(report["errors"])
+    report["seconds"] = perf_counter() - started
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Bulk import listings from CSV or JSONL")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=("csv", "jsonl"))
+    parser.add_argument("--uid", type=int, help="owner for rows without a uid column")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    fmt = args.format or ("jsonl" if args.path.endswith((".jsonl", ".ndjson")) else "csv")
+    with open(args.path, newline="", encoding="utf-8") as f:
+        result = import_listings(f, fmt, default_uid=args.uid, chunk_size=args.chunk_size)
+
+    rate = result["imported"] / result["seconds"] if result["seconds"] else 0
+    print(f"imported {result['imported']} rows, {result['failed']} errors in "
+          f"{result['seconds']:.2f} s ({rate:,.0f} rows/s)")
+    for error in result["errors"][:50]:
+        print(f"  line {error['line']}: {error['error']}")
+    if result["failed"] > 50:
+        print(f"  ... {result['failed'] - 50} more")
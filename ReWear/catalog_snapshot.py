@@ -0,0 +1,483 @@
+"""Shared, memory-mapped snapshot of the available catalog.
+
+One writer process (`python catalog_snapshot.py --writer`, kept single by an
+flock) serializes the available products every SNAPSHOT_INTERVAL seconds,
+when the catalog changed, into CATALOG_SNAPSHOT_PATH. Workers map the file
+read-only: the column arrays are memoryviews straight onto the page cache, so
+N workers share one copy, and opening a snapshot costs a header parse instead
+of a warm-up query. A new version is written to a temporary file and moved
+over the old one with os.replace(); readers notice the new inode on their
+next check and switch, while requests still holding the old snapshot keep
+reading its (unlinked) mapping.
+
+Workers read it for the product listing API (database.get_available_products_page,
+keyset pages found by binary search, per category through a row index), the
+facet counts, and the suggestion index build (autocomplete.py).
+
+File layout (little-endian, every section 8-byte aligned):
+
+  header    magic "RWCS", format, snapshot version, created_at, row count,
+            offset and length of each section
+  pid       int32[n]    rows in listing order: newest first (created_at, pid)
+  points    int32[n]
+  created   int64[n]    microseconds since the epoch
+  views     int32[n]
+  category, subcategory, condition  uint16[n]   indexes into the label table
+  featured  uint8[n]
+  title_end, image_end  uint32[n]   end offsets into the string heap
+  by_pid    int32[n], uint32[n]     sorted pids and their row numbers
+  category_rows  uint32[n]  row numbers grouped by category, each group in
+                            listing order (ranges in the label table)
+  labels    JSON: label list, per-category facet counts and row ranges, and
+            the catalog's max(updated_at) when the snapshot was taken
+  heap      UTF-8 titles and primary image URLs (primary image only, as the
+            database path serves them)
+
+    python catalog_snapshot.py --writer              # keep the snapshot current
+    python catalog_snapshot.py --benchmark 200000    # RSS / warm-up vs per-process caches
+"""
+import fcntl
+import json
+import mmap
+import os
+import struct
+import threading
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from time import monotonic, sleep, time
+from typing import NamedTuple, Optional
+
+SNAPSHOT_PATH = os.getenv("CATALOG_SNAPSHOT_PATH", os.path.join("instance", "catalog.snapshot"))
+SNAPSHOT_INTERVAL = float(os.getenv("CATALOG_SNAPSHOT_INTERVAL", "30"))
+# Readers ignore a snapshot older than this and fall back to the database
+MAX_STALENESS = float(os.getenv("CATALOG_SNAPSHOT_MAX_STALENESS", "120"))
+CHECK_INTERVAL = 1.0
+
+MAGIC = b"RWCS"
+FORMAT = 2
+SECTIONS = ("pid", "points", "created", "views", "category", "subcategory", "condition", "featured",
+            "title_end", "image_end", "sorted_pid", "sorted_row", "category_rows", "labels", "heap")
+TYPECODES = {"pid": "i", "points": "i", "created": "q", "views": "i", "category": "H", "subcategory": "H",
+             "condition": "H", "featured": "B", "title_end": "I", "image_end": "I",
+             "sorted_pid": "i", "sorted_row": "I", "category_rows": "I"}
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+HEADER = struct.Struct("<4sHxxQdI4x" + "QQ" * len(SECTIONS))
+
+
+class CatalogCard(NamedTuple):
+    pid: int
+    title: str
+    category: str
+    subcategory: str
+    point_value: int
+    condition: str
+    is_featured: bool
+    image_url: Optional[str]
+    created_at: datetime
+    view_count: int
+
+    def listing(self):
+        """The row as get_available_products_page returns it."""
+        return {
+            "pid": self.pid, "title": self.title, "category": self.category, "subcategory": self.subcategory,
+            "point_value": self.point_value, "condition": self.condition, "is_featured": self.is_featured,
+            "created_at": self.created_at, "image_url": self.image_url,
+        }
+
+
+def _microseconds(at):
+    """A naive UTC datetime as integer microseconds since the epoch (exact, unlike timestamp())."""
+    return (at - EPOCH) // MICROSECOND
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def encode(rows, version, high_water=None):
+    """Snapshot bytes for `rows` of CatalogCard fields, in listing order (newest first)."""
+    columns = {name: array(code) for name, code in TYPECODES.items()}
+    labels, label_ids = [], {}
+    facets = {}
+    by_category = {}
+    heap = bytearray()
+
+    def label(value):
+        value = value or ""
+        if value not in label_ids:
+            label_ids[value] = len(labels)
+            labels.append(value)
+        return label_ids[value]
+
+    for pid, title, category, subcategory, point_value, condition, is_featured, image_url, created_at, view_count \
+            in rows:
+        by_category.setdefault(label(category), array("I")).append(len(columns["pid"]))
+        columns["pid"].append(pid)
+        columns["points"].append(point_value or 0)
+        columns["created"].append(_microseconds(created_at) if created_at else 0)
+        columns["views"].append(view_count or 0)
+        columns["category"].append(label(category))
+        columns["subcategory"].append(label(subcategory))
+        columns["condition"].append(label(condition))
+        columns["featured"].append(1 if is_featured else 0)
+        heap += (title or "").encode()
+        columns["title_end"].append(len(heap))
+        heap += (image_url or "").encode()
+        columns["image_end"].append(len(heap))
+
+        counts = facets.setdefault(category or "", {"count": 0, "subcategories": {}})
+        counts["count"] += 1
+        counts["subcategories"][subcategory or ""] = counts["subcategories"].get(subcategory or "", 0) + 1
+
+    order = sorted(range(len(columns["pid"])), key=columns["pid"].__getitem__)
+    columns["sorted_pid"] = array("i", (columns["pid"][row] for row in order))
+    columns["sorted_row"] = array("I", order)
+    category_ranges = {}
+    for category_id, category_rows in by_category.items():
+        start = len(columns["category_rows"])
+        columns["category_rows"].extend(category_rows)
+        category_ranges[labels[category_id]] = [start, len(columns["category_rows"])]
+
+    blobs = {name: column.tobytes() for name, column in columns.items()}
+    blobs["labels"] = json.dumps({
+        "labels": labels, "facets": facets, "category_ranges": category_ranges,
+        "high_water": high_water.isoformat() if high_water else None,
+    }).encode()
+    blobs["heap"] = bytes(heap)
+
+    offset = _align(HEADER.size)
+    placement = []
+    for name in SECTIONS:
+        placement.extend((offset, len(blobs[name])))
+        offset = _align(offset + len(blobs[name]))
+
+    out = bytearray(offset)
+    HEADER.pack_into(out, 0, MAGIC, FORMAT, version, time(), len(columns["pid"]), *placement)
+    for index, name in enumerate(SECTIONS):
+        start = placement[2 * index]
+        out[start:start + len(blobs[name])] = blobs[name]
+    return bytes(out)
+
+
+class CatalogSnapshot:
+    """Read-only view of one snapshot file; nothing is copied until a row is read."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.inode = os.fstat(f.fileno()).st_ino
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        magic, file_format, self.version, self.created_at, self.count, *placement = HEADER.unpack_from(view)
+        if magic != MAGIC or file_format != FORMAT:
+            raise ValueError(f"{path} is not a format {FORMAT} catalog snapshot")
+
+        sections = {name: view[placement[2 * i]:placement[2 * i] + placement[2 * i + 1]]
+                    for i, name in enumerate(SECTIONS)}
+        for name, code in TYPECODES.items():
+            setattr(self, name, sections[name].cast(code))
+        self.heap = sections["heap"]
+        meta = json.loads(bytes(sections["labels"]))
+        self.labels = meta["labels"]
+        self.facets = meta["facets"]
+        self.category_ranges = meta["category_ranges"]
+        self.high_water = datetime.fromisoformat(meta["high_water"]) if meta["high_water"] else None
+
+    def __len__(self):
+        return self.count
+
+    def age(self):
+        return time() - self.created_at
+
+    def _text(self, start, end):
+        return str(self.heap[start:end], "utf-8")
+
+    def card(self, row):
+        title_start = self.image_end[row - 1] if row else 0
+        title_end = self.title_end[row]
+        labels = self.labels
+        return CatalogCard(
+            self.pid[row],
+            self._text(title_start, title_end),
+            labels[self.category[row]],
+            labels[self.subcategory[row]],
+            self.points[row],
+            labels[self.condition[row]],
+            bool(self.featured[row]),
+            self._text(title_end, self.image_end[row]) or None,
+            EPOCH + self.created[row] * MICROSECOND,
+            self.views[row],
+        )
+
+    def cards(self):
+        return (self.card(row) for row in range(self.count))
+
+    def get(self, pid):
+        position = bisect_left(self.sorted_pid, pid)
+        if position < self.count and self.sorted_pid[position] == pid:
+            return self.card(self.sorted_row[position])
+        return None
+
+    def _rows(self, category):
+        """Row numbers of the listing (or one category of it), in listing order."""
+        if not category:
+            return range(self.count)
+        start, end = self.category_ranges.get(category, (0, 0))
+        return self.category_rows[start:end]
+
+    def page(self, limit=20, after=None, category=None):
+        """Like database.get_available_products_page: (cards, next_after), newest first.
+
+        `after` is the (created_at, pid) of the last card of the previous page;
+        the page starts at the first row below it, found by binary search.
+        """
+        rows = self._rows(category)
+        low = 0
+        if after is not None:
+            key = (_microseconds(after[0]), after[1])
+            created, pid = self.created, self.pid
+            high = len(rows)
+            while low < high:
+                middle = (low + high) // 2
+                row = rows[middle]
+                if (created[row], pid[row]) < key:
+                    high = middle
+                else:
+                    low = middle + 1
+        cards = [self.card(row) for row in rows[low:low + limit + 1]]
+        if len(cards) > limit:
+            cards = cards[:limit]
+            return cards, (cards[-1].created_at, cards[-1].pid)
+        return cards, None
+
+
+class SnapshotReader:
+    """The newest snapshot at `path`, re-checked at most once per CHECK_INTERVAL."""
+
+    def __init__(self, path=SNAPSHOT_PATH):
+        self.path = path
+        self.snapshot = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def after_fork(self):
+        self._lock = threading.Lock()
+
+    def current(self):
+        """The current snapshot, or None when missing or older than MAX_STALENESS."""
+        now = monotonic()
+        if now - self._checked >= CHECK_INTERVAL:
+            with self._lock:
+                if now - self._checked >= CHECK_INTERVAL:
+                    self._checked = now
+                    self._reload()
+        snapshot = self.snapshot
+        if snapshot is None or snapshot.age() > MAX_STALENESS:
+            return None
+        return snapshot
+
+    def _reload(self):
+        try:
+            inode = os.stat(self.path).st_ino
+        except OSError:
+            self.snapshot = None
+            return
+        if self.snapshot is not None and self.snapshot.inode == inode:
+            return
+        try:
+            # Swap the reference; requests holding the old snapshot finish on it
+            self.snapshot = CatalogSnapshot(self.path)
+        except (OSError, ValueError) as e:
+            print(f"Error loading catalog snapshot: {e}")
+
+
+reader = SnapshotReader()
+os.register_at_fork(after_in_child=reader.after_fork)
+
+
+def current_snapshot():
+    return reader.current()
+
+
+# Writer
+def _read_version(path):
+    try:
+        with open(path, "rb") as f:
+            magic, file_format, version, *_ = HEADER.unpack(f.read(HEADER.size))
+        return version if magic == MAGIC else 0
+    except (OSError, struct.error):
+        return 0
+
+
+def write_snapshot(path=SNAPSHOT_PATH):
+    """Serialize the available catalog to `path` atomically; returns (version, rows)."""
+    from sqlalchemy import select, func
+    from database import engine, Product
+    from read_models import primary_image_url
+
+    statement = (
+        select(
+            Product.pid, Product.title, Product.category, Product.subcategory, Product.point_value,
+            Product.condition, Product.is_featured, primary_image_url(Product.pid),
+            Product.created_at, Product.view_count
+        )
+        .where(Product.status == "available")
+        .order_by(Product.created_at.desc(), Product.pid.desc())
+    )
+    with engine.connect() as conn:
+        # Taken before the rows: changes after it are re-read by the suggestion index's sync
+        high_water = conn.execute(select(func.max(Product.updated_at))).scalar()
+        rows = conn.execution_options(stream_results=True, yield_per=10000).execute(statement)
+        version = _read_version(path) + 1
+        data = encode(rows, version, high_water)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+    return version, struct.unpack_from("<I", data, 24)[0]
+
+
+def run_writer(path=SNAPSHOT_PATH, interval=SNAPSHOT_INTERVAL):
+    """Rewrite the snapshot whenever the catalog changes; only one writer runs per path."""
+    from database import get_catalog_freshness
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    lock = open(path + ".lock", "w")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        print(f"Another snapshot writer holds {path}.lock")
+        return
+
+    written_for = None
+    written_at = 0.0
+    while True:
+        freshness = get_catalog_freshness()
+        # Rewrite on change, and at least every half MAX_STALENESS so readers keep trusting it
+        if freshness != written_for or monotonic() - written_at > MAX_STALENESS / 2:
+            try:
+                version, count = write_snapshot(path)
+                written_for, written_at = freshness, monotonic()
+                print(f"[{datetime.now():%H:%M:%S}] wrote catalog snapshot v{version} ({count} products)")
+            except Exception as e:
+                print(f"Error writing catalog snapshot: {e}")
+        sleep(interval)
+
+
+def benchmark(count=200000, workers=4, path="/tmp/rewear-catalog-benchmark.snapshot"):
+    """Per-worker memory and warm-up: a per-process list of cards vs the shared snapshot."""
+    import pickle
+    import random
+    from time import perf_counter
+
+    rng = random.Random(3)
+    categories = {"Tops": ["T-Shirts", "Shirts", "Sweaters"], "Bottoms": ["Jeans", "Skirts", "Shorts"],
+                  "Dresses": ["Casual", "Formal"], "Outerwear": ["Jackets", "Coats"]}
+    now = datetime.utcnow()
+    rows = []
+    for pid in range(count, 0, -1):
+        category = rng.choice(list(categories))
+        rows.append((pid, f"Pre-loved {rng.choice(categories[category]).lower()} #{pid}", category,
+                     rng.choice(categories[category]), rng.randrange(10, 200),
+                     rng.choice(["New", "Like New", "Good", "Fair"]), pid % 50 == 0,
+                     f"/static/uploads/products/{pid:08x}.jpg", now - timedelta(minutes=pid), pid % 97))
+
+    started = perf_counter()
+    data = encode(rows, 1)
+    encode_seconds = perf_counter() - started
+    with open(path, "wb") as f:
+        f.write(data)
+
+    def memory():
+        fields = {}
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if parts[0] in ("Rss:", "Pss:"):
+                    fields[parts[0][:-1]] = int(parts[1])
+        return fields
+
+    def child(mode, write_end):
+        baseline = memory()
+        started = perf_counter()
+        if mode == "cache":
+            # What every worker does today: fetch the catalog into its own objects
+            # (unpickling stands in for the database round trip and row decoding)
+            cache = [CatalogCard(*row) for row in pickle.loads(fetched)]
+            index = {card.pid: card for card in cache}
+            first = index[count // 2]
+        else:
+            snapshot = CatalogSnapshot(path)
+            first = snapshot.get(count // 2)
+        warm_up = perf_counter() - started
+
+        # Serve a full catalog walk so every page is touched
+        started = perf_counter()
+        if mode == "cache":
+            total = sum(card.point_value for card in cache)
+        else:
+            total = sum(snapshot.card(row).point_value for row in range(len(snapshot)))
+        walk = perf_counter() - started
+        after = memory()
+        os.write(write_end, json.dumps({
+            "warm_up": warm_up, "walk": walk, "check": total + first.pid,
+            "rss": after["Rss"] - baseline["Rss"], "pss": after["Pss"] - baseline["Pss"],
+        }).encode())
+        os._exit(0)
+
+    fetched = pickle.dumps(rows)
+    results = {}
+    for mode in ("cache", "snapshot"):
+        samples = []
+        pipes = []
+        for _ in range(workers):
+            read_end, write_end = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                os.close(read_end)
+                child(mode, write_end)
+            os.close(write_end)
+            pipes.append((pid, read_end))
+        for pid, read_end in pipes:
+            chunks = []
+            while True:
+                chunk = os.read(read_end, 65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            os.close(read_end)
+            os.waitpid(pid, 0)
+            samples.append(json.loads(b"".join(chunks)))
+        results[mode] = samples
+
+    print(f"{count:,} products: snapshot {len(data) / 1e6:.1f} MB, encoded in {encode_seconds:.2f} s")
+    print(f"{'mode':<10}{'warm-up ms':>12}{'walk ms':>10}{'RSS MB':>9}{'PSS MB':>9}   (per worker, {workers} workers)")
+    for mode, samples in results.items():
+        def mean(key):
+            return sum(sample[key] for sample in samples) / len(samples)
+        print(f"{mode:<10}{mean('warm_up') * 1000:>12.1f}{mean('walk') * 1000:>10.1f}"
+              f"{mean('rss') / 1024:>9.1f}{mean('pss') / 1024:>9.1f}")
+    os.unlink(path)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Catalog snapshot tools")
+    parser.add_argument("--writer", action="store_true", help="keep the snapshot current")
+    parser.add_argument("--write-once", action="store_true")
+    parser.add_argument("--benchmark", type=int, metavar="PRODUCTS")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.write_once:
+        print("wrote v%s (%s products)" % write_snapshot())
+    if args.writer:
+        run_writer()
+    if args.benchmark:
+        benchmark(args.benchmark, args.workers)
@@ -0,0 +1,178 @@
+"""Chaos test for overload protection: slow the database, check browse latency.
+
+Puts a TCP proxy between the app and Postgres that delays every packet from
+the database by --db-delay-ms, starts gunicorn against the proxy and runs a
+mix of cheap browse requests and expensive admin requests, first with the
+proxy passing traffic straight through and then with the delay on. Reports
+per-class latency percentiles and 503s, and exits non-zero when browse p99
+under the slowed database exceeds --max-browse-p99-ms.
+
+    python chaos.py --db-delay-ms 200 --admin-cookie "session=..."
+
+Needs a reachable Postgres configured through the usual DB_* variables.
+"""
+import argparse
+import asyncio
+import os
+import shlex
+import signal
+import subprocess
+import sys
+import threading
+import time
+from loadtest import fetch, wait_for_port, percentile
+
+DEFAULT_BROWSE = ["/", "/product/1", "/api/v1/products", "/api/suggest?q=de"]
+DEFAULT_EXPENSIVE = ["/admin", "/admin/search/users?q=test", "/admin/export/transactions.csv"]
+
+
+class DelayProxy:
+    """TCP proxy adding `delay` seconds to everything the upstream sends back."""
+
+    def __init__(self, upstream_host, upstream_port, port):
+        self.upstream = (upstream_host, upstream_port)
+        self.port = port
+        self.delay = 0.0
+        self.loop = asyncio.new_event_loop()
+        self.ready = threading.Event()
+
+    async def _pipe(self, reader, writer, delayed):
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                if delayed and self.delay:
+                    await asyncio.sleep(self.delay)
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle(self, client_reader, client_writer):
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_connection(*self.upstream)
+        except OSError:
+            client_writer.close()
+            return
+        await asyncio.gather(
+            self._pipe(client_reader, upstream_writer, delayed=False),
+            self._pipe(upstream_reader, client_writer, delayed=True),
+        )
+
+    def _serve(self):
+        asyncio.set_event_loop(self.loop)
+        server = self.loop.run_until_complete(asyncio.start_server(self._handle, "127.0.0.1", self.port))
+        self.ready.set()
+        with server:
+            self.loop.run_forever()
+
+    def start(self):
+        threading.Thread(target=self._serve, name="delay-proxy", daemon=True).start()
+        self.ready.wait()
+
+
+async def client(host, port, paths, cookie, deadline, results, offset):
+    reader, writer = await asyncio.open_connection(host, port)
+    i = offset
+    try:
+        while time.perf_counter() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            request_bytes = (
+                f"GET {path} HTTP/1.1\r\nHost: {host}\r\nCookie: {cookie}\r\n"
+                "Connection: keep-alive\r\n\r\n"
+            ).encode()
+            start = time.perf_counter()
+            try:
+                status = await fetch(reader, writer, request_bytes)
+            except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+                # Streamed (chunked) responses and dropped connections: reconnect
+                results.append((time.perf_counter() - start, 0))
+                writer.close()
+                reader, writer = await asyncio.open_connection(host, port)
+                continue
+            results.append((time.perf_counter() - start, status))
+    finally:
+        writer.close()
+
+
+async def run_mix(port, args, duration):
+    browse, expensive = [], []
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(
+        *[client("127.0.0.1", port, args.browse, args.cookie, deadline, browse, n)
+          for n in range(args.browse_clients)],
+        *[client("127.0.0.1", port, args.expensive, args.admin_cookie, deadline, expensive, n)
+          for n in range(args.expensive_clients)],
+    )
+    return browse, expensive
+
+
+def summarize(label, results):
+    latencies = [latency for latency, _ in results]
+    shed = sum(1 for _, status in results if status == 503)
+    failed = sum(1 for _, status in results if status == 0 or (status >= 500 and status != 503))
+    return {
+        "phase": label,
+        "requests": len(results),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "503": shed,
+        "errors": failed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db-delay-ms", type=float, default=200)
+    parser.add_argument("--max-browse-p99-ms", type=float, default=2500)
+    parser.add_argument("--browse", nargs="+", default=DEFAULT_BROWSE)
+    parser.add_argument("--expensive", nargs="+", default=DEFAULT_EXPENSIVE)
+    parser.add_argument("--browse-clients", type=int, default=8)
+    parser.add_argument("--expensive-clients", type=int, default=16)
+    parser.add_argument("--cookie", default="", help="session cookie of a logged-in user")
+    parser.add_argument("--admin-cookie", default="", help="session cookie of an admin")
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--proxy-port", type=int, default=6543)
+    args = parser.parse_args()
+
+    proxy = DelayProxy(os.getenv("DB_HOST", "127.0.0.1"), int(os.getenv("DB_PORT", "5432")), args.proxy_port)
+    proxy.start()
+
+    env = dict(os.environ, DB_HOST="127.0.0.1", DB_PORT=str(args.proxy_port))
+    command = f"gunicorn --config gunicorn.conf.py --bind 127.0.0.1:{args.port} wsgi:app"
+    server = subprocess.Popen(shlex.split(command), cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+    try:
+        if not wait_for_port("127.0.0.1", args.port):
+            raise RuntimeError(f"server did not start: {command}")
+        asyncio.run(run_mix(args.port, args, 2))  # warm up
+
+        rows = []
+        browse, expensive = asyncio.run(run_mix(args.port, args, args.duration))
+        rows += [summarize("browse (normal)", browse), summarize("expensive (normal)", expensive)]
+
+        proxy.delay = args.db_delay_ms / 1000
+        browse, expensive = asyncio.run(run_mix(args.port, args, args.duration))
+        rows += [summarize("browse (slow db)", browse), summarize("expensive (slow db)", expensive)]
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+
+    print(f"database delay {args.db_delay_ms:.0f} ms per round trip")
+    print(f"{'phase':<22}{'req':>8}{'p50 ms':>10}{'p99 ms':>10}{'503':>7}{'err':>6}")
+    for r in rows:
+        print(f"{r['phase']:<22}{r['requests']:>8}{r['p50_ms']:>10.1f}{r['p99_ms']:>10.1f}{r['503']:>7}{r['errors']:>6}")
+
+    slowed_browse = rows[2]
+    if slowed_browse["p99_ms"] > args.max_browse_p99_ms:
+        print(f"FAIL: browse p99 {slowed_browse['p99_ms']:.0f} ms > {args.max_browse_p99_ms:.0f} ms")
+        sys.exit(1)
+    print(f"OK: browse p99 stayed under {args.max_browse_p99_ms:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
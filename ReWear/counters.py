@@ -0,0 +1,240 @@
+"""Write-behind counters for product views and user logins.
+
+Views and logins are recorded in a per-process buffer (a dict keyed by pid /
+uid, so a hot product costs one row per flush however many views it gets)
+and written every FLUSH_INTERVAL seconds by a background thread with one
+set-based UPDATE ... FROM (VALUES ...) per table and chunk (on SQLite, an
+executemany of the same UPDATE per row). A crash loses at most the views and
+logins of the current interval; a failed flush is merged back into the buffer
+and retried with the next one, up to MAX_FLUSH_FAILURES times in a row, after
+which the pending counts are dropped and logged.
+
+Trending is an exponentially time-decayed view count with a half-life of
+TRENDING_HALF_LIFE_HOURS. Rather than decaying every row on a schedule, each
+view is weighted by exp(DECAY_RATE * (t - TRENDING_EPOCH)) and products keep
+the log of the weighted sum in trending_score. Ordering by that column is the
+same as ordering by the decayed score at any moment, so the ranking is a plain
+index scan; decayed_score() turns a stored value into today's score.
+"""
+import atexit
+import math
+import os
+import threading
+from datetime import datetime
+from types import SimpleNamespace
+from sqlalchemy import update, values, column, bindparam, case, func, Integer, Float, DateTime
+from database import engine, Product, User
+
+FLUSH_INTERVAL = float(os.getenv("COUNTER_FLUSH_INTERVAL", "5"))
+TRENDING_HALF_LIFE_HOURS = float(os.getenv("TRENDING_HALF_LIFE_HOURS", "24"))
+DECAY_RATE = math.log(2) / (TRENDING_HALF_LIFE_HOURS * 3600)
+TRENDING_EPOCH = datetime(2025, 1, 1)
+CHUNK_SIZE = 1000
+# Consecutive failed flushes after which the pending counts are dropped rather than retried
+MAX_FLUSH_FAILURES = int(os.getenv("COUNTER_MAX_FLUSH_FAILURES", "5"))
+
+# exp() arguments below this are treated as zero (keeps Postgres clear of float underflow)
+MAX_LOG_GAP = 700
+
+
+def log_weight(at):
+    return DECAY_RATE * (at - TRENDING_EPOCH).total_seconds()
+
+
+def logaddexp(a, b):
+    high, low = (a, b) if a >= b else (b, a)
+    return high + math.log1p(math.exp(max(low - high, -MAX_LOG_GAP)))
+
+
+def decayed_score(trending_score, now=None):
+    """A stored trending_score as decayed views at `now`."""
+    if trending_score is None:
+        return 0.0
+    return math.exp(trending_score - log_weight(now or datetime.utcnow()))
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _greatest(dialect, current, new):
+    if dialect == "postgresql":
+        return func.greatest(current, new)
+    # SQLite's multi-argument max() is its greatest(), but it returns NULL if any argument is
+    return func.max(func.coalesce(current, new), new)
+
+
+def _least(dialect, a, b):
+    return func.least(a, b) if dialect == "postgresql" else func.min(a, b)
+
+
+def views_update(rows, dialect="postgresql"):
+    """UPDATE products from (pid, views, log score, last seen) rows; returns (statement, parameters).
+
+    Postgres gets one UPDATE ... FROM (VALUES ...). SQLite has no column list
+    for a VALUES alias, so there it is an executemany of per-row UPDATEs.
+    """
+    if dialect == "postgresql":
+        batch = values(
+            column("pid", Integer), column("views", Integer), column("score", Float), column("seen_at", DateTime),
+            name="batch"
+        ).data(rows).c
+        parameters = None
+    else:
+        batch = SimpleNamespace(pid=bindparam("b_pid", type_=Integer), views=bindparam("b_views", type_=Integer),
+                                score=bindparam("b_score", type_=Float), seen_at=bindparam("b_seen_at", type_=DateTime))
+        parameters = [{"b_pid": pid, "b_views": views, "b_score": score, "b_seen_at": seen_at}
+                      for pid, views, score, seen_at in rows]
+    gap = _least(dialect, func.abs(Product.trending_score - batch.score), MAX_LOG_GAP)
+    statement = (
+        update(Product)
+        .where(Product.pid == batch.pid)
+        .values(
+            view_count=func.coalesce(Product.view_count, 0) + batch.views,
+            trending_score=case(
+                (Product.trending_score.is_(None), batch.score),
+                else_=_greatest(dialect, Product.trending_score, batch.score) + func.ln(1 + func.exp(-gap))
+            ),
+            last_viewed_at=_greatest(dialect, Product.last_viewed_at, batch.seen_at),
+            # Views aren't edits: leave updated_at (and the page ETags) alone
+            updated_at=Product.updated_at,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return statement, parameters
+
+
+def logins_update(rows, dialect="postgresql"):
+    """UPDATE users from (uid, last login) rows; returns (statement, parameters) as views_update does."""
+    if dialect == "postgresql":
+        batch = values(column("uid", Integer), column("seen_at", DateTime), name="batch").data(rows).c
+        parameters = None
+    else:
+        batch = SimpleNamespace(uid=bindparam("b_uid", type_=Integer), seen_at=bindparam("b_seen_at", type_=DateTime))
+        parameters = [{"b_uid": uid, "b_seen_at": seen_at} for uid, seen_at in rows]
+    statement = (
+        update(User)
+        .where(User.uid == batch.uid)
+        .values(last_login=_greatest(dialect, User.last_login, batch.seen_at))
+        .execution_options(synchronize_session=False)
+    )
+    return statement, parameters
+
+
+class WriteBehindBuffer:
+    def __init__(self, interval=FLUSH_INTERVAL):
+        self.interval = interval
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._views = {}   # pid -> [views, log score, last seen]
+        self._logins = {}  # uid -> last login
+        self._thread = None
+        self._stop = threading.Event()
+        self._failures = 0
+
+    def after_fork(self):
+        # The child got a copy of the parent's pending counts; the parent flushes those
+        self._reset()
+
+    def record_view(self, pid, at=None):
+        at = at or datetime.utcnow()
+        weight = log_weight(at)
+        with self._lock:
+            entry = self._views.get(pid)
+            if entry is None:
+                self._views[pid] = [1, weight, at]
+            else:
+                entry[0] += 1
+                entry[1] = logaddexp(entry[1], weight)
+                entry[2] = max(entry[2], at)
+        self._ensure_flusher()
+
+    def record_login(self, uid, at=None):
+        at = at or datetime.utcnow()
+        with self._lock:
+            if self._logins.get(uid) is None or at > self._logins[uid]:
+                self._logins[uid] = at
+        self._ensure_flusher()
+
+    def pending(self):
+        with self._lock:
+            return len(self._views), len(self._logins)
+
+    def _ensure_flusher(self):
+        if self._thread is not None or self.interval <= 0:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="counter-flusher", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def _merge_back(self, views, logins):
+        with self._lock:
+            for pid, (count, score, seen_at) in views.items():
+                entry = self._views.get(pid)
+                if entry is None:
+                    self._views[pid] = [count, score, seen_at]
+                else:
+                    entry[0] += count
+                    entry[1] = logaddexp(entry[1], score)
+                    entry[2] = max(entry[2], seen_at)
+            for uid, seen_at in logins.items():
+                if self._logins.get(uid) is None or seen_at > self._logins[uid]:
+                    self._logins[uid] = seen_at
+
+    def flush(self):
+        """Write everything buffered so far in one transaction; returns rows written."""
+        with self._lock:
+            views, self._views = self._views, {}
+            logins, self._logins = self._logins, {}
+        if not views and not logins:
+            return 0
+
+        # Sorted keys: concurrent flushes from several workers lock rows in the same order
+        view_rows = [(pid, count, score, seen_at) for pid, (count, score, seen_at) in sorted(views.items())]
+        login_rows = sorted(logins.items())
+        try:
+            with engine.begin() as conn:
+                dialect = conn.dialect.name
+                for chunk in _chunks(view_rows, CHUNK_SIZE):
+                    conn.execute(*views_update(chunk, dialect))
+                for chunk in _chunks(login_rows, CHUNK_SIZE):
+                    conn.execute(*logins_update(chunk, dialect))
+            self._failures = 0
+            return len(view_rows) + len(login_rows)
+        except Exception as e:
+            self._failures += 1
+            if self._failures >= MAX_FLUSH_FAILURES:
+                # A flush that keeps failing would otherwise grow the buffer forever
+                print(f"Error flushing counters, dropping {len(view_rows)} views and {len(login_rows)} "
+                      f"logins after {self._failures} attempts: {e}")
+                self._failures = 0
+            else:
+                print(f"Error flushing counters (attempt {self._failures}): {e}")
+                self._merge_back(views, logins)
+            return 0
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+
+buffer = WriteBehindBuffer()
+os.register_at_fork(after_in_child=buffer.after_fork)
+# Clean shutdowns (gunicorn worker exit, Ctrl-C) write the last partial interval
+atexit.register(buffer.close)
+
+
+def record_product_view(pid: int):
+    buffer.record_view(pid)
+
+
+def record_login(uid: int):
+    buffer.record_login(uid)
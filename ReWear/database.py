@@ -1,10 +1,14 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, DateTime, ForeignKey, CheckConstraint, Text
+from sqlalchemy import create_engine, Column, Integer, BigInteger, SmallInteger, String, Float, Boolean, Date, DateTime, LargeBinary, ForeignKey, CheckConstraint, Text, JSON, Index, inspect, text, func, insert, update, delete, select, case
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
+from collections import Counter
 from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
 import pytz
+from profiling import instrument_module, instrument_engine
+from overload import install_deadlines, guard_module, GuardedQueuePool
+from catalog_snapshot import current_snapshot
 
 
 load_dotenv()
@@ -18,12 +22,58 @@ DB_PORT = os.getenv("DB_PORT", "5432")
 DB_NAME = os.getenv("DB_NAME")
 
 
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Seconds to wait for a pooled connection / for a new connection to open, so a
+# slow database turns into quick errors instead of piled-up workers
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "2"))
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "5"))
+
+
 DATABASE_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?sslmode=require"
-engine = create_engine(DATABASE_URL)
+engine = create_engine(
+    DATABASE_URL,
+    poolclass=GuardedQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_pre_ping=True,
+    connect_args={"connect_timeout": DB_CONNECT_TIMEOUT}
+)
+# Per-request query deadlines (see overload.py)
+install_deadlines(engine)
 Base = declarative_base()
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def dispose_engine_after_fork():
+    """Forget pooled connections inherited from the parent process.
+
+    close=False leaves the sockets alone: they still belong to the parent,
+    and closing them here would break its connections too.
+    """
+    engine.dispose(close=False)
+
+# Any forking server (gunicorn, uwsgi, multiprocessing) gets a fresh pool per child
+os.register_at_fork(after_in_child=dispose_engine_after_fork)
+
+
+def prewarm_pool(connections: int = 2):
+    """Open a few pool connections up front so the first requests skip the TLS handshake."""
+    opened = []
+    try:
+        for _ in range(min(connections, DB_POOL_SIZE)):
+            opened.append(engine.connect())
+        return len(opened)
+    except Exception as e:
+        print(f"Error prewarming connection pool: {e}")
+        return len(opened)
+    finally:
+        # Closing a pooled connection returns it to the pool, still open
+        for conn in opened:
+            conn.close()
+
 class User(Base):
     __tablename__ = "users"
 
@@ -39,6 +89,7 @@ class User(Base):
     profile_img_url = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
     last_login = Column(DateTime)
+    unread_notifications = Column(Integer, default=0)
 
     # Relationships
     products = relationship("Product", back_populates="user")
@@ -65,7 +116,12 @@ class Product(Base):
     is_featured = Column(Boolean, default=False)
     featured_until = Column(DateTime)
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+    # Maintained by counters.py in batches; writing them never bumps updated_at
+    view_count = Column(Integer, default=0)
+    last_viewed_at = Column(DateTime)
+    trending_score = Column(Float, index=True)
 
     # Relationships
     user = relationship("User", back_populates="products")
@@ -83,10 +139,16 @@ class ProductImage(Base):
     __tablename__ = "product_images"
 
     image_id = Column(Integer, primary_key=True, index=True)
-    pid = Column(Integer, ForeignKey("products.pid", ondelete="CASCADE"), nullable=False)
+    pid = Column(Integer, ForeignKey("products.pid", ondelete="CASCADE"), nullable=False, index=True)
     image_url = Column(Text, nullable=False)
     is_primary = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    # Set for uploads handled by images.py; external URLs leave these empty
+    content_hash = Column(String(64), index=True)
+    width = Column(Integer)
+    height = Column(Integer)
+    variants = Column(JSON(none_as_null=True))  # [{"width": 320, "format": "webp", "url": "..."}, ...]
+    perceptual_hash = Column(BigInteger)  # 64-bit dHash (signed), see images.perceptual_hash
 
     # Relationship
     product = relationship("Product", back_populates="images")
@@ -96,15 +158,15 @@ class Transaction(Base):
 
     tid = Column(Integer, primary_key=True, index=True)
     transaction_type = Column(String(20), nullable=False)
-    requester_uid = Column(Integer, ForeignKey("users.uid", ondelete="SET NULL"))
-    receiver_uid = Column(Integer, ForeignKey("users.uid", ondelete="SET NULL"))
+    requester_uid = Column(Integer, ForeignKey("users.uid", ondelete="SET NULL"), index=True)
+    receiver_uid = Column(Integer, ForeignKey("users.uid", ondelete="SET NULL"), index=True)
     requester_pid = Column(Integer, ForeignKey("products.pid", ondelete="SET NULL"))
     receiver_pid = Column(Integer, ForeignKey("products.pid", ondelete="SET NULL"))
     points_exchanged = Column(Integer, default=0)
     status = Column(String(20), default="requested")
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    completed_at = Column(DateTime)
+    completed_at = Column(DateTime, index=True)
 
     # Relationships
     requester = relationship("User", foreign_keys=[requester_uid], back_populates="transactions_as_requester")
@@ -128,7 +190,7 @@ class PointTransaction(Base):
     transaction_type = Column(String(50), nullable=False)
     reference_id = Column(Integer)
     description = Column(Text)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
 
     # Relationship
     user = relationship("User", back_populates="point_transactions")
@@ -149,11 +211,174 @@ class Feedback(Base):
     reviewer = relationship("User", foreign_keys=[reviewer_uid], back_populates="feedback_given")
     reviewee = relationship("User", foreign_keys=[reviewee_uid], back_populates="feedback_received")
 
+class ListingFingerprint(Base):
+    """Near-duplicate signatures of a listing, maintained by duplicates.py."""
+    __tablename__ = "listing_fingerprints"
+
+    pid = Column(Integer, ForeignKey("products.pid", ondelete="CASCADE"), primary_key=True)
+    minhash = Column(LargeBinary)      # MinHash of title + description, uint32 little-endian
+    image_hash = Column(BigInteger)    # perceptual hash of the primary image
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class DuplicateBucket(Base):
+    """LSH index: listings sharing a (band, bucket) are near-duplicate candidates."""
+    __tablename__ = "duplicate_buckets"
+
+    band = Column(SmallInteger, primary_key=True)
+    bucket = Column(BigInteger, primary_key=True)
+    pid = Column(Integer, ForeignKey("products.pid", ondelete="CASCADE"), primary_key=True, index=True)
+
+class DuplicateFlag(Base):
+    __tablename__ = "duplicate_flags"
+
+    flag_id = Column(Integer, primary_key=True, index=True)
+    pid = Column(Integer, ForeignKey("products.pid", ondelete="CASCADE"), nullable=False, index=True)
+    duplicate_of = Column(Integer, ForeignKey("products.pid", ondelete="CASCADE"), nullable=False)
+    reason = Column(String(10), nullable=False)
+    similarity = Column(Float, nullable=False)
+    status = Column(String(20), default="open")
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        CheckConstraint("reason IN ('text', 'image')"),
+        CheckConstraint("status IN ('open', 'dismissed')"),
+    )
+
+class SavedSearch(Base):
+    """A user's alert criteria; None in a field matches anything."""
+    __tablename__ = "saved_searches"
+
+    search_id = Column(Integer, primary_key=True, index=True)
+    uid = Column(Integer, ForeignKey("users.uid", ondelete="CASCADE"), nullable=False, index=True)
+    category = Column(String(50))
+    size = Column(String(20))
+    condition = Column(String(50))
+    max_points = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class PricingVersion(Base):
+    """A complete set of pricing rules; exactly one version is active at a time (see pricing.py)."""
+    __tablename__ = "pricing_versions"
+
+    version_id = Column(Integer, primary_key=True, index=True)
+    note = Column(Text)
+    default_base_points = Column(Integer, nullable=False, default=30)
+    min_points = Column(Integer, nullable=False, default=10)
+    is_active = Column(Boolean, default=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    activated_at = Column(DateTime)
+
+class PricingRule(Base):
+    """One entry of a version: a category's base points, a subcategory modifier or a condition multiplier."""
+    __tablename__ = "pricing_rules"
+
+    version_id = Column(Integer, ForeignKey("pricing_versions.version_id", ondelete="CASCADE"), primary_key=True)
+    rule = Column(String(20), primary_key=True)
+    category = Column(String(50), primary_key=True, default="")
+    subcategory = Column(String(50), primary_key=True, default="")
+    condition = Column(String(50), primary_key=True, default="")
+    value = Column(Float, nullable=False)
+
+    __table_args__ = (
+        CheckConstraint("rule IN ('base', 'modifier', 'multiplier')"),
+    )
+
+# Daily rollups maintained by analytics.py; the admin dashboard reads only these
+class DailyTransactionStats(Base):
+    __tablename__ = "daily_transaction_stats"
+
+    day = Column(Date, primary_key=True)
+    transaction_type = Column(String(20), primary_key=True)
+    completed = Column(Integer, nullable=False, default=0)
+    points_exchanged = Column(BigInteger, nullable=False, default=0)
+
+class DailyPointStats(Base):
+    __tablename__ = "daily_point_stats"
+
+    day = Column(Date, primary_key=True)
+    transaction_type = Column(String(50), primary_key=True)
+    entries = Column(Integer, nullable=False, default=0)
+    minted = Column(BigInteger, nullable=False, default=0)
+    burned = Column(BigInteger, nullable=False, default=0)
+
+class DailyCategoryFlow(Base):
+    """Completed transactions by what the requester gave ('points' for redemptions) and received."""
+    __tablename__ = "daily_category_flow"
+
+    day = Column(Date, primary_key=True)
+    transaction_type = Column(String(20), primary_key=True)
+    given_category = Column(String(50), primary_key=True)
+    received_category = Column(String(50), primary_key=True)
+    transactions = Column(Integer, nullable=False, default=0)
+
+class RollupWatermark(Base):
+    """How far each rollup has been refreshed (see analytics.py)."""
+    __tablename__ = "rollup_watermarks"
+
+    name = Column(String(50), primary_key=True)
+    high_water = Column(DateTime, nullable=False)
+    refreshed_at = Column(DateTime, default=datetime.utcnow)
+
+class TransactionSummary(Base):
+    """One row per (transaction, party): the order history as that user sees it.
+
+    Denormalized from transactions, products, product_images and users by
+    refresh_transaction_summaries() on every lifecycle transition, so the
+    history page is one range scan on (uid, created_at) with no joins.
+    """
+    __tablename__ = "transaction_summaries"
+
+    tid = Column(Integer, ForeignKey("transactions.tid", ondelete="CASCADE"), primary_key=True)
+    uid = Column(Integer, ForeignKey("users.uid", ondelete="CASCADE"), primary_key=True)
+    is_requester = Column(Boolean, nullable=False)
+    transaction_type = Column(String(20), nullable=False)
+    status = Column(String(20), nullable=False)
+    points_exchanged = Column(Integer, default=0)
+    created_at = Column(DateTime, nullable=False)
+    completed_at = Column(DateTime)
+    counterpart_uid = Column(Integer)
+    counterpart_name = Column(String(100))
+    requester_pid = Column(Integer)
+    requester_title = Column(String(100))
+    requester_point_value = Column(Integer)
+    requester_thumbnail_url = Column(Text)
+    receiver_pid = Column(Integer)
+    receiver_title = Column(String(100))
+    receiver_point_value = Column(Integer)
+    receiver_thumbnail_url = Column(Text)
+
+    __table_args__ = (
+        Index("ix_transaction_summaries_uid_created_at", "uid", "created_at"),
+        # Image uploads and variant renders rewrite the thumbnails of every summary showing the product
+        Index("ix_transaction_summaries_requester_pid", "requester_pid"),
+        Index("ix_transaction_summaries_receiver_pid", "receiver_pid"),
+    )
+
+class OutboxEvent(Base):
+    """A domain event committed with the change it describes; outbox.py runs its side effects."""
+    __tablename__ = "outbox_events"
+
+    event_id = Column(Integer, primary_key=True, index=True)
+    event_type = Column(String(50), nullable=False)
+    aggregate_id = Column(Integer, nullable=False)
+    payload = Column(JSON(none_as_null=True))
+    created_at = Column(DateTime, default=datetime.utcnow)
+    processed_at = Column(DateTime)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime)  # set after a failure: not retried before then
+    last_error = Column(Text)
+
+    __table_args__ = (
+        # The dispatcher's queue: only undelivered events are indexed
+        Index("ix_outbox_events_pending", "event_id",
+              postgresql_where=text("processed_at IS NULL"), sqlite_where=text("processed_at IS NULL")),
+    )
+
 class Notification(Base):
     __tablename__ = "notifications"
 
     notification_id = Column(Integer, primary_key=True, index=True)
-    uid = Column(Integer, ForeignKey("users.uid", ondelete="CASCADE"), nullable=False)
+    uid = Column(Integer, ForeignKey("users.uid", ondelete="CASCADE"), nullable=False, index=True)
     message = Column(Text, nullable=False)
     is_read = Column(Boolean, default=False)
     notification_type = Column(String(50), nullable=False)
@@ -173,7 +398,28 @@ def get_db():
 
 
 def init_db():
+    from admin_search import ensure_search_indexes
+    from pricing import ensure_default_version
+
     Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+    ensure_search_indexes()
+    ensure_default_version()
+
+def add_missing_columns():
+    """create_all() never alters existing tables; add new (nullable) columns and any new indexes."""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
 
 def create_user(name: str, email: str, password: str):
     db = SessionLocal()
@@ -277,12 +523,21 @@ def create_product(uid: int, product_data: dict):
         )
         
         db.add(new_product)
+        db.flush()
+
+        # Near-duplicate check of the text (the image is checked once its hash is computed).
+        # A savepoint keeps a failed check from losing the listing.
+        from duplicates import fingerprint_listings
+        try:
+            with db.begin_nested():
+                fingerprint_listings(db, [(new_product.pid, new_product.title, new_product.description)])
+        except Exception as e:
+            print(f"Error checking product for duplicates: {e}")
+
+        # The listing bonus is delivered by outbox.py, committed with the listing itself
+        queue_event(db, "product_created", new_product.pid, {"uid": uid, "points": 10})
         db.commit()
-        db.refresh(new_product)
-        
-        # Add points for listing an item
-        add_points(uid, 10, "item_listing", new_product.pid, "Points for listing an item")
-        
+
         return new_product.pid
     except Exception as e:
         db.rollback()
@@ -291,18 +546,20 @@ def create_product(uid: int, product_data: dict):
     finally:
         db.close()
 
-def add_product_image(pid: int, image_url: str, is_primary: bool = False):
+def add_product_image(pid: int, image_url: str, is_primary: bool = False, content_hash: str = None):
     db = SessionLocal()
     try:
         new_image = ProductImage(
             pid=pid,
             image_url=image_url,
-            is_primary=is_primary
+            is_primary=is_primary,
+            content_hash=content_hash
         )
         
         db.add(new_image)
+        refresh_summary_thumbnails(db, pid)
         db.commit()
-        return True
+        return new_image.image_id
     except Exception as e:
         db.rollback()
         print(f"Error adding product image: {e}")
@@ -310,34 +567,67 @@ def add_product_image(pid: int, image_url: str, is_primary: bool = False):
     finally:
         db.close()
 
+def set_product_image_variants(image_id: int, width: int, height: int, variants: list, perceptual_hash: int = None):
+    db = SessionLocal()
+    try:
+        image = db.query(ProductImage).filter(ProductImage.image_id == image_id).first()
+        if not image:
+            return False
+
+        image.width = width
+        image.height = height
+        image.variants = variants
+        image.perceptual_hash = perceptual_hash
+        # Variants are rendered after the upload; point the order history at the new thumbnail
+        refresh_summary_thumbnails(db, image.pid)
+        db.commit()
+        return True
+    except Exception as e:
+        db.rollback()
+        print(f"Error setting product image variants: {e}")
+        return False
+    finally:
+        db.close()
+
+def get_image_variants_by_hash(content_hash: str):
+    """Variants already generated for identical image bytes, or None."""
+    db = SessionLocal()
+    try:
+        image = db.query(ProductImage).filter(
+            ProductImage.content_hash == content_hash,
+            ProductImage.variants.isnot(None)
+        ).first()
+        if not image:
+            return None
+        return {
+            "width": image.width,
+            "height": image.height,
+            "variants": image.variants,
+            "perceptual_hash": image.perceptual_hash
+        }
+    except Exception as e:
+        print(f"Error getting image variants: {e}")
+        return None
+    finally:
+        db.close()
+
 def approve_product(pid: int, admin_uid: int):
     db = SessionLocal()
     try:
         product = db.query(Product).filter(Product.pid == pid).first()
         if not product:
             return False
-            
-        # Update product status
+
+        # The status change and its event commit together; points, the owner's
+        # notification and saved-search alerts are delivered by outbox.py
         product.status = "available"
+        queue_event(db, "product_approved", product.pid, {
+            "uid": product.uid,
+            "point_value": product.point_value,
+            "title": product.title
+        })
         db.commit()
         
-        # Add points for approved item
-        add_points(
-            product.uid, 
-            product.point_value, 
-            "item_approved", 
-            product.pid, 
-            f"Points for approved item: {product.title}"
-        )
-        
-        # Create notification
-        create_notification(
-            product.uid,
-            f"Your item '{product.title}' has been approved!",
-            "product_approved",
-            product.pid
-        )
-        
         return True
     except Exception as e:
         db.rollback()
@@ -378,82 +668,127 @@ def get_product(pid: int):
     finally:
         db.close()
 
-def get_available_products(limit: int = 20, offset: int = 0, category: str = None):
+def get_products_by_ids(pids: list):
+    """Batch variant of get_product: two queries regardless of len(pids)."""
     db = SessionLocal()
     try:
-        query = db.query(Product).filter(Product.status == "available")
-        
-        # Apply category filter if provided
-        if category:
-            query = query.filter(Product.category == category)
-        
-        # Order by featured first, then creation date
-        query = query.order_by(Product.is_featured.desc(), Product.created_at.desc())
-        
-        # Apply pagination
-        products = query.limit(limit).offset(offset).all()
-        
-        result = []
+        if not pids:
+            return []
+
+        products = db.query(Product).filter(Product.pid.in_(pids)).all()
+        images = db.query(ProductImage).filter(
+            ProductImage.pid.in_(pids)
+        ).order_by(ProductImage.pid, ProductImage.image_id).all()
+
+        images_by_pid = {}
+        for img in images:
+            images_by_pid.setdefault(img.pid, []).append(
+                {"image_id": img.image_id, "url": img.image_url, "is_primary": img.is_primary}
+            )
+
+        by_pid = {}
         for product in products:
-            # Get primary image
-            primary_image = db.query(ProductImage).filter(
-                ProductImage.pid == product.pid,
-                ProductImage.is_primary == True
-            ).first()
-            
-            image_url = primary_image.image_url if primary_image else None
-            
-            result.append({
+            by_pid[product.pid] = {
                 "pid": product.pid,
+                "uid": product.uid,
                 "title": product.title,
+                "description": product.description,
                 "category": product.category,
                 "subcategory": product.subcategory,
-                "point_value": product.point_value,
+                "size": product.size,
                 "condition": product.condition,
+                "point_value": product.point_value,
+                "status": product.status,
                 "is_featured": product.is_featured,
-                "image_url": image_url
-            })
-        
-        return result
+                "created_at": product.created_at,
+                "images": images_by_pid.get(product.pid, [])
+            }
+
+        # Keep the caller's order, drop unknown ids
+        return [by_pid[pid] for pid in pids if pid in by_pid]
     except Exception as e:
-        print(f"Error getting available products: {e}")
+        print(f"Error getting products by ids: {e}")
         return []
     finally:
         db.close()
 
-def get_user_products(uid: int):
+def get_available_products(limit: int = 20, offset: int = 0, category: str = None):
+    from read_models import available_products
+
+    try:
+        # Featured first, then newest; one statement including the primary image
+        return [record._asdict() for record in available_products(limit, offset, category)]
+    except Exception as e:
+        print(f"Error getting available products: {e}")
+        return []
+
+def get_available_products_page(limit: int = 20, after: tuple = None, category: str = None):
+    """Keyset-paginated listing of available products, newest first.
+
+    `after` is the (created_at, pid) of the last row of the previous page.
+    Returns (rows, next_after); next_after is None on the last page.
+    """
+    # The shared snapshot (catalog_snapshot.py) answers without a query while it's fresh
+    snapshot = current_snapshot()
+    if snapshot is not None:
+        cards, next_after = snapshot.page(limit, after, category)
+        return [card.listing() for card in cards], next_after
+
     db = SessionLocal()
     try:
-        products = db.query(Product).filter(Product.uid == uid).all()
-        
+        query = db.query(Product).filter(Product.status == "available")
+
+        if category:
+            query = query.filter(Product.category == category)
+
+        if after:
+            created_at, pid = after
+            query = query.filter(
+                (Product.created_at < created_at) |
+                ((Product.created_at == created_at) & (Product.pid < pid))
+            )
+
+        # Fetch one extra row to know whether another page exists
+        products = query.order_by(
+            Product.created_at.desc(), Product.pid.desc()
+        ).limit(limit + 1).all()
+
+        has_more = len(products) > limit
+        products = products[:limit]
+
+        image_urls = get_primary_image_urls(db, [product.pid for product in products], fallback=False)
+
         result = []
         for product in products:
-            # Get primary image
-            primary_image = db.query(ProductImage).filter(
-                ProductImage.pid == product.pid,
-                ProductImage.is_primary == True
-            ).first()
-            
-            image_url = primary_image.image_url if primary_image else None
-            
             result.append({
                 "pid": product.pid,
                 "title": product.title,
                 "category": product.category,
                 "subcategory": product.subcategory,
                 "point_value": product.point_value,
-                "status": product.status,
                 "condition": product.condition,
-                "image_url": image_url
+                "is_featured": product.is_featured,
+                "created_at": product.created_at,
+                "image_url": image_urls.get(product.pid)
             })
-        
-        return result
+
+        next_after = (products[-1].created_at, products[-1].pid) if has_more else None
+        return result, next_after
     except Exception as e:
-        print(f"Error getting user products: {e}")
-        return []
+        print(f"Error getting available products page: {e}")
+        return [], None
     finally:
         db.close()
 
+def get_user_products(uid: int):
+    from read_models import user_products
+
+    try:
+        return [record._asdict() for record in user_products(uid)]
+    except Exception as e:
+        print(f"Error getting user products: {e}")
+        return []
+
 # Transaction operations
 def create_swap_request(requester_uid: int, receiver_pid: int, requester_pid: int):
     db = SessionLocal()
@@ -498,17 +833,16 @@ def create_swap_request(requester_uid: int, receiver_pid: int, requester_pid: in
             "Swap request fee"
         )
         
-        # Update product status
+        # Update product status and notify the receiver
         requester_product.status = "reserved"
-        db.commit()
-        
-        # Create notification for receiver
-        create_notification(
+        queue_notifications(db, [(
             receiver_product.uid,
             f"You have a new swap request for your item '{receiver_product.title}'",
             "swap_request",
             new_transaction.tid
-        )
+        )])
+        refresh_transaction_summaries(db, [new_transaction.tid])
+        db.commit()
         
         return new_transaction.tid
     except Exception as e:
@@ -559,17 +893,16 @@ def create_redemption_request(requester_uid: int, product_pid: int):
             f"Redemption of item: {product.title}"
         )
         
-        # Update product status
+        # Update product status and notify the receiver
         product.status = "reserved"
-        db.commit()
-        
-        # Create notification for receiver
-        create_notification(
+        queue_notifications(db, [(
             product.uid,
             f"Someone wants to redeem your item '{product.title}' with points",
             "redemption_request",
             new_transaction.tid
-        )
+        )])
+        refresh_transaction_summaries(db, [new_transaction.tid])
+        db.commit()
         
         return new_transaction.tid
     except Exception as e:
@@ -587,18 +920,17 @@ def accept_transaction(tid: int):
         if not transaction or transaction.status != "requested":
             return False
             
-        # Update transaction status
+        # Update transaction status and notify the requester
         transaction.status = "accepted"
         transaction.updated_at = datetime.utcnow()
-        db.commit()
-        
-        # Create notification for requester
-        create_notification(
+        queue_notifications(db, [(
             transaction.requester_uid,
             f"Your transaction request has been accepted!",
             "transaction_accepted",
             transaction.tid
-        )
+        )])
+        refresh_transaction_summaries(db, [transaction.tid])
+        db.commit()
         
         return True
     except Exception as e:
@@ -619,7 +951,6 @@ def complete_transaction(tid: int):
         # Update transaction status
         transaction.status = "completed"
         transaction.completed_at = datetime.utcnow()
-        db.commit()
         
         # Handle based on transaction type
         if transaction.transaction_type == "swap":
@@ -633,17 +964,7 @@ def complete_transaction(tid: int):
             
             receiver_product.status = "swapped"
             receiver_product.uid = transaction.requester_uid
-            
-            db.commit()
-            
-            # Award points for successful swap to seller
-            add_points(
-                transaction.receiver_uid, 
-                20, 
-                "successful_swap", 
-                transaction.tid, 
-                "Bonus for completing a swap"
-            )
+            point_value, title = None, None
             
         elif transaction.transaction_type == "redemption":
             # Get the product
@@ -652,32 +973,19 @@ def complete_transaction(tid: int):
             # Update product status and ownership
             product.status = "redeemed"
             product.uid = transaction.requester_uid
-            
-            db.commit()
-            
-            # Award points to seller (original product value)
-            add_points(
-                transaction.receiver_uid, 
-                product.point_value, 
-                "item_redeemed", 
-                transaction.tid, 
-                f"Points for redeemed item: {product.title}"
-            )
-        
-        # Create notifications
-        create_notification(
-            transaction.requester_uid,
-            "Your transaction has been completed successfully!",
-            "transaction_completed",
-            transaction.tid
-        )
-        
-        create_notification(
-            transaction.receiver_uid,
-            "Your transaction has been completed successfully!",
-            "transaction_completed",
-            transaction.tid
-        )
+            point_value, title = product.point_value, product.title
+        
+        # One commit for the state change and its event; the seller's points and
+        # both parties' notifications are delivered by outbox.py
+        queue_event(db, "transaction_completed", transaction.tid, {
+            "transaction_type": transaction.transaction_type,
+            "requester_uid": transaction.requester_uid,
+            "receiver_uid": transaction.receiver_uid,
+            "point_value": point_value,
+            "title": title
+        })
+        refresh_transaction_summaries(db, [transaction.tid])
+        db.commit()
         
         return True
     except Exception as e:
@@ -698,31 +1006,14 @@ def reject_transaction(tid: int):
         # Update transaction status
         transaction.status = "rejected"
         transaction.updated_at = datetime.utcnow()
-        db.commit()
-        
-        # Refund points if it's a redemption
+
+        # Refund the redemption cost, or the swap fee
         if transaction.transaction_type == "redemption":
-            # Refund the redemption cost
             product = db.query(Product).filter(Product.pid == transaction.receiver_pid).first()
-            redemption_cost = int(product.point_value * 1.5)
-            
-            add_points(
-                transaction.requester_uid, 
-                redemption_cost, 
-                "redemption_refund", 
-                transaction.tid, 
-                "Refund for rejected redemption"
-            )
+            refund = int(product.point_value * 1.5)
         else:
-            # Refund the swap fee
-            add_points(
-                transaction.requester_uid, 
-                5, 
-                "swap_fee_refund", 
-                transaction.tid, 
-                "Refund for rejected swap request"
-            )
-        
+            refund = 5
+
         # Update product status back to available
         if transaction.transaction_type == "swap":
             requester_product = db.query(Product).filter(Product.pid == transaction.requester_pid).first()
@@ -730,17 +1021,17 @@ def reject_transaction(tid: int):
         
         receiver_product = db.query(Product).filter(Product.pid == transaction.receiver_pid).first()
         receiver_product.status = "available"
-        
+
+        # One commit for the state change and its event; the refund and the
+        # requester's notification are delivered by outbox.py
+        queue_event(db, "transaction_rejected", transaction.tid, {
+            "transaction_type": transaction.transaction_type,
+            "requester_uid": transaction.requester_uid,
+            "refund": refund
+        })
+        refresh_transaction_summaries(db, [transaction.tid])
         db.commit()
         
-        # Create notification
-        create_notification(
-            transaction.requester_uid,
-            "Your transaction request has been rejected.",
-            "transaction_rejected",
-            transaction.tid
-        )
-        
         return True
     except Exception as e:
         db.rollback()
@@ -750,56 +1041,207 @@ def reject_transaction(tid: int):
         db.close()
 
 def get_user_transactions(uid: int):
-    db = SessionLocal()
+    from read_models import user_transactions
+
     try:
-        # Get transactions where user is either requester or receiver
-        transactions = db.query(Transaction).filter(
-            (Transaction.requester_uid == uid) | (Transaction.receiver_uid == uid)
-        ).order_by(Transaction.created_at.desc()).all()
-        
+        # Both products and their images come back in the same row
         result = []
-        for transaction in transactions:
-            # Get product details
-            requester_product = None
-            receiver_product = None
-            
-            if transaction.requester_pid:
-                requester_product = db.query(Product).filter(Product.pid == transaction.requester_pid).first()
-            
-            if transaction.receiver_pid:
-                receiver_product = db.query(Product).filter(Product.pid == transaction.receiver_pid).first()
-            
-            # Determine if user is requester or receiver
-            is_requester = (transaction.requester_uid == uid)
-            
+        for t in user_transactions(uid):
+            is_requester = (t.requester_uid == uid)
             result.append({
-                "tid": transaction.tid,
-                "transaction_type": transaction.transaction_type,
-                "status": transaction.status,
-                "created_at": transaction.created_at,
-                "completed_at": transaction.completed_at,
-                "points_exchanged": transaction.points_exchanged,
+                "tid": t.tid,
+                "transaction_type": t.transaction_type,
+                "status": t.status,
+                "created_at": t.created_at,
+                "completed_at": t.completed_at,
+                "points_exchanged": t.points_exchanged,
                 "is_requester": is_requester,
-                "other_user_id": transaction.receiver_uid if is_requester else transaction.requester_uid,
+                "other_user_id": t.receiver_uid if is_requester else t.requester_uid,
                 "requester_product": {
-                    "pid": requester_product.pid,
-                    "title": requester_product.title,
-                    "image_url": get_product_primary_image(requester_product.pid)
-                } if requester_product else None,
+                    "pid": t.requester_pid,
+                    "title": t.requester_title,
+                    "image_url": t.requester_image_url
+                } if t.requester_title is not None else None,
                 "receiver_product": {
-                    "pid": receiver_product.pid,
-                    "title": receiver_product.title,
-                    "image_url": get_product_primary_image(receiver_product.pid)
-                } if receiver_product else None
+                    "pid": t.receiver_pid,
+                    "title": t.receiver_title,
+                    "image_url": t.receiver_image_url
+                } if t.receiver_title is not None else None
             })
-        
+
         return result
     except Exception as e:
         print(f"Error getting user transactions: {e}")
         return []
+
+# Saved search operations
+def create_saved_search(uid: int, category: str = None, size: str = None, condition: str = None, max_points: int = None):
+    db = SessionLocal()
+    try:
+        saved_search = SavedSearch(
+            uid=uid,
+            category=category or None,
+            size=size or None,
+            condition=condition or None,
+            max_points=max_points
+        )
+        db.add(saved_search)
+        db.commit()
+        db.refresh(saved_search)
+        return saved_search.search_id
+    except Exception as e:
+        db.rollback()
+        print(f"Error creating saved search: {e}")
+        return None
+    finally:
+        db.close()
+
+def delete_saved_search(search_id: int, uid: int):
+    db = SessionLocal()
+    try:
+        deleted = db.query(SavedSearch).filter(
+            SavedSearch.search_id == search_id, SavedSearch.uid == uid
+        ).delete(synchronize_session=False)
+        db.commit()
+        return deleted > 0
+    except Exception as e:
+        db.rollback()
+        print(f"Error deleting saved search: {e}")
+        return False
+    finally:
+        db.close()
+
+def get_user_saved_searches(uid: int):
+    db = SessionLocal()
+    try:
+        searches = db.query(SavedSearch).filter(SavedSearch.uid == uid).order_by(SavedSearch.created_at.desc()).all()
+        return [{
+            "search_id": search.search_id,
+            "category": search.category,
+            "size": search.size,
+            "condition": search.condition,
+            "max_points": search.max_points,
+            "created_at": search.created_at
+        } for search in searches]
+    except Exception as e:
+        print(f"Error getting saved searches: {e}")
+        return []
     finally:
         db.close()
 
+# Order history read model
+THUMBNAIL_WIDTH = 320
+
+def product_thumbnails(db, pids) -> dict:
+    """pid -> thumbnail url: the primary image (else the first), smallest variant that fits."""
+    from images import image_src
+
+    thumbnails = {}
+    if not pids:
+        return thumbnails
+    images = db.execute(
+        select(ProductImage.pid, ProductImage.image_url, ProductImage.variants)
+        .where(ProductImage.pid.in_(pids))
+        .order_by(ProductImage.pid, ProductImage.is_primary.desc(), ProductImage.image_id)
+    )
+    for image in images:
+        if image.pid not in thumbnails:
+            thumbnails[image.pid] = image_src(image, THUMBNAIL_WIDTH)
+    return thumbnails
+
+def refresh_summary_thumbnails(db, pid: int):
+    """Rewrite the thumbnail of `pid` in the summaries that show it, in the caller's session."""
+    db.flush()
+    url = product_thumbnails(db, [pid]).get(pid)
+    for pid_column, url_column in (("requester_pid", "requester_thumbnail_url"),
+                                   ("receiver_pid", "receiver_thumbnail_url")):
+        db.execute(
+            update(TransactionSummary)
+            .where(getattr(TransactionSummary, pid_column) == pid)
+            .values({url_column: url})
+            .execution_options(synchronize_session=False)
+        )
+
+def build_transaction_summaries(db, tids: list):
+    """transaction_summaries rows for `tids`, computed from the source tables.
+
+    Each transaction yields one row per party that still exists, seen from
+    that party's side (counterpart name and uid).
+    """
+    if not tids:
+        return []
+    from sqlalchemy.orm import aliased
+
+    requester, receiver = aliased(User), aliased(User)
+    requester_product, receiver_product = aliased(Product), aliased(Product)
+    transactions = db.execute(
+        select(
+            Transaction.tid, Transaction.transaction_type, Transaction.status, Transaction.points_exchanged,
+            Transaction.created_at, Transaction.completed_at,
+            Transaction.requester_uid, requester.name.label("requester_name"),
+            Transaction.receiver_uid, receiver.name.label("receiver_name"),
+            requester_product.pid.label("requester_pid"), requester_product.title.label("requester_title"),
+            requester_product.point_value.label("requester_point_value"),
+            receiver_product.pid.label("receiver_pid"), receiver_product.title.label("receiver_title"),
+            receiver_product.point_value.label("receiver_point_value"),
+        )
+        .outerjoin(requester, requester.uid == Transaction.requester_uid)
+        .outerjoin(receiver, receiver.uid == Transaction.receiver_uid)
+        .outerjoin(requester_product, requester_product.pid == Transaction.requester_pid)
+        .outerjoin(receiver_product, receiver_product.pid == Transaction.receiver_pid)
+        .where(Transaction.tid.in_(tids))
+    ).all()
+
+    thumbnails = product_thumbnails(
+        db, {pid for t in transactions for pid in (t.requester_pid, t.receiver_pid) if pid}
+    )
+
+    rows = []
+    for t in transactions:
+        parties = (
+            (t.requester_uid, True, t.receiver_uid, t.receiver_name),
+            (t.receiver_uid, False, t.requester_uid, t.requester_name),
+        )
+        for uid, is_requester, counterpart_uid, counterpart_name in parties:
+            if uid is None:
+                continue
+            rows.append({
+                "tid": t.tid,
+                "uid": uid,
+                "is_requester": is_requester,
+                "transaction_type": t.transaction_type,
+                "status": t.status,
+                "points_exchanged": t.points_exchanged,
+                "created_at": t.created_at,
+                "completed_at": t.completed_at,
+                "counterpart_uid": counterpart_uid,
+                "counterpart_name": counterpart_name,
+                "requester_pid": t.requester_pid,
+                "requester_title": t.requester_title,
+                "requester_point_value": t.requester_point_value,
+                "requester_thumbnail_url": thumbnails.get(t.requester_pid),
+                "receiver_pid": t.receiver_pid,
+                "receiver_title": t.receiver_title,
+                "receiver_point_value": t.receiver_point_value,
+                "receiver_thumbnail_url": thumbnails.get(t.receiver_pid),
+            })
+    return rows
+
+def refresh_transaction_summaries(db, tids: list):
+    """Rewrite the summaries of `tids` in the caller's session; they commit with it."""
+    tids = list(tids)
+    if not tids:
+        return 0
+    rows = build_transaction_summaries(db, tids)
+    db.execute(
+        delete(TransactionSummary)
+        .where(TransactionSummary.tid.in_(tids))
+        .execution_options(synchronize_session=False)
+    )
+    if rows:
+        db.execute(insert(TransactionSummary), rows)
+    return len(rows)
+
 # Points system operations
 def add_points(uid: int, amount: int, transaction_type: str, reference_id: int = None, description: str = None):
     db = SessionLocal()
@@ -833,29 +1275,49 @@ def add_points(uid: int, amount: int, transaction_type: str, reference_id: int =
     finally:
         db.close()
 
+def queue_point_transactions(db, entries: list):
+    """Add ledger rows and balance changes to the caller's session without committing.
+
+    `entries` is a list of (uid, amount, transaction_type, reference_id, description).
+    One executemany for the ledger, one UPDATE for all balances.
+    """
+    now = datetime.utcnow()
+    rows = [
+        {
+            "uid": uid,
+            "amount": amount,
+            "transaction_type": transaction_type,
+            "reference_id": reference_id,
+            "description": description,
+            "created_at": now
+        }
+        for uid, amount, transaction_type, reference_id, description in entries
+        if uid is not None
+    ]
+    if not rows:
+        return 0
+
+    db.execute(insert(PointTransaction), rows)
+
+    totals = Counter()
+    for row in rows:
+        totals[row["uid"]] += row["amount"]
+    db.execute(
+        update(User)
+        .where(User.uid.in_(list(totals)))
+        .values(points=User.points + case(totals, value=User.uid, else_=0))
+        .execution_options(synchronize_session=False)
+    )
+    return len(rows)
+
 def get_point_transactions(uid: int, limit: int = 20, offset: int = 0):
-    db = SessionLocal()
+    from read_models import point_transactions
+
     try:
-        transactions = db.query(PointTransaction).filter(
-            PointTransaction.uid == uid
-        ).order_by(PointTransaction.created_at.desc()).limit(limit).offset(offset).all()
-        
-        result = []
-        for transaction in transactions:
-            result.append({
-                "transaction_id": transaction.transaction_id,
-                "amount": transaction.amount,
-                "transaction_type": transaction.transaction_type,
-                "description": transaction.description,
-                "created_at": transaction.created_at
-            })
-        
-        return result
+        return [record._asdict() for record in point_transactions(uid, limit, offset)]
     except Exception as e:
         print(f"Error getting point transactions: {e}")
         return []
-    finally:
-        db.close()
 
 # Feedback operations
 def create_feedback(transaction_id: int, reviewer_uid: int, reviewee_uid: int, rating: int, comment: str = None):
@@ -924,17 +1386,62 @@ def get_user_rating(uid: int):
         db.close()
 
 # Notification operations
+NOTIFICATION_CHANNEL = "rewear_notifications"
+
+def queue_notifications(db, notifications: list):
+    """Add notifications to the caller's session; they commit (or roll back) with it.
+
+    `notifications` is a list of (uid, message, notification_type, reference_id)
+    tuples. Rows go in with one executemany and unread counters are bumped with
+    one UPDATE. On Postgres a pg_notify is issued in the same transaction, so
+    listeners only hear about committed notifications.
+    """
+    now = datetime.utcnow()
+    rows = [
+        {
+            "uid": uid,
+            "message": message,
+            "notification_type": notification_type,
+            "reference_id": reference_id,
+            "is_read": False,
+            "created_at": now
+        }
+        for uid, message, notification_type, reference_id in notifications
+        if uid is not None
+    ]
+    if not rows:
+        return 0
+
+    db.execute(insert(Notification), rows)
+
+    counts = Counter(row["uid"] for row in rows)
+    db.execute(
+        update(User)
+        .where(User.uid.in_(list(counts)))
+        .values(unread_notifications=func.coalesce(User.unread_notifications, 0) + case(counts, value=User.uid, else_=0))
+        .execution_options(synchronize_session=False)
+    )
+
+    # Picked up by notifications.py once the caller commits
+    db.info.setdefault("notified_uids", set()).update(counts)
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": NOTIFICATION_CHANNEL, "payload": ",".join(str(uid) for uid in counts)}
+        )
+
+    return len(rows)
+
+def queue_event(db, event_type: str, aggregate_id: int, payload: dict = None):
+    """Add a domain event to the caller's session; it commits (or rolls back) with the change it describes."""
+    db.add(OutboxEvent(event_type=event_type, aggregate_id=aggregate_id, payload=payload))
+    # Lets outbox.py wake its dispatcher once the caller commits
+    db.info["outbox_events"] = True
+
 def create_notification(uid: int, message: str, notification_type: str, reference_id: int = None):
     db = SessionLocal()
     try:
-        new_notification = Notification(
-            uid=uid,
-            message=message,
-            notification_type=notification_type,
-            reference_id=reference_id
-        )
-        
-        db.add(new_notification)
+        queue_notifications(db, [(uid, message, notification_type, reference_id)])
         db.commit()
         return True
     except Exception as e:
@@ -944,12 +1451,23 @@ def create_notification(uid: int, message: str, notification_type: str, referenc
     finally:
         db.close()
 
-def get_user_notifications(uid: int, limit: int = 20, offset: int = 0):
+def get_user_notifications(uid: int, limit: int = 20, offset: int = 0, before: tuple = None):
+    """Newest first. `before` is the (created_at, notification_id) of the last row of the previous page."""
     db = SessionLocal()
     try:
-        notifications = db.query(Notification).filter(
-            Notification.uid == uid
-        ).order_by(Notification.created_at.desc()).limit(limit).offset(offset).all()
+        query = db.query(Notification).filter(Notification.uid == uid)
+
+        # Keyset pagination on the same pair the rows are ordered by
+        if before:
+            created_at, notification_id = before
+            query = query.filter(
+                (Notification.created_at < created_at) |
+                ((Notification.created_at == created_at) & (Notification.notification_id < notification_id))
+            )
+
+        notifications = query.order_by(
+            Notification.created_at.desc(), Notification.notification_id.desc()
+        ).limit(limit).offset(offset).all()
         
         result = []
         for notification in notifications:
@@ -969,6 +1487,49 @@ def get_user_notifications(uid: int, limit: int = 20, offset: int = 0):
     finally:
         db.close()
 
+def get_notifications_after(uid: int, after_id: int = 0, limit: int = 50):
+    """Notifications newer than after_id, oldest first (for streaming)."""
+    db = SessionLocal()
+    try:
+        notifications = db.query(Notification).filter(
+            Notification.uid == uid,
+            Notification.notification_id > after_id
+        ).order_by(Notification.notification_id).limit(limit).all()
+
+        return [{
+            "notification_id": notification.notification_id,
+            "message": notification.message,
+            "is_read": notification.is_read,
+            "notification_type": notification.notification_type,
+            "reference_id": notification.reference_id,
+            "created_at": notification.created_at
+        } for notification in notifications]
+    except Exception as e:
+        print(f"Error getting new notifications: {e}")
+        return []
+    finally:
+        db.close()
+
+def get_latest_notification_id(uid: int):
+    db = SessionLocal()
+    try:
+        return db.query(func.max(Notification.notification_id)).filter(Notification.uid == uid).scalar() or 0
+    except Exception as e:
+        print(f"Error getting latest notification id: {e}")
+        return 0
+    finally:
+        db.close()
+
+def get_unread_count(uid: int):
+    db = SessionLocal()
+    try:
+        return db.query(User.unread_notifications).filter(User.uid == uid).scalar() or 0
+    except Exception as e:
+        print(f"Error getting unread count: {e}")
+        return 0
+    finally:
+        db.close()
+
 def mark_notification_read(notification_id: int):
     db = SessionLocal()
     try:
@@ -976,8 +1537,15 @@ def mark_notification_read(notification_id: int):
         
         if not notification:
             return False
-            
-        notification.is_read = True
+
+        if not notification.is_read:
+            notification.is_read = True
+            db.execute(
+                update(User)
+                .where(User.uid == notification.uid, User.unread_notifications > 0)
+                .values(unread_notifications=User.unread_notifications - 1)
+                .execution_options(synchronize_session=False)
+            )
         db.commit()
         return True
     except Exception as e:
@@ -987,42 +1555,127 @@ def mark_notification_read(notification_id: int):
     finally:
         db.close()
 
+def mark_all_notifications_read(uid: int):
+    """Mark every unread notification of a user as read; returns how many changed."""
+    db = SessionLocal()
+    try:
+        changed = db.execute(
+            update(Notification)
+            .where(Notification.uid == uid, Notification.is_read == False)
+            .values(is_read=True)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        # Take off only what was marked: a notification queued meanwhile keeps its count
+        if changed:
+            db.execute(
+                update(User)
+                .where(User.uid == uid)
+                .values(unread_notifications=case(
+                    (User.unread_notifications > changed, User.unread_notifications - changed), else_=0
+                ))
+                .execution_options(synchronize_session=False)
+            )
+        db.commit()
+        return changed
+    except Exception as e:
+        db.rollback()
+        print(f"Error marking notifications as read: {e}")
+        return 0
+    finally:
+        db.close()
+
 # Utility functions
+# Default pricing rules: seeded as the first pricing version (pricing.py) and
+# used whenever no version can be loaded. Base points by category
+BASE_POINTS = {
+    'Tops': 30,
+    'Bottoms': 35,
+    'Dresses': 45,
+    'Outerwear': 50
+}
+
+# Subcategory modifiers
+SUBCATEGORY_MODIFIERS = {
+    'Tops': {'Casual': -5, 'Formal': 10, 'Athletic': 0},
+    'Bottoms': {'Casual': -5, 'Formal': 10, 'Athletic': 0},
+    'Dresses': {'Casual': -10, 'Formal': 15, 'Evening': 25},
+    'Outerwear': {'Light': -10, 'Heavy': 10, 'Formal': 5}
+}
+
+# Condition multipliers
+CONDITION_MULTIPLIERS = {
+    'New with tags': 1.5,
+    'Like New': 1.25,
+    'Good': 1.0,
+    'Fair': 0.75
+}
+
 def calculate_points(category: str, subcategory: str, condition: str):
     """Calculate point value for an item based on its category, subcategory, and condition"""
-    # Base points by category
-    base_points = {
-        'Tops': 30,
-        'Bottoms': 35,
-        'Dresses': 45,
-        'Outerwear': 50
-    }
-    
-    # Subcategory modifiers
-    subcategory_modifiers = {
-        'Tops': {'Casual': -5, 'Formal': 10, 'Athletic': 0},
-        'Bottoms': {'Casual': -5, 'Formal': 10, 'Athletic': 0},
-        'Dresses': {'Casual': -10, 'Formal': 15, 'Evening': 25},
-        'Outerwear': {'Light': -10, 'Heavy': 10, 'Formal': 5}
-    }
-    
-    # Condition multipliers
-    condition_multipliers = {
-        'New with tags': 1.5,
-        'Like New': 1.25,
-        'Good': 1.0,
-        'Fair': 0.75
-    }
-    
-    # Calculate points
-    category_points = base_points.get(category, 30)
-    modifier = subcategory_modifiers.get(category, {}).get(subcategory, 0)
-    multiplier = condition_multipliers.get(condition, 1.0)
-    
-    total_points = int((category_points + modifier) * multiplier)
-    
-    # Ensure minimum points
-    return max(10, total_points)
+    from pricing import current_table
+
+    # Rules come from the active pricing version; the dicts above are the fallback
+    return current_table().points(category, subcategory, condition)
+
+def calculate_points_batch(categories, subcategories, conditions):
+    """calculate_points over whole columns at once; returns a NumPy int array."""
+    from pricing import current_table
+
+    return current_table().points_batch(categories, subcategories, conditions)
+
+def get_primary_image_urls(db, pids: list, fallback: bool = True):
+    """Map pid -> primary image url for many products with a single query.
+
+    With fallback=True a product without a primary image gets its first image,
+    mirroring get_product_primary_image.
+    """
+    if not pids:
+        return {}
+
+    query = db.query(ProductImage.pid, ProductImage.image_url).filter(ProductImage.pid.in_(pids))
+    if not fallback:
+        query = query.filter(ProductImage.is_primary == True)
+
+    rows = query.order_by(
+        ProductImage.pid, ProductImage.is_primary.desc(), ProductImage.image_id
+    ).all()
+
+    result = {}
+    for pid, image_url in rows:
+        result.setdefault(pid, image_url)
+    return result
+
+def get_product_freshness(pid: int):
+    """(updated_at, newest image created_at) for one product, or None if it doesn't exist.
+
+    Both come from indexed columns, so this is cheap enough to run before
+    deciding whether to render the page at all.
+    """
+    db = SessionLocal()
+    try:
+        newest_image = db.query(func.max(ProductImage.created_at)).filter(
+            ProductImage.pid == pid
+        ).scalar_subquery()
+        row = db.query(Product.updated_at, newest_image).filter(Product.pid == pid).first()
+        return tuple(row) if row else None
+    except Exception as e:
+        print(f"Error getting product freshness: {e}")
+        return None
+    finally:
+        db.close()
+
+def get_catalog_freshness():
+    """(newest product updated_at, newest image created_at) across the catalog."""
+    db = SessionLocal()
+    try:
+        newest_image = db.query(func.max(ProductImage.created_at)).scalar_subquery()
+        row = db.query(func.max(Product.updated_at), newest_image).first()
+        return tuple(row) if row else None
+    except Exception as e:
+        print(f"Error getting catalog freshness: {e}")
+        return None
+    finally:
+        db.close()
 
 def get_product_primary_image(pid: int):
     db = SessionLocal()
@@ -1046,6 +1699,12 @@ def get_product_primary_image(pid: int):
     finally:
         db.close()
 
+# Timing spans for every function above and every statement (see profiling.py)
+# Overload errors a helper logged and swallowed still reach the 503 handlers (overload.py)
+guard_module(globals(), __name__)
+instrument_module(globals(), __name__)
+instrument_engine(engine)
+
 if __name__ == "__main__":
     init_db()
     print("Database initialized successfully!")
\ No newline at end of file
@@ -0,0 +1,409 @@
+"""Near-duplicate listing detection.
+
+Two signals per listing, both stored in listing_fingerprints:
+
+* text: a MinHash signature (NUM_PERM permutations) of the character
+  shingles of title + description. The fraction of equal slots estimates
+  the Jaccard similarity of the two shingle sets.
+* image: the perceptual hash (dHash) of the primary image, computed in the
+  image pipeline (images.perceptual_hash).
+
+Both are banded into duplicate_buckets, a locality-sensitive hash index keyed
+by (band, bucket). Candidates for a new listing are the listings sharing at
+least one of its buckets, found with one primary-key lookup per band rather
+than a catalog scan; only those are compared exactly. Text uses 16 bands of
+4 rows (pairs around 0.5 similarity start to collide, 0.8 almost always do).
+Image hashes are split into 4 bands of 16 bits, so any two hashes within
+IMAGE_MAX_DISTANCE = 3 bits share a band.
+
+Matches are recorded in duplicate_flags against the older listing and shown
+in the admin moderation queue.
+
+    python duplicates.py backfill      # fingerprint existing listings and images
+"""
+import hashlib
+import re
+import zlib
+from sqlalchemy import select, delete, insert, update, bindparam, tuple_
+from overload import guard
+from database import (
+    SessionLocal,
+    Product,
+    ProductImage,
+    ListingFingerprint,
+    DuplicateBucket,
+    DuplicateFlag,
+)
+
+NUM_PERM = 64
+TEXT_BANDS = 16
+ROWS_PER_BAND = NUM_PERM // TEXT_BANDS
+SHINGLE_SIZE = 5
+TEXT_THRESHOLD = 0.8
+
+IMAGE_BAND_BASE = 100   # image bands are 100..103, text bands 0..15
+IMAGE_BANDS = 4
+IMAGE_MAX_DISTANCE = 3
+
+BATCH_SIZE = 1000
+MAX_CANDIDATES = 500    # per listing; a bucket this crowded is boilerplate, not a duplicate
+
+_PRIME = 4294967291     # largest prime below 2**32
+_permutations = None
+
+
+def _coefficients():
+    import numpy as np
+
+    global _permutations
+    if _permutations is None:
+        rng = np.random.default_rng(20250712)
+        _permutations = (
+            rng.integers(1, 2 ** 31, NUM_PERM, dtype=np.uint64),
+            rng.integers(0, 2 ** 31, NUM_PERM, dtype=np.uint64),
+        )
+    return _permutations
+
+
+def shingles(text):
+    text = re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", text.lower())).strip()
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def minhash(text):
+    """MinHash signature of a text as a uint32 array of NUM_PERM slots."""
+    import numpy as np
+
+    a, b = _coefficients()
+    hashes = np.fromiter((zlib.crc32(s.encode()) for s in shingles(text)), dtype=np.uint64)
+    # (a * h + b) mod p for every permutation x shingle, min per permutation
+    values = (np.outer(a, hashes) + b[:, None]) % _PRIME
+    return values.min(axis=1).astype(np.uint32)
+
+
+def text_similarity(signature, other):
+    import numpy as np
+
+    return float(np.count_nonzero(signature == other)) / NUM_PERM
+
+
+def text_buckets(signature):
+    """(band, bucket) pairs of a MinHash signature."""
+    return [
+        (band, int.from_bytes(
+            hashlib.blake2b(signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes(), digest_size=8).digest(),
+            "little", signed=True
+        ))
+        for band in range(TEXT_BANDS)
+    ]
+
+
+def image_buckets(image_hash):
+    unsigned = image_hash & ((1 << 64) - 1)
+    return [(IMAGE_BAND_BASE + band, (unsigned >> (16 * band)) & 0xFFFF) for band in range(IMAGE_BANDS)]
+
+
+def hamming(a, b):
+    return bin((a ^ b) & ((1 << 64) - 1)).count("1")
+
+
+def _candidates(db, buckets_by_pid):
+    """pid -> set of other pids sharing at least one bucket."""
+    owners = {}
+    for pid, buckets in buckets_by_pid.items():
+        for key in buckets:
+            owners.setdefault(key, set()).add(pid)
+
+    keys = list(owners)
+    found = {pid: set() for pid in buckets_by_pid}
+    for start in range(0, len(keys), BATCH_SIZE):
+        chunk = keys[start:start + BATCH_SIZE]
+        rows = db.execute(
+            select(DuplicateBucket.band, DuplicateBucket.bucket, DuplicateBucket.pid)
+            .where(tuple_(DuplicateBucket.band, DuplicateBucket.bucket).in_(chunk))
+        )
+        for band, bucket, other in rows:
+            for pid in owners[(band, bucket)]:
+                if other != pid:
+                    found[pid].add(other)
+
+    # Listings in the same batch can duplicate each other too
+    for members in owners.values():
+        if len(members) > 1:
+            for pid in members:
+                found[pid].update(members - {pid})
+
+    return {pid: set(sorted(others)[:MAX_CANDIDATES]) for pid, others in found.items()}
+
+
+def _replace_buckets(db, buckets_by_pid, bands):
+    pids = list(buckets_by_pid)
+    db.execute(
+        delete(DuplicateBucket)
+        .where(DuplicateBucket.pid.in_(pids), DuplicateBucket.band.in_(bands))
+        .execution_options(synchronize_session=False)
+    )
+    rows = [
+        {"band": band, "bucket": bucket, "pid": pid}
+        for pid, buckets in buckets_by_pid.items()
+        for band, bucket in set(buckets)
+    ]
+    if rows:
+        db.execute(insert(DuplicateBucket), rows)
+
+
+def _flag(db, matches, reason):
+    """Insert flags for (pid, duplicate_of, similarity) not already recorded; returns how many."""
+    if not matches:
+        return 0
+    pids = {pid for pid, _, _ in matches}
+    existing = set(db.execute(
+        select(DuplicateFlag.pid, DuplicateFlag.duplicate_of)
+        .where(DuplicateFlag.pid.in_(pids), DuplicateFlag.reason == reason)
+    ).all())
+    rows = [
+        {"pid": pid, "duplicate_of": other, "reason": reason, "similarity": similarity, "status": "open"}
+        for pid, other, similarity in matches
+        if (pid, other) not in existing
+    ]
+    if rows:
+        db.execute(insert(DuplicateFlag), rows)
+    return len(rows)
+
+
+def _upsert_fingerprints(db, values, field):
+    """Set one fingerprint column for many pids, creating rows as needed."""
+    table = ListingFingerprint.__table__
+    existing = set(db.scalars(select(ListingFingerprint.pid).where(ListingFingerprint.pid.in_(list(values)))))
+    if existing:
+        db.execute(
+            update(table).where(table.c.pid == bindparam("fingerprint_pid")).values({field: bindparam("value")}),
+            [{"fingerprint_pid": pid, "value": values[pid]} for pid in existing]
+        )
+    new_rows = [{"pid": pid, field: value} for pid, value in values.items() if pid not in existing]
+    if new_rows:
+        db.execute(insert(ListingFingerprint), new_rows)
+
+
+def fingerprint_listings(db, listings):
+    """Fingerprint (pid, title, description) listings in the caller's session and flag text duplicates.
+
+    A listing is flagged against older listings only (lower pid), so a pair
+    is reported once, on the newcomer. Returns the number of new flags.
+    """
+    import numpy as np
+
+    signatures = {pid: minhash(f"{title} {description}") for pid, title, description in listings}
+    if not signatures:
+        return 0
+    buckets = {pid: text_buckets(signature) for pid, signature in signatures.items()}
+    candidates = _candidates(db, buckets)
+
+    others = {other for found in candidates.values() for other in found if other not in signatures}
+    known = dict(signatures)
+    for start in range(0, len(others), BATCH_SIZE):
+        chunk = sorted(others)[start:start + BATCH_SIZE]
+        for pid, blob in db.execute(
+            select(ListingFingerprint.pid, ListingFingerprint.minhash)
+            .where(ListingFingerprint.pid.in_(chunk), ListingFingerprint.minhash.is_not(None))
+        ):
+            known[pid] = np.frombuffer(blob, dtype="<u4")
+
+    matches = []
+    for pid, found in candidates.items():
+        for other in found:
+            if other < pid and other in known:
+                similarity = text_similarity(signatures[pid], known[other])
+                if similarity >= TEXT_THRESHOLD:
+                    matches.append((pid, other, similarity))
+
+    _upsert_fingerprints(db, {pid: signature.astype("<u4").tobytes() for pid, signature in signatures.items()}, "minhash")
+    _replace_buckets(db, buckets, list(range(TEXT_BANDS)))
+    return _flag(db, matches, "text")
+
+
+def fingerprint_images(db, image_hashes):
+    """Record {pid: primary image perceptual hash} in the caller's session and flag image duplicates."""
+    image_hashes = {pid: value for pid, value in image_hashes.items() if value is not None}
+    if not image_hashes:
+        return 0
+    buckets = {pid: image_buckets(value) for pid, value in image_hashes.items()}
+    candidates = _candidates(db, buckets)
+
+    others = {other for found in candidates.values() for other in found if other not in image_hashes}
+    known = dict(image_hashes)
+    for start in range(0, len(others), BATCH_SIZE):
+        chunk = sorted(others)[start:start + BATCH_SIZE]
+        known.update(db.execute(
+            select(ListingFingerprint.pid, ListingFingerprint.image_hash)
+            .where(ListingFingerprint.pid.in_(chunk), ListingFingerprint.image_hash.is_not(None))
+        ).all())
+
+    matches = []
+    for pid, found in candidates.items():
+        for other in found:
+            if other < pid and other in known:
+                distance = hamming(image_hashes[pid], known[other])
+                if distance <= IMAGE_MAX_DISTANCE:
+                    matches.append((pid, other, 1 - distance / 64))
+
+    _upsert_fingerprints(db, image_hashes, "image_hash")
+    _replace_buckets(db, buckets, [IMAGE_BAND_BASE + band for band in range(IMAGE_BANDS)])
+    return _flag(db, matches, "image")
+
+
+def index_product_image(image_id: int):
+    """Image pipeline hook: check a product's primary image once its hash is known."""
+    db = SessionLocal()
+    try:
+        image = db.execute(
+            select(ProductImage.pid, ProductImage.is_primary, ProductImage.perceptual_hash)
+            .where(ProductImage.image_id == image_id)
+        ).first()
+        if not image or not image.is_primary or image.perceptual_hash is None:
+            return 0
+        flagged = fingerprint_images(db, {image.pid: image.perceptual_hash})
+        db.commit()
+        return flagged
+    except Exception as e:
+        db.rollback()
+        print(f"Error checking image for duplicates: {e}")
+        return 0
+    finally:
+        db.close()
+
+
+@guard
+def get_open_flags(pids):
+    """pid -> list of open flags for the moderation queue."""
+    if not pids:
+        return {}
+    db = SessionLocal()
+    try:
+        flags = {}
+        rows = db.execute(
+            select(DuplicateFlag.pid, DuplicateFlag.duplicate_of, DuplicateFlag.reason, DuplicateFlag.similarity)
+            .where(DuplicateFlag.pid.in_(list(pids)), DuplicateFlag.status == "open")
+            .order_by(DuplicateFlag.pid, DuplicateFlag.similarity.desc())
+        )
+        for pid, duplicate_of, reason, similarity in rows:
+            flags.setdefault(pid, []).append({"duplicate_of": duplicate_of, "reason": reason, "similarity": similarity})
+        return flags
+    except Exception as e:
+        print(f"Error getting duplicate flags: {e}")
+        return {}
+    finally:
+        db.close()
+
+
+def _hash_stored_image(store, content_hash, variants):
+    """Perceptual hash of an uploaded image, computed from its smallest stored JPEG variant."""
+    import os
+    import tempfile
+    from PIL import Image
+    from images import perceptual_hash, variant_key
+
+    widths = sorted(v["width"] for v in variants or [] if v["format"] == "jpg")
+    if not widths:
+        return None
+    fd, path = tempfile.mkstemp(prefix="rewear-phash-")
+    os.close(fd)
+    try:
+        store.download_file(variant_key(content_hash, widths[0], "jpg"), path)
+        with Image.open(path) as image:
+            return perceptual_hash(image.convert("RGB"))
+    finally:
+        os.remove(path)
+
+
+def backfill(batch_size=BATCH_SIZE):
+    """Fingerprint every listing and primary image that has none yet, in committed batches.
+
+    Listings are processed in pid order, so each is compared with everything
+    older, exactly as if it had just been submitted.
+    """
+    from images import get_store
+
+    report = {"listings": 0, "images": 0, "text_flags": 0, "image_flags": 0}
+    db = SessionLocal()
+    try:
+        last_pid = 0
+        while True:
+            rows = db.execute(
+                select(Product.pid, Product.title, Product.description)
+                .outerjoin(ListingFingerprint, ListingFingerprint.pid == Product.pid)
+                .where(Product.pid > last_pid, ListingFingerprint.minhash.is_(None))
+                .order_by(Product.pid)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            report["text_flags"] += fingerprint_listings(db, [tuple(row) for row in rows])
+            db.commit()
+            report["listings"] += len(rows)
+            last_pid = rows[-1].pid
+
+        # Images uploaded before perceptual hashes existed get one from their stored variant
+        store = get_store()
+        last_id = 0
+        while True:
+            images = db.execute(
+                select(ProductImage.image_id, ProductImage.pid, ProductImage.perceptual_hash,
+                       ProductImage.content_hash, ProductImage.variants)
+                .where(ProductImage.image_id > last_id, ProductImage.is_primary == True)
+                .order_by(ProductImage.image_id)
+                .limit(batch_size)
+            ).all()
+            if not images:
+                break
+            last_id = images[-1].image_id
+
+            hashes = {}
+            for image in images:
+                value = image.perceptual_hash
+                if value is None and image.content_hash and image.variants:
+                    try:
+                        value = _hash_stored_image(store, image.content_hash, image.variants)
+                    except Exception as e:
+                        print(f"Error hashing image {image.image_id}: {e}")
+                        continue
+                    db.query(ProductImage).filter(ProductImage.image_id == image.image_id).update(
+                        {ProductImage.perceptual_hash: value}, synchronize_session=False
+                    )
+                if value is not None:
+                    hashes[image.pid] = value
+
+            fingerprinted = set(db.scalars(
+                select(ListingFingerprint.pid).where(
+                    ListingFingerprint.pid.in_(list(hashes)), ListingFingerprint.image_hash.is_not(None)
+                )
+            ))
+            pending = {pid: value for pid, value in hashes.items() if pid not in fingerprinted}
+            report["image_flags"] += fingerprint_images(db, pending)
+            db.commit()
+            report["images"] += len(pending)
+        return report
+    except Exception as e:
+        db.rollback()
+        print(f"Error backfilling duplicate fingerprints: {e}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    from time import perf_counter
+
+    parser = argparse.ArgumentParser(description="Near-duplicate listing detection")
+    parser.add_argument("command", choices=("backfill",))
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    started = perf_counter()
+    result = backfill(args.batch_size)
+    print(f"fingerprinted {result['listings']} listings and {result['images']} images in "
+          f"{perf_counter() - started:.1f} s; flagged {result['text_flags']} text and "
+          f"{result['image_flags']} image duplicates")
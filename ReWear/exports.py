@@ -0,0 +1,168 @@
+"""Streaming CSV/JSONL exports for admins and accounting.
+
+Rows come from Core select()s of plain columns executed with
+stream_results/yield_per, which on psycopg2 means a server-side (named)
+cursor: the database hands rows over in batches and nothing ever holds the
+whole table. Each batch is formatted, optionally gzip-compressed, and
+yielded straight to the HTTP response or output file, so memory stays flat
+whatever the table size.
+
+    python exports.py ledger --format csv --gzip -o ledger.csv.gz
+    python exports.py --benchmark 10000000      # seed, export to /dev/null, clean up
+"""
+import csv
+import io
+import zlib
+from sqlalchemy import select
+from database import engine, User, Product, Transaction, PointTransaction
+from api import dumps
+
+BATCH_SIZE = 5000
+
+# Passwords and reset codes are deliberately left out of the users export
+EXPORTS = {
+    "users": select(
+        User.uid, User.name, User.email, User.role, User.points, User.created_at, User.last_login
+    ).order_by(User.uid),
+    "products": select(
+        Product.pid, Product.uid, Product.title, Product.category, Product.subcategory, Product.size,
+        Product.condition, Product.point_value, Product.status, Product.created_at, Product.updated_at
+    ).order_by(Product.pid),
+    "transactions": select(
+        Transaction.tid, Transaction.transaction_type, Transaction.requester_uid, Transaction.receiver_uid,
+        Transaction.requester_pid, Transaction.receiver_pid, Transaction.points_exchanged, Transaction.status,
+        Transaction.created_at, Transaction.completed_at
+    ).order_by(Transaction.tid),
+    "ledger": select(
+        PointTransaction.transaction_id, PointTransaction.uid, PointTransaction.amount,
+        PointTransaction.transaction_type, PointTransaction.reference_id, PointTransaction.description,
+        PointTransaction.created_at
+    ).order_by(PointTransaction.transaction_id),
+}
+FORMATS = ("csv", "jsonl")
+
+
+def iter_batches(name, batch_size=BATCH_SIZE):
+    """Yield (column names, list of row tuples) batches from a server-side cursor."""
+    statement = EXPORTS[name]
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(statement)
+        columns = list(result.keys())
+        for partition in result.partitions():
+            yield columns, partition
+
+
+def iter_export(name, fmt="csv", batch_size=BATCH_SIZE):
+    """Yield the export as encoded chunks, one per database batch."""
+    header_written = False
+    for columns, rows in iter_batches(name, batch_size):
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            if not header_written:
+                writer.writerow(columns)
+                header_written = True
+            writer.writerows(rows)
+            yield buffer.getvalue().encode("utf-8")
+        else:
+            yield b"".join(dumps(dict(zip(columns, row))) + b"\n" for row in rows)
+
+    # An empty table still gets its CSV header
+    if fmt == "csv" and not header_written:
+        yield (",".join(column.key for column in EXPORTS[name].selected_columns) + "\r\n").encode("utf-8")
+
+
+def gzip_stream(chunks, level=6):
+    """Gzip a stream of byte chunks incrementally (wbits=31 writes a gzip header)."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_filename(name, fmt, gzipped):
+    return f"rewear-{name}.{fmt}" + (".gz" if gzipped else "")
+
+
+def _seed_ledger(count, uid):
+    """Insert `count` synthetic ledger rows with one server-side statement (Postgres)."""
+    from sqlalchemy import text
+
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO point_transactions (uid, amount, transaction_type, reference_id, description, created_at) "
+            "SELECT :uid, (g % 50) - 25, 'export_benchmark', g, 'export benchmark row', now() "
+            "FROM generate_series(1, :count) AS g"
+        ), {"uid": uid, "count": count})
+
+
+def _drop_seeded_ledger():
+    from sqlalchemy import delete
+
+    with engine.begin() as conn:
+        conn.execute(delete(PointTransaction).where(PointTransaction.transaction_type == "export_benchmark"))
+
+
+def benchmark(count, fmt="csv", gzipped=True):
+    import resource
+    from time import perf_counter
+    from sqlalchemy import func
+
+    with engine.connect() as conn:
+        uid = conn.execute(select(func.min(User.uid))).scalar()
+    if uid is None:
+        print("benchmark needs at least one user")
+        return
+
+    print(f"seeding {count:,} ledger rows ...")
+    _seed_ledger(count, uid)
+    try:
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        started = perf_counter()
+        written = 0
+        chunks = iter_export("ledger", fmt)
+        if gzipped:
+            chunks = gzip_stream(chunks)
+        with open("/dev/null", "wb") as out:
+            for chunk in chunks:
+                written += len(chunk)
+                out.write(chunk)
+        elapsed = perf_counter() - started
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    finally:
+        _drop_seeded_ledger()
+
+    print(f"exported ledger ({fmt}{', gzip' if gzipped else ''}): {written / 1e6:,.1f} MB in {elapsed:.1f} s")
+    print(f"peak RSS {rss_after / 1024:,.1f} MB (grew {(rss_after - rss_before) / 1024:,.1f} MB during export)")
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Stream a table export to a file or stdout")
+    parser.add_argument("name", nargs="?", choices=list(EXPORTS))
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("-o", "--output", help="file to write (default: stdout)")
+    parser.add_argument("--benchmark", type=int, metavar="ROWS",
+                        help="seed ROWS ledger rows, export them to /dev/null and report time and memory")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark, args.format, args.gzip)
+    elif args.name:
+        chunks = iter_export(args.name, args.format)
+        if args.gzip:
+            chunks = gzip_stream(chunks)
+        out = open(args.output, "wb") if args.output else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if args.output:
+                out.close()
+    else:
+        parser.error("name or --benchmark is required")
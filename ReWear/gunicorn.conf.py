@@ -0,0 +1,30 @@
+import os
+from time import perf_counter
+
+bind = os.getenv("BIND", "0.0.0.0:" + os.getenv("PORT", "5000"))
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+
+# Import the app (and compile templates) once in the master; workers share it copy-on-write
+preload_app = True
+# ...so configure_app() leaves the background threads to each worker (see post_fork)
+os.environ["REWEAR_THREADS_AFTER_FORK"] = "1"
+
+DB_PREWARM_CONNECTIONS = int(os.getenv("DB_PREWARM_CONNECTIONS", "2"))
+
+
+def post_fork(server, worker):
+    from database import dispose_engine_after_fork, prewarm_pool
+    from app import start_background_threads
+
+    # register_at_fork already did this, but be explicit for older runtimes
+    dispose_engine_after_fork()
+
+    started = perf_counter()
+    opened = prewarm_pool(DB_PREWARM_CONNECTIONS)
+    server.log.info(
+        "worker %s prewarmed %s db connections in %.1f ms",
+        worker.pid, opened, (perf_counter() - started) * 1000
+    )
+
+    start_background_threads()
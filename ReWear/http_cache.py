@@ -0,0 +1,138 @@
+"""Conditional GET for pages whose content is derived from product rows.
+
+A validator function returns the timestamps a page depends on, read with one
+small indexed query. When the request's If-None-Match / If-Modified-Since
+still matches, a 304 goes out before the view loads any ORM objects or
+renders a template.
+
+Run `python http_cache.py <pid>` to benchmark the 304 path against a full render.
+"""
+import hashlib
+import os
+from datetime import datetime, timezone
+from functools import wraps
+from flask import request, session, make_response
+from database import get_product_freshness, get_catalog_freshness
+from assets import manifest_version
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+
+
+def _template_version():
+    """Digest of the template sources, so a deploy that changes markup changes every ETag."""
+    digest = hashlib.sha1()
+    for name in sorted(os.listdir(TEMPLATE_DIR)):
+        with open(os.path.join(TEMPLATE_DIR, name), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+TEMPLATE_VERSION = _template_version()
+
+
+def product_validator(pid):
+    return get_product_freshness(pid)
+
+
+def catalog_validator(**kwargs):
+    return get_catalog_freshness()
+
+
+def _as_utc(value):
+    # Timestamps are stored as naive UTC (datetime.utcnow); HTTP dates have 1s resolution
+    return value.replace(tzinfo=timezone.utc, microsecond=0)
+
+
+def page_etag(stamps, uid):
+    """(ETag, Last-Modified) of a per-user page derived from the validator's `stamps`."""
+    stamps = [stamp for stamp in stamps if stamp is not None]
+    last_modified = _as_utc(max(stamps)) if stamps else None
+    # Pages link fingerprinted assets; a rebuild removes the old files, so cached copies must go too
+    fingerprint = "|".join(
+        [TEMPLATE_VERSION, manifest_version(), str(uid or "")] + [stamp.isoformat() for stamp in stamps]
+    )
+    return hashlib.sha1(fingerprint.encode()).hexdigest(), last_modified
+
+
+def is_not_modified(req, etag, last_modified):
+    """Whether the request's validators still match (Flask and Quart requests alike)."""
+    # If-None-Match wins over If-Modified-Since when both are sent (RFC 9110 13.2.2)
+    if req.if_none_match:
+        # Weak comparison: compressed responses carry the tag as W/"..." (streaming.py)
+        return req.if_none_match.contains_weak(etag)
+    return (
+        last_modified is not None
+        and req.if_modified_since is not None
+        and last_modified <= req.if_modified_since
+    )
+
+
+def tag_response(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.vary.add("Cookie")
+    return response
+
+
+def conditional_page(validator):
+    """Answer matching conditional GETs with 304 and tag fresh renders with ETag/Last-Modified.
+
+    The page varies by user (header, points, flashes), so the ETag includes the
+    uid and the response is `private, no-cache`: browsers keep a copy but
+    revalidate it on every view, and shared caches never store it.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            # Pending flash messages must be rendered, not answered with 304
+            if request.method != "GET" or session.get("_flashes"):
+                return f(*args, **kwargs)
+
+            stamps = validator(**kwargs)
+            if stamps is None:
+                return f(*args, **kwargs)
+
+            etag, last_modified = page_etag(stamps, session.get("uid"))
+            if is_not_modified(request, etag, last_modified):
+                response = make_response("", 304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            return tag_response(response, etag, last_modified)
+        return decorated_function
+    return decorator
+
+
+def benchmark(pid, iterations=500):
+    from time import perf_counter
+    from app import app
+
+    client = app.test_client()
+    first = client.get(f"/product/{pid}")
+    etag = first.headers.get("ETag")
+    if first.status_code != 200 or not etag:
+        print(f"GET /product/{pid} returned {first.status_code} without an ETag")
+        return
+
+    def timed(headers):
+        samples = []
+        for _ in range(iterations):
+            started = perf_counter()
+            client.get(f"/product/{pid}", headers=headers)
+            samples.append((perf_counter() - started) * 1000)
+        samples.sort()
+        return samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+    full_p50, full_p99 = timed({})
+    cached_p50, cached_p99 = timed({"If-None-Match": etag})
+    print(f"full render  p50 {full_p50:7.2f} ms  p99 {full_p99:7.2f} ms")
+    print(f"304 path     p50 {cached_p50:7.2f} ms  p99 {cached_p99:7.2f} ms")
+
+
+if __name__ == "__main__":
+    import sys
+
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1)
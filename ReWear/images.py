@@ -0,0 +1,324 @@
+"""Product image upload pipeline.
+
+Uploads are streamed to a temp file in chunks (hashing as they go) and stored
+under their SHA-256, so identical bytes are kept once. Resized JPEG and WebP
+variants are rendered in a process pool off the request path and recorded on
+ProductImage.variants; templates render them through image_srcset(). The
+same pass computes the perceptual hash used by duplicates.py.
+
+Storage goes through a small S3-style interface: LocalObjectStore writes under
+MEDIA_ROOT and is served by /media/, S3ObjectStore talks to S3 or any
+S3-compatible server (MinIO, etc.) when IMAGE_STORE=s3.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from flask import send_from_directory
+from database import add_product_image, set_product_image_variants, get_image_variants_by_hash
+from duplicates import index_product_image
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MEDIA_ROOT = os.getenv("MEDIA_ROOT", os.path.join(BASE_DIR, "media"))
+MEDIA_URL_PREFIX = "/media/"
+
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", str(10 * 1024 * 1024)))
+MAX_IMAGES_PER_PRODUCT = 4
+CHUNK_SIZE = 64 * 1024
+VARIANT_WIDTHS = (320, 640, 1280)
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Leading bytes -> (extension, content type); the browser-supplied type is not trusted
+SIGNATURES = (
+    (b"\xff\xd8\xff", ".jpg", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", ".png", "image/png"),
+    (b"GIF87a", ".gif", "image/gif"),
+    (b"GIF89a", ".gif", "image/gif"),
+)
+
+
+class UploadError(Exception):
+    pass
+
+
+class LocalObjectStore:
+    """Filesystem object store with the same surface as S3ObjectStore."""
+
+    def __init__(self, root=MEDIA_ROOT, url_prefix=MEDIA_URL_PREFIX):
+        self.root = root
+        self.url_prefix = url_prefix
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split("/"))
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def put_file(self, key, source_path, content_type=None):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write beside the target and rename, so readers never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        shutil.copyfile(source_path, tmp_path)
+        os.replace(tmp_path, path)
+
+    def download_file(self, key, dest_path):
+        shutil.copyfile(self._path(key), dest_path)
+
+    def url(self, key):
+        return self.url_prefix + key
+
+
+class S3ObjectStore:
+    """S3 (or S3-compatible) bucket; needs boto3."""
+
+    def __init__(self, bucket, endpoint_url=None, public_url=None):
+        import boto3
+
+        self.bucket = bucket
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.public_url = (public_url or f"https://{bucket}.s3.amazonaws.com").rstrip("/") + "/"
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError:
+            return False
+
+    def put_file(self, key, source_path, content_type=None):
+        self.client.upload_file(
+            source_path, self.bucket, key,
+            ExtraArgs={"ContentType": content_type or "application/octet-stream",
+                       "CacheControl": IMMUTABLE_CACHE_CONTROL}
+        )
+
+    def download_file(self, key, dest_path):
+        self.client.download_file(self.bucket, key, dest_path)
+
+    def url(self, key):
+        return self.public_url + key
+
+
+_store = None
+_executor = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        if os.getenv("IMAGE_STORE", "local") == "s3":
+            _store = S3ObjectStore(
+                os.getenv("S3_BUCKET"),
+                endpoint_url=os.getenv("S3_ENDPOINT_URL"),
+                public_url=os.getenv("MEDIA_PUBLIC_URL")
+            )
+        else:
+            _store = LocalObjectStore()
+    return _store
+
+
+def get_executor():
+    # Created lazily so every forked web worker gets its own pool
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return _executor
+
+
+def sniff_image_type(head):
+    for signature, ext, content_type in SIGNATURES:
+        if head.startswith(signature):
+            return ext, content_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp", "image/webp"
+    return None
+
+
+def spool_upload(file_storage):
+    """Copy an upload to a temp file in chunks; returns (path, sha256, ext, content_type)."""
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+    fd, path = tempfile.mkstemp(prefix="rewear-upload-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = file_storage.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > MAX_IMAGE_BYTES:
+                    raise UploadError(f"Images must be smaller than {MAX_IMAGE_BYTES // (1024 * 1024)} MB")
+                if len(head) < 16:
+                    head += chunk[:16 - len(head)]
+                digest.update(chunk)
+                out.write(chunk)
+
+        if size == 0:
+            raise UploadError("Empty image upload")
+        kind = sniff_image_type(head)
+        if kind is None:
+            raise UploadError("Only JPEG, PNG, GIF and WebP images are supported")
+        return path, digest.hexdigest(), kind[0], kind[1]
+    except Exception:
+        os.remove(path)
+        raise
+
+
+def original_key(content_hash, ext):
+    return f"originals/{content_hash[:2]}/{content_hash}{ext}"
+
+
+def variant_key(content_hash, width, fmt):
+    return f"variants/{content_hash[:2]}/{content_hash}/{width}.{fmt}"
+
+
+def perceptual_hash(image):
+    """64-bit difference hash (dHash) of a PIL image, as a signed integer.
+
+    Each bit says whether a pixel of the 9x8 grayscale thumbnail is brighter
+    than its right neighbour, so re-encoding, resizing and small edits flip
+    only a few bits.
+    """
+    from PIL import Image
+
+    small = image.convert("L").resize((9, 8), Image.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            left, right = pixels[row * 9 + column], pixels[row * 9 + column + 1]
+            value = (value << 1) | (left > right)
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def render_variants(source_path, content_hash, widths=VARIANT_WIDTHS):
+    """Runs in the process pool: resize to each width as JPEG and WebP.
+
+    Returns the original size and a list of rendered files in a temp dir that
+    the caller uploads and removes.
+    """
+    from PIL import Image, ImageOps
+
+    out_dir = tempfile.mkdtemp(prefix="rewear-variants-")
+    files = []
+    with Image.open(source_path) as opened:
+        image = ImageOps.exif_transpose(opened)
+        width, height = image.size
+        rgb = image.convert("RGB")
+        phash = perceptual_hash(rgb)
+
+        # Never upscale; an image narrower than every target still gets one variant
+        targets = sorted({min(target, width) for target in widths})
+        for target in targets:
+            resized = rgb if target == width else rgb.resize(
+                (target, max(1, round(height * target / width))), Image.LANCZOS
+            )
+            for fmt, options in (("jpg", {"quality": 82, "progressive": True, "optimize": True}),
+                                 ("webp", {"quality": 80, "method": 4})):
+                path = os.path.join(out_dir, f"{target}.{fmt}")
+                resized.save(path, "JPEG" if fmt == "jpg" else "WEBP", **options)
+                files.append({
+                    "width": target,
+                    "format": fmt,
+                    "path": path,
+                    "key": variant_key(content_hash, target, fmt),
+                })
+
+    return {"width": width, "height": height, "files": files, "dir": out_dir, "perceptual_hash": phash}
+
+
+def _store_variants(image_id, source_path, future):
+    """Completion callback (runs in the parent): upload variants and record them."""
+    try:
+        result = future.result()
+    except Exception as e:
+        print(f"Error rendering image variants: {e}")
+        return
+    finally:
+        if os.path.exists(source_path):
+            os.remove(source_path)
+
+    store = get_store()
+    variants = []
+    try:
+        for item in result["files"]:
+            content_type = "image/webp" if item["format"] == "webp" else "image/jpeg"
+            store.put_file(item["key"], item["path"], content_type)
+            variants.append({"width": item["width"], "format": item["format"], "url": store.url(item["key"])})
+    finally:
+        shutil.rmtree(result["dir"], ignore_errors=True)
+
+    set_product_image_variants(image_id, result["width"], result["height"], variants, result["perceptual_hash"])
+    index_product_image(image_id)
+
+
+def save_product_image(pid, file_storage, is_primary=False):
+    """Store an uploaded image for a product and queue its variants; returns image_id."""
+    path, content_hash, ext, content_type = spool_upload(file_storage)
+    store = get_store()
+    key = original_key(content_hash, ext)
+
+    try:
+        if not store.exists(key):
+            store.put_file(key, path, content_type)
+    except Exception:
+        os.remove(path)
+        raise
+
+    image_id = add_product_image(pid, store.url(key), is_primary, content_hash=content_hash)
+    if not image_id:
+        os.remove(path)
+        raise UploadError("Could not save image")
+
+    # Same bytes uploaded before: reuse its variants instead of rendering again
+    existing = get_image_variants_by_hash(content_hash)
+    if existing:
+        os.remove(path)
+        set_product_image_variants(
+            image_id, existing["width"], existing["height"], existing["variants"], existing["perceptual_hash"]
+        )
+        index_product_image(image_id)
+        return image_id
+
+    future = get_executor().submit(render_variants, path, content_hash)
+    future.add_done_callback(lambda f: _store_variants(image_id, path, f))
+    return image_id
+
+
+def image_srcset(image, fmt="jpg"):
+    """srcset value for an image's variants in one format, '' when it has none."""
+    variants = getattr(image, "variants", None) or []
+    return ", ".join(f"{v['url']} {v['width']}w" for v in variants if v["format"] == fmt)
+
+
+def image_src(image, width=640):
+    """Smallest variant at least `width` wide (or the largest), else the original url."""
+    variants = [v for v in (getattr(image, "variants", None) or []) if v["format"] == "jpg"]
+    if not variants:
+        return image.image_url
+    variants.sort(key=lambda v: v["width"])
+    for variant in variants:
+        if variant["width"] >= width:
+            return variant["url"]
+    return variants[-1]["url"]
+
+
+def serve_media(key):
+    response = send_from_directory(MEDIA_ROOT, key, conditional=True, max_age=31536000)
+    # Keys are content hashes, so a URL's bytes never change
+    response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+def init_images(app):
+    app.config.setdefault("MAX_CONTENT_LENGTH", MAX_IMAGES_PER_PRODUCT * MAX_IMAGE_BYTES + 1024 * 1024)
+    app.add_url_rule(MEDIA_URL_PREFIX + "<path:key>", "media", serve_media)
+    app.jinja_env.globals["image_srcset"] = image_srcset
+    app.jinja_env.globals["image_src"] = image_src
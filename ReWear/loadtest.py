@@ -0,0 +1,190 @@
+"""Load test comparing the WSGI and ASGI serving modes.
+
+Starts each server, hammers a set of read-heavy paths with N concurrent
+keep-alive connections, and reports requests/sec, latency percentiles and
+server memory per concurrent connection (RSS growth under load / N).
+
+    python loadtest.py --concurrency 200 --duration 20 --cookie "session=..."
+
+Linux only (memory is read from /proc).
+"""
+import argparse
+import asyncio
+import os
+import shlex
+import signal
+import subprocess
+import time
+
+MODES = {
+    "wsgi": "gunicorn --workers 1 --threads 16 --bind 127.0.0.1:{port} wsgi:app",
+    "asgi": "uvicorn asgi:app --workers 1 --host 127.0.0.1 --port {port}",
+}
+
+# Pages both modes serve (asgi.py's Quart routes and their Flask versions), so they compare the same work
+DEFAULT_PATHS = ["/home", "/product/1", "/my-orders"]
+
+
+def tree_rss_kb(pid):
+    """Resident memory of a process and all of its children, in KiB."""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+                        break
+            with open(f"/proc/{current}/task/{current}/children") as f:
+                pending.extend(int(child) for child in f.read().split())
+        except FileNotFoundError:
+            continue
+    return total
+
+
+async def fetch(reader, writer, request_bytes):
+    writer.write(request_bytes)
+    await writer.drain()
+
+    headers = await reader.readuntil(b"\r\n\r\n")
+    status = int(headers.split(b" ", 2)[1])
+    length = 0
+    chunked = False
+    for line in headers.split(b"\r\n"):
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":", 1)[1])
+        elif line.lower().startswith(b"transfer-encoding:") and b"chunked" in line.lower():
+            chunked = True
+    if chunked:
+        # Streamed pages: size line, data and CRLF per chunk, ending with a zero-size chunk
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).split(b";", 1)[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif length:
+        await reader.readexactly(length)
+    return status
+
+
+async def worker(host, port, paths, cookie, deadline, latencies, errors, offset):
+    reader, writer = await asyncio.open_connection(host, port)
+    i = offset
+    try:
+        while time.perf_counter() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            request_bytes = (
+                f"GET {path} HTTP/1.1\r\nHost: {host}\r\nCookie: {cookie}\r\n"
+                "Connection: keep-alive\r\n\r\n"
+            ).encode()
+            start = time.perf_counter()
+            try:
+                status = await fetch(reader, writer, request_bytes)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                errors.append(path)
+                writer.close()
+                reader, writer = await asyncio.open_connection(host, port)
+                continue
+            latencies.append(time.perf_counter() - start)
+            if status >= 500:
+                errors.append(path)
+    finally:
+        writer.close()
+
+
+async def run_load(host, port, paths, cookie, concurrency, duration, server_pid):
+    latencies = []
+    errors = []
+    peak_rss = [tree_rss_kb(server_pid)]
+
+    async def sample_memory():
+        while True:
+            peak_rss[0] = max(peak_rss[0], tree_rss_kb(server_pid))
+            await asyncio.sleep(0.25)
+
+    deadline = time.perf_counter() + duration
+    sampler = asyncio.create_task(sample_memory())
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        worker(host, port, paths, cookie, deadline, latencies, errors, n)
+        for n in range(concurrency)
+    ])
+    elapsed = time.perf_counter() - started
+    sampler.cancel()
+    return latencies, errors, elapsed, peak_rss[0]
+
+
+def wait_for_port(host, port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            asyncio.run(asyncio.wait_for(asyncio.open_connection(host, port), 1))
+            return True
+        except (OSError, asyncio.TimeoutError):
+            time.sleep(0.2)
+    return False
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def bench_mode(mode, args):
+    command = MODES[mode].format(port=args.port)
+    server = subprocess.Popen(shlex.split(command), cwd=os.path.dirname(os.path.abspath(__file__)))
+    try:
+        if not wait_for_port("127.0.0.1", args.port):
+            raise RuntimeError(f"{mode} server did not start: {command}")
+        time.sleep(1)
+
+        # Warm pools and template caches before measuring the idle baseline
+        asyncio.run(run_load("127.0.0.1", args.port, args.paths, args.cookie, 4, 2, server.pid))
+        idle_rss = tree_rss_kb(server.pid)
+
+        latencies, errors, elapsed, peak_rss = asyncio.run(run_load(
+            "127.0.0.1", args.port, args.paths, args.cookie, args.concurrency, args.duration, server.pid
+        ))
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+
+    return {
+        "mode": mode,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "idle_rss_mb": idle_rss / 1024,
+        "peak_rss_mb": peak_rss / 1024,
+        "kb_per_conn": max(0, peak_rss - idle_rss) / args.concurrency,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    parser.add_argument("--paths", nargs="+", default=DEFAULT_PATHS)
+    parser.add_argument("--cookie", default="", help="session cookie of a logged-in user")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    results = [bench_mode(mode, args) for mode in args.modes]
+
+    print(f"{'mode':<6}{'req':>9}{'err':>6}{'req/s':>10}{'p50 ms':>9}{'p99 ms':>9}"
+          f"{'idle MB':>9}{'peak MB':>9}{'KB/conn':>9}")
+    for r in results:
+        print(f"{r['mode']:<6}{r['requests']:>9}{r['errors']:>6}{r['rps']:>10.1f}{r['p50_ms']:>9.1f}"
+              f"{r['p99_ms']:>9.1f}{r['idle_rss_mb']:>9.1f}{r['peak_rss_mb']:>9.1f}{r['kb_per_conn']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
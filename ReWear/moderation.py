@@ -0,0 +1,183 @@
+"""Bulk moderation of pending products.
+
+approve_product() handles one item per call; bulk_moderate() handles any
+number of pids in one transaction: a set-based UPDATE ... RETURNING (or
+DELETE ... RETURNING for rejections) per chunk and one batched insert of
+outbox events for the rows it changed. Both leave points, notifications and
+saved-search alerts to the outbox (outbox.py), so a bulk decision is delivered,
+retried and replayed exactly like a single one.
+
+Run `python moderation.py [count]` to benchmark approving `count` (default
+10000) freshly created pending products.
+"""
+from datetime import datetime
+from sqlalchemy import update, delete, select, insert
+from database import SessionLocal, Product, OutboxEvent
+from overload import guard
+
+CHUNK_SIZE = 1000
+ACTIONS = ("approve", "reject")
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+@guard
+def bulk_moderate(pids: list, action: str):
+    """Approve or reject pending products; returns {pid: outcome}.
+
+    Outcomes are "approved", "rejected", "not_found" or "not_pending:<status>".
+    Only rows still pending are touched, so a concurrent single approval can't
+    award points twice. Rejected listings are deleted, as there is no
+    rejected product status.
+    """
+    if action not in ACTIONS:
+        raise ValueError(f"action must be one of {ACTIONS}")
+
+    pids = list(dict.fromkeys(int(pid) for pid in pids))
+    outcomes = {}
+    events = []
+
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        for chunk in _chunks(pids, CHUNK_SIZE):
+            if action == "approve":
+                statement = (
+                    update(Product)
+                    .where(Product.pid.in_(chunk), Product.status == "pending")
+                    .values(status="available", updated_at=now)
+                    .returning(Product.pid, Product.uid, Product.point_value, Product.title)
+                    .execution_options(synchronize_session=False)
+                )
+            else:
+                statement = (
+                    delete(Product)
+                    .where(Product.pid.in_(chunk), Product.status == "pending")
+                    .returning(Product.pid, Product.uid, Product.point_value, Product.title)
+                    .execution_options(synchronize_session=False)
+                )
+
+            for row in db.execute(statement):
+                outcomes[row.pid] = "approved" if action == "approve" else "rejected"
+                # The same events approve_product() queues, one row each
+                events.append({
+                    "event_type": f"product_{outcomes[row.pid]}",
+                    "aggregate_id": row.pid,
+                    "payload": {"uid": row.uid, "point_value": row.point_value, "title": row.title},
+                })
+
+            # Explain the pids that were left alone
+            skipped = [pid for pid in chunk if pid not in outcomes]
+            if skipped:
+                statuses = dict(db.execute(select(Product.pid, Product.status).where(Product.pid.in_(skipped))).all())
+                for pid in skipped:
+                    outcomes[pid] = f"not_pending:{statuses[pid]}" if pid in statuses else "not_found"
+
+        if events:
+            for chunk in _chunks(events, CHUNK_SIZE):
+                db.execute(insert(OutboxEvent), chunk)
+            # Lets outbox.py wake its dispatcher once this commits
+            db.info["outbox_events"] = True
+        db.commit()
+        return outcomes
+    except Exception as e:
+        db.rollback()
+        print(f"Error moderating products: {e}")
+        return {pid: "error" for pid in pids}
+    finally:
+        db.close()
+
+
+def benchmark(count=10000, uid=None):
+    from time import perf_counter
+    from sqlalchemy import func
+    from database import User
+    from outbox import dispatcher, dispatch_batch, BATCH_SIZE
+
+    db = SessionLocal()
+    try:
+        if uid is None:
+            uid = db.query(func.min(User.uid)).scalar()
+        rows = [{
+            "uid": uid,
+            "title": f"Bench item {i}",
+            "description": "Bulk moderation benchmark",
+            "category": "Tops",
+            "subcategory": "Casual",
+            "size": "M",
+            "condition": "Good",
+            "point_value": 25,
+            "status": "pending",
+        } for i in range(count)]
+        pids = [pid for (pid,) in db.execute(insert(Product).returning(Product.pid), rows)]
+        db.commit()
+    finally:
+        db.close()
+
+    # Time the delivery separately rather than leaving it to this process's dispatcher thread
+    dispatcher.autostart = False
+    started = perf_counter()
+    outcomes = bulk_moderate(pids, "approve")
+    elapsed = perf_counter() - started
+    started = perf_counter()
+    while dispatch_batch(BATCH_SIZE) == BATCH_SIZE:
+        pass
+    delivered = perf_counter() - started
+
+    approved = sum(1 for outcome in outcomes.values() if outcome == "approved")
+    print(f"approved {approved}/{count} in {elapsed:.2f} s ({count / elapsed:,.0f} items/s), "
+          f"side effects delivered in {delivered:.2f} s")
+
+    # Undo the benchmark's products, points and notifications
+    from database import PointTransaction, Notification
+    db = SessionLocal()
+    try:
+        for chunk in _chunks(pids, CHUNK_SIZE):
+            awarded = db.query(func.coalesce(func.sum(PointTransaction.amount), 0)).filter(
+                PointTransaction.transaction_type == "item_approved",
+                PointTransaction.reference_id.in_(chunk)
+            ).scalar()
+            db.query(User).filter(User.uid == uid).update(
+                {User.points: User.points - awarded}, synchronize_session=False
+            )
+            db.query(PointTransaction).filter(
+                PointTransaction.transaction_type == "item_approved",
+                PointTransaction.reference_id.in_(chunk)
+            ).delete(synchronize_session=False)
+            removed = db.query(Notification).filter(
+                Notification.notification_type == "product_approved",
+                Notification.reference_id.in_(chunk)
+            ).delete(synchronize_session=False)
+            db.query(User).filter(User.uid == uid).update(
+                {User.unread_notifications: User.unread_notifications - removed}, synchronize_session=False
+            )
+            alerts = db.query(Notification.uid, func.count()).filter(
+                Notification.notification_type == "saved_search_match",
+                Notification.reference_id.in_(chunk),
+                Notification.is_read == False
+            ).group_by(Notification.uid).all()
+            for alerted_uid, count in alerts:
+                db.query(User).filter(User.uid == alerted_uid).update(
+                    {User.unread_notifications: User.unread_notifications - count}, synchronize_session=False
+                )
+            db.query(Notification).filter(
+                Notification.notification_type == "saved_search_match",
+                Notification.reference_id.in_(chunk)
+            ).delete(synchronize_session=False)
+            db.query(OutboxEvent).filter(
+                OutboxEvent.event_type == "product_approved",
+                OutboxEvent.aggregate_id.in_(chunk)
+            ).delete(synchronize_session=False)
+            db.query(Product).filter(Product.pid.in_(chunk)).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    import sys
+
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,288 @@
+"""Live notification push over Server-Sent Events.
+
+database.queue_notifications() records which users got new notifications.
+On Postgres it also issues pg_notify in the same transaction; a LISTEN thread
+in each web process turns those into wake-ups for the SSE streams of the
+affected users. Without Postgres (or while the listener is down) the session
+after_commit hook wakes local streams directly, which covers single-process
+deployments.
+
+In the async mode (asgi.py, under uvicorn) /notifications/stream is served
+by event_stream(): a waiting stream is a coroutine, not a thread, so there is
+no per-process cap and every open tab gets a live stream. Deployments that
+expect most signed-in users to keep a tab open should run that mode.
+
+Under gunicorn's sync workers an open stream holds a server thread for as long
+as the tab stays open, so each worker process serves at most MAX_STREAMS of
+them (half its GUNICORN_THREADS by default). Past that a client gets a
+one-shot reply instead: what it missed and the unread count, with a retry
+delay of POLL_RETRY_MS. The browser's EventSource reconnects after that delay,
+which turns it into the unread-count poll until a stream slot frees up.
+"""
+import asyncio
+import json
+import os
+import queue
+import select
+import threading
+import time
+from datetime import datetime
+from flask import Blueprint, Response, request, session, jsonify
+from sqlalchemy import event
+from database import (
+    SessionLocal,
+    engine,
+    NOTIFICATION_CHANNEL,
+    get_notifications_after,
+    get_latest_notification_id,
+    get_unread_count,
+    mark_all_notifications_read,
+)
+
+HEARTBEAT_SECONDS = 15
+LISTEN_RETRY_SECONDS = 5
+# Streams per sync worker process; the rest of its GUNICORN_THREADS stay free for page requests
+MAX_STREAMS = int(os.getenv("SSE_MAX_STREAMS", str(max(1, int(os.getenv("GUNICORN_THREADS", "4")) // 2))))
+POLL_RETRY_MS = int(os.getenv("SSE_POLL_RETRY_MS", "30000"))
+
+
+class AsyncWakeups:
+    """A subscriber on an event loop; publish() may run on any thread."""
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=1)
+
+    def put_nowait(self, item):
+        try:
+            self.loop.call_soon_threadsafe(self._offer, item)
+        except RuntimeError:  # the loop has closed
+            pass
+
+    def _offer(self, item):
+        if not self.queue.full():
+            self.queue.put_nowait(item)
+
+
+class NotificationBroker:
+    """Per-process fan-out of "uid has new notifications" wake-ups."""
+
+    def __init__(self, max_streams=MAX_STREAMS):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self.listening = False
+        self._listener = None
+        self.max_streams = max_streams
+        self.stream_slots = threading.BoundedSemaphore(max_streams)
+
+    def after_fork(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self.listening = False
+        self._listener = None
+        self.stream_slots = threading.BoundedSemaphore(self.max_streams)
+
+    def subscribe(self, uid):
+        wakeups = queue.Queue(maxsize=1)
+        with self._lock:
+            self._subscribers.setdefault(uid, set()).add(wakeups)
+        self.ensure_listener()
+        return wakeups
+
+    def subscribe_async(self, uid):
+        """subscribe() from a coroutine: wake-ups arrive on the returned object's asyncio queue."""
+        wakeups = AsyncWakeups()
+        with self._lock:
+            self._subscribers.setdefault(uid, set()).add(wakeups)
+        self.ensure_listener()
+        return wakeups
+
+    def unsubscribe(self, uid, wakeups):
+        with self._lock:
+            subscribers = self._subscribers.get(uid)
+            if subscribers:
+                subscribers.discard(wakeups)
+                if not subscribers:
+                    del self._subscribers[uid]
+
+    def publish(self, uids):
+        with self._lock:
+            targets = [q for uid in uids for q in self._subscribers.get(uid, ())]
+        for wakeups in targets:
+            # A pending wake-up already makes the stream re-query, so one is enough
+            try:
+                wakeups.put_nowait(True)
+            except queue.Full:
+                pass
+
+    def ensure_listener(self):
+        if engine.dialect.name != "postgresql":
+            return
+        with self._lock:
+            if self._listener is not None and self._listener.is_alive():
+                return
+            self._listener = threading.Thread(target=self._listen, name="notification-listener", daemon=True)
+            self._listener.start()
+
+    def _listen(self):
+        while True:
+            raw = None
+            try:
+                # Take a connection out of the pool for good; LISTEN needs it in autocommit
+                raw = engine.raw_connection()
+                raw.detach()
+                conn = raw.dbapi_connection
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {NOTIFICATION_CHANNEL}")
+                self.listening = True
+
+                while True:
+                    if select.select([conn], [], [], HEARTBEAT_SECONDS) == ([], [], []):
+                        continue
+                    conn.poll()
+                    uids = set()
+                    while conn.notifies:
+                        payload = conn.notifies.pop(0).payload
+                        uids.update(int(uid) for uid in payload.split(",") if uid)
+                    self.publish(uids)
+            except Exception as e:
+                print(f"Notification listener error, retrying: {e}")
+            finally:
+                self.listening = False
+                if raw is not None:
+                    try:
+                        raw.close()
+                    except Exception:
+                        pass
+            time.sleep(LISTEN_RETRY_SECONDS)
+
+
+broker = NotificationBroker()
+os.register_at_fork(after_in_child=broker.after_fork)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def publish_committed_notifications(db):
+    uids = db.info.pop("notified_uids", None)
+    # With LISTEN active every process hears pg_notify; publishing here too would double wake-ups
+    if uids and not broker.listening:
+        broker.publish(uids)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def discard_rolled_back_notifications(db):
+    db.info.pop("notified_uids", None)
+
+
+notifications_bp = Blueprint("notifications", __name__, url_prefix="/notifications")
+
+
+def _sse(event_name, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_name}")
+    lines.append("data: " + json.dumps(data, default=lambda v: v.isoformat() if isinstance(v, datetime) else str(v)))
+    return "\n".join(lines) + "\n\n"
+
+
+@notifications_bp.route("/stream")
+def stream():
+    uid = session.get("uid")
+    if not uid:
+        return jsonify({"error": "Login required"}), 401
+
+    # Resume after the last event the browser saw, otherwise only push what's new
+    last_id = request.headers.get("Last-Event-ID", type=int)
+    if last_id is None:
+        last_id = get_latest_notification_id(uid)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if not broker.stream_slots.acquire(blocking=False):
+        # Every stream slot of this worker is taken: answer like a poll and let the browser come back
+        return Response(catch_up(uid, last_id), mimetype="text/event-stream", headers=headers)
+
+    def generate(last_id):
+        wakeups = broker.subscribe(uid)
+        try:
+            yield "retry: 5000\n\n"
+            send_unread = True
+            while True:
+                new = get_notifications_after(uid, last_id)
+                for notification in new:
+                    last_id = notification["notification_id"]
+                    yield _sse("notification", notification, event_id=last_id)
+                if new or send_unread:
+                    yield _sse("unread", {"count": get_unread_count(uid)})
+                    send_unread = False
+                if new:
+                    # Drain everything before waiting again
+                    continue
+
+                try:
+                    wakeups.get(timeout=HEARTBEAT_SECONDS)
+                    send_unread = True
+                except queue.Empty:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ": heartbeat\n\n"
+        finally:
+            broker.unsubscribe(uid, wakeups)
+
+    response = Response(generate(last_id), mimetype="text/event-stream", headers=headers)
+    # The server closes the response however the stream ends, even if it never started
+    response.call_on_close(broker.stream_slots.release)
+    return response
+
+
+async def event_stream(uid, last_id):
+    """stream()'s events for the async mode; the queries run in worker threads, the wait doesn't."""
+    wakeups = broker.subscribe_async(uid)
+    try:
+        yield "retry: 5000\n\n"
+        send_unread = True
+        while True:
+            new = await asyncio.to_thread(get_notifications_after, uid, last_id)
+            for notification in new:
+                last_id = notification["notification_id"]
+                yield _sse("notification", notification, event_id=last_id)
+            if new or send_unread:
+                yield _sse("unread", {"count": await asyncio.to_thread(get_unread_count, uid)})
+                send_unread = False
+            if new:
+                continue
+
+            try:
+                await asyncio.wait_for(wakeups.queue.get(), HEARTBEAT_SECONDS)
+                send_unread = True
+            except asyncio.TimeoutError:
+                yield ": heartbeat\n\n"
+    finally:
+        broker.unsubscribe(uid, wakeups)
+
+
+def catch_up(uid, last_id):
+    """One-shot reply for a client without a stream slot: what it missed, the unread count, a retry delay."""
+    events = [f"retry: {POLL_RETRY_MS}\n\n"]
+    for notification in get_notifications_after(uid, last_id):
+        events.append(_sse("notification", notification, event_id=notification["notification_id"]))
+    events.append(_sse("unread", {"count": get_unread_count(uid)}))
+    return "".join(events)
+
+
+@notifications_bp.route("/unread-count")
+def unread_count():
+    uid = session.get("uid")
+    if not uid:
+        return jsonify({"error": "Login required"}), 401
+    return jsonify({"count": get_unread_count(uid)})
+
+
+@notifications_bp.route("/read-all", methods=["POST"])
+def read_all():
+    uid = session.get("uid")
+    if not uid:
+        return jsonify({"error": "Login required"}), 401
+    changed = mark_all_notifications_read(uid)
+    broker.publish([uid])
+    return jsonify({"marked_read": changed})
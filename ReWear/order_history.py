@@ -0,0 +1,141 @@
+"""Maintenance for the transaction_summaries read model.
+
+The lifecycle functions in database.py keep summaries current, and image
+uploads and variant renders rewrite the thumbnails they show; these commands
+rebuild them from scratch (after a deploy that adds the table, or a bad
+backfill) and check them against the source tables.
+
+    python order_history.py rebuild
+    python order_history.py check            # report drift, exit 1 if any
+    python order_history.py check --fix      # and rewrite the drifted transactions
+"""
+from sqlalchemy import select, delete
+from database import (
+    SessionLocal,
+    Transaction,
+    TransactionSummary,
+    build_transaction_summaries,
+    refresh_transaction_summaries,
+)
+
+BATCH_SIZE = 2000
+SUMMARY_FIELDS = [column.name for column in TransactionSummary.__table__.columns]
+
+
+def iter_tid_batches(db, batch_size=BATCH_SIZE):
+    """Yield lists of transaction ids in ascending order, keyset-paginated."""
+    last_tid = 0
+    while True:
+        tids = list(db.scalars(
+            select(Transaction.tid).where(Transaction.tid > last_tid).order_by(Transaction.tid).limit(batch_size)
+        ))
+        if not tids:
+            return
+        yield tids
+        last_tid = tids[-1]
+
+
+def rebuild(batch_size=BATCH_SIZE):
+    """Recompute every summary, one committed batch of transactions at a time; returns rows written."""
+    written = 0
+    db = SessionLocal()
+    try:
+        # Summaries of transactions that no longer exist
+        db.execute(delete(TransactionSummary).where(
+            ~TransactionSummary.tid.in_(select(Transaction.tid))
+        ).execution_options(synchronize_session=False))
+        db.commit()
+
+        for tids in iter_tid_batches(db, batch_size):
+            written += refresh_transaction_summaries(db, tids)
+            db.commit()
+        return written
+    except Exception as e:
+        db.rollback()
+        print(f"Error rebuilding transaction summaries: {e}")
+        raise
+    finally:
+        db.close()
+
+
+def check(batch_size=BATCH_SIZE, fix=False):
+    """Compare stored summaries with freshly built ones.
+
+    Returns {"checked", "missing", "stale", "orphaned", "fixed"}; the first
+    three are lists of (tid, uid). With fix=True every drifted transaction
+    is rewritten and orphaned rows are deleted.
+    """
+    report = {"checked": 0, "missing": [], "stale": [], "orphaned": [], "fixed": 0}
+    db = SessionLocal()
+    try:
+        for tids in iter_tid_batches(db, batch_size):
+            expected = {
+                (row["tid"], row["uid"]): tuple(row[field] for field in SUMMARY_FIELDS)
+                for row in build_transaction_summaries(db, tids)
+            }
+            stored = {
+                (row.tid, row.uid): tuple(row)
+                for row in db.execute(
+                    select(*TransactionSummary.__table__.columns).where(TransactionSummary.tid.in_(tids))
+                )
+            }
+            report["checked"] += len(expected)
+
+            drifted = set()
+            for key, values in expected.items():
+                if key not in stored:
+                    report["missing"].append(key)
+                    drifted.add(key[0])
+                elif stored[key] != values:
+                    report["stale"].append(key)
+                    drifted.add(key[0])
+            for key in stored.keys() - expected.keys():
+                report["stale"].append(key)
+                drifted.add(key[0])
+
+            if fix and drifted:
+                refresh_transaction_summaries(db, sorted(drifted))
+                db.commit()
+                report["fixed"] += len(drifted)
+
+        report["orphaned"] = [tuple(row) for row in db.execute(
+            select(TransactionSummary.tid, TransactionSummary.uid)
+            .where(~TransactionSummary.tid.in_(select(Transaction.tid)))
+        )]
+        if fix and report["orphaned"]:
+            db.execute(delete(TransactionSummary).where(
+                TransactionSummary.tid.in_({tid for tid, _ in report["orphaned"]})
+            ).execution_options(synchronize_session=False))
+            db.commit()
+        return report
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    from time import perf_counter
+
+    parser = argparse.ArgumentParser(description="Rebuild or check the transaction_summaries read model")
+    parser.add_argument("command", choices=("rebuild", "check"))
+    parser.add_argument("--fix", action="store_true", help="with check: rewrite drifted summaries")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    started = perf_counter()
+    if args.command == "rebuild":
+        rows = rebuild(args.batch_size)
+        print(f"rebuilt {rows} summary rows in {perf_counter() - started:.1f} s")
+    else:
+        result = check(args.batch_size, fix=args.fix)
+        print(f"checked {result['checked']} summary rows in {perf_counter() - started:.1f} s: "
+              f"{len(result['missing'])} missing, {len(result['stale'])} stale, "
+              f"{len(result['orphaned'])} orphaned")
+        for label in ("missing", "stale", "orphaned"):
+            for tid, uid in result[label][:20]:
+                print(f"  {label}: tid {tid} uid {uid}")
+        if args.fix:
+            print(f"rewrote {result['fixed']} transactions")
+        drift = result["missing"] or result["stale"] or result["orphaned"]
+        sys.exit(1 if drift and not args.fix else 0)
@@ -0,0 +1,463 @@
+"""Transactional outbox: side effects of lifecycle changes, delivered after commit.
+
+Lifecycle changes (create_product, approve_product and moderation.bulk_moderate,
+complete_transaction, reject_transaction) commit their state change together
+with one outbox_events row per item (database.queue_event) and return. The
+work that used to follow in further sessions on the request path - listing
+bonuses, refunds, point awards, notifications, saved-search alerts - runs
+here, in batches.
+
+The dispatcher claims up to BATCH_SIZE undelivered events (FOR UPDATE SKIP
+LOCKED on Postgres, so dispatchers in several workers share the queue), runs
+each event type's handler over all of its events at once and marks them
+delivered, in one transaction: the effects of a batch commit with its
+delivery marks or not at all. Each web process runs it on a background
+thread, started at boot (configure_app, or gunicorn's post_fork per worker) and
+woken right after a local commit that queued events; between wake-ups it polls
+every POLL_INTERVAL seconds, which picks up events left by a crash or deploy
+and those queued by other processes.
+
+Delivery is at least once. A failed batch is retried event by event; an event
+that still fails gets a next_attempt_at with exponential backoff (retry_delay)
+and is skipped until then, so a short outage doesn't burn its attempts in
+milliseconds. After MAX_ATTEMPTS it is left with its last_error until `retry`.
+Handlers are idempotent: they look up the ledger entries and notifications an
+earlier delivery would have written (by type and reference_id) and skip
+those, so replaying an event changes nothing.
+
+Caches and search indexes need no handler: the catalog snapshot, the
+suggestion index and page ETags follow products.updated_at, which the
+committed change already moved.
+
+    python outbox.py run                   # a standalone dispatcher
+    python outbox.py status
+    python outbox.py retry [EVENT_ID ...]  # revive dead events, or replay the given ones
+    python outbox.py benchmark 200         # completion latency with and without inline side effects
+"""
+import os
+import threading
+from datetime import datetime, timedelta
+from time import monotonic
+from sqlalchemy import event, select, update, delete, func, or_
+from database import (
+    SessionLocal,
+    OutboxEvent,
+    Product,
+    PointTransaction,
+    Notification,
+    queue_point_transactions,
+    queue_notifications,
+)
+from saved_searches import notify_saved_searches
+
+BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "200"))
+POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1"))
+MAX_ATTEMPTS = 10
+# A failed event waits RETRY_BASE_SECONDS * 2 ** (attempts - 1), at most RETRY_MAX_SECONDS
+RETRY_BASE_SECONDS = float(os.getenv("OUTBOX_RETRY_BASE_SECONDS", "1"))
+RETRY_MAX_SECONDS = float(os.getenv("OUTBOX_RETRY_MAX_SECONDS", "600"))
+RETENTION_DAYS = 7
+PRUNE_INTERVAL = 3600
+SWAP_COMPLETION_BONUS = 20
+
+
+# Handlers: (session, events of one type) -> None; effects go into the session uncommitted
+def _ledger_entries(db, transaction_types, references):
+    return set(db.execute(
+        select(PointTransaction.uid, PointTransaction.transaction_type, PointTransaction.reference_id)
+        .where(PointTransaction.transaction_type.in_(transaction_types), PointTransaction.reference_id.in_(references))
+    ).all())
+
+
+def _notified(db, notification_type, references):
+    return set(db.execute(
+        select(Notification.uid, Notification.reference_id)
+        .where(Notification.notification_type == notification_type, Notification.reference_id.in_(references))
+    ).all())
+
+
+def handle_transaction_completed(db, events):
+    """Pay the seller (swap bonus or the redeemed item's value) and notify both parties."""
+    tids = [e.aggregate_id for e in events]
+    paid = _ledger_entries(db, ("successful_swap", "item_redeemed"), tids)
+    notified = _notified(db, "transaction_completed", tids)
+
+    ledger, notifications = [], []
+    for e in events:
+        tid, payload = e.aggregate_id, e.payload
+        seller = payload["receiver_uid"]
+        if payload["transaction_type"] == "swap":
+            entry = (seller, SWAP_COMPLETION_BONUS, "successful_swap", tid, "Bonus for completing a swap")
+        else:
+            entry = (seller, payload["point_value"], "item_redeemed", tid,
+                     f"Points for redeemed item: {payload['title']}")
+        if seller is not None and (seller, entry[2], tid) not in paid:
+            paid.add((seller, entry[2], tid))
+            ledger.append(entry)
+        for uid in (payload["requester_uid"], seller):
+            if uid is not None and (uid, tid) not in notified:
+                notified.add((uid, tid))
+                notifications.append((uid, "Your transaction has been completed successfully!",
+                                      "transaction_completed", tid))
+
+    queue_point_transactions(db, ledger)
+    queue_notifications(db, notifications)
+
+
+def handle_product_approved(db, events):
+    """Award the listing's points, notify its owner and alert matching saved searches."""
+    pids = [e.aggregate_id for e in events]
+    paid = _ledger_entries(db, ("item_approved",), pids)
+    notified = _notified(db, "product_approved", pids)
+    alerted = {pid for _, pid in _notified(db, "saved_search_match", pids)}
+
+    ledger, notifications = [], []
+    for e in events:
+        pid, payload = e.aggregate_id, e.payload
+        uid = payload["uid"]
+        if (uid, "item_approved", pid) not in paid:
+            paid.add((uid, "item_approved", pid))
+            ledger.append((uid, payload["point_value"], "item_approved", pid,
+                           f"Points for approved item: {payload['title']}"))
+        if (uid, pid) not in notified:
+            notified.add((uid, pid))
+            notifications.append((uid, f"Your item '{payload['title']}' has been approved!", "product_approved", pid))
+
+    queue_point_transactions(db, ledger)
+    queue_notifications(db, notifications)
+
+    # Alerts for a product commit all together, so any existing one means they were sent
+    fresh = [pid for pid in dict.fromkeys(pids) if pid not in alerted]
+    if fresh:
+        notify_saved_searches(db, db.execute(
+            select(Product.pid, Product.uid, Product.title, Product.category, Product.size,
+                   Product.condition, Product.point_value)
+            .where(Product.pid.in_(fresh), Product.status == "available")
+        ).all())
+
+
+def handle_transaction_rejected(db, events):
+    """Refund the requester (redemption cost or swap fee) and tell them."""
+    tids = [e.aggregate_id for e in events]
+    refunded = _ledger_entries(db, ("redemption_refund", "swap_fee_refund"), tids)
+    notified = _notified(db, "transaction_rejected", tids)
+
+    ledger, notifications = [], []
+    for e in events:
+        tid, payload = e.aggregate_id, e.payload
+        uid = payload["requester_uid"]
+        if payload["transaction_type"] == "redemption":
+            entry = (uid, payload["refund"], "redemption_refund", tid, "Refund for rejected redemption")
+        else:
+            entry = (uid, payload["refund"], "swap_fee_refund", tid, "Refund for rejected swap request")
+        if (uid, entry[2], tid) not in refunded:
+            refunded.add((uid, entry[2], tid))
+            ledger.append(entry)
+        if (uid, tid) not in notified:
+            notified.add((uid, tid))
+            notifications.append((uid, "Your transaction request has been rejected.", "transaction_rejected", tid))
+
+    queue_point_transactions(db, ledger)
+    queue_notifications(db, notifications)
+
+
+def handle_product_created(db, events):
+    """Award the listing bonus."""
+    pids = [e.aggregate_id for e in events]
+    paid = _ledger_entries(db, ("item_listing",), pids)
+
+    ledger = []
+    for e in events:
+        pid, uid = e.aggregate_id, e.payload["uid"]
+        if (uid, "item_listing", pid) not in paid:
+            paid.add((uid, "item_listing", pid))
+            ledger.append((uid, e.payload["points"], "item_listing", pid, "Points for listing an item"))
+    queue_point_transactions(db, ledger)
+
+
+def handle_product_rejected(db, events):
+    """Tell the owner; the listing itself is already gone."""
+    pids = [e.aggregate_id for e in events]
+    notified = _notified(db, "product_rejected", pids)
+
+    notifications = []
+    for e in events:
+        pid, uid = e.aggregate_id, e.payload["uid"]
+        if (uid, pid) not in notified:
+            notified.add((uid, pid))
+            notifications.append((uid, f"Your item '{e.payload['title']}' was not approved.", "product_rejected", pid))
+    queue_notifications(db, notifications)
+
+
+HANDLERS = {
+    "transaction_completed": handle_transaction_completed,
+    "transaction_rejected": handle_transaction_rejected,
+    "product_created": handle_product_created,
+    "product_approved": handle_product_approved,
+    "product_rejected": handle_product_rejected,
+}
+
+
+# Delivery
+def retry_delay(attempts):
+    """Seconds before an event that has failed `attempts` times is tried again."""
+    return min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+
+
+def _pending(limit, event_ids=None):
+    statement = (
+        select(OutboxEvent)
+        .where(
+            OutboxEvent.processed_at.is_(None),
+            OutboxEvent.attempts < MAX_ATTEMPTS,
+            or_(OutboxEvent.next_attempt_at.is_(None), OutboxEvent.next_attempt_at <= datetime.utcnow()),
+        )
+        .order_by(OutboxEvent.event_id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    if event_ids is not None:
+        statement = statement.where(OutboxEvent.event_id.in_(event_ids))
+    return statement
+
+
+def _deliver(db, events):
+    by_type = {}
+    for e in events:
+        by_type.setdefault(e.event_type, []).append(e)
+    for event_type, batch in by_type.items():
+        handler = HANDLERS.get(event_type)
+        if handler is None:
+            raise ValueError(f"no handler for {event_type} events")
+        handler(db, batch)
+    now = datetime.utcnow()
+    for e in events:
+        e.processed_at = now
+        e.attempts += 1
+        e.last_error = None
+        e.next_attempt_at = None
+
+
+def _dispatch_one(event_id):
+    db = SessionLocal()
+    try:
+        found = db.execute(_pending(1, [event_id])).scalar()
+        if found is None:
+            return 0
+        attempts = found.attempts + 1
+        try:
+            _deliver(db, [found])
+            db.commit()
+            return 1
+        except Exception as e:
+            db.rollback()
+            print(f"Error delivering outbox event {event_id}: {e}")
+            db.execute(
+                update(OutboxEvent).where(OutboxEvent.event_id == event_id)
+                .values(attempts=attempts, last_error=str(e)[:2000],
+                        next_attempt_at=datetime.utcnow() + timedelta(seconds=retry_delay(attempts)))
+            )
+            db.commit()
+            return 0
+    finally:
+        db.close()
+
+
+def dispatch_batch(limit=BATCH_SIZE):
+    """Deliver up to `limit` pending events; returns how many were claimed."""
+    db = SessionLocal()
+    try:
+        events = db.execute(_pending(limit)).scalars().all()
+        if not events:
+            return 0
+        event_ids = [e.event_id for e in events]
+        try:
+            _deliver(db, events)
+            db.commit()
+            return len(events)
+        except Exception:
+            db.rollback()
+    finally:
+        db.close()
+
+    # Keep one bad event from holding back the rest of its batch
+    for event_id in event_ids:
+        _dispatch_one(event_id)
+    return len(event_ids)
+
+
+def prune(days=RETENTION_DAYS):
+    db = SessionLocal()
+    try:
+        result = db.execute(delete(OutboxEvent).where(
+            OutboxEvent.processed_at.isnot(None),
+            OutboxEvent.processed_at < datetime.utcnow() - timedelta(days=days)
+        ))
+        db.commit()
+        return result.rowcount
+    finally:
+        db.close()
+
+
+class Dispatcher:
+    """Per-process background thread delivering outbox events."""
+
+    def __init__(self, batch_size=BATCH_SIZE, interval=POLL_INTERVAL):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.autostart = True
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pruned_at = monotonic()
+
+    def after_fork(self):
+        self._reset()
+
+    def wake(self):
+        self._wake.set()
+        if self.autostart:
+            self.ensure_running()
+
+    def ensure_running(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, name="outbox-dispatcher", daemon=True)
+                self._thread.start()
+
+    def run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                # A full batch means there may be more behind it
+                while dispatch_batch(self.batch_size) == self.batch_size:
+                    pass
+                if monotonic() - self._pruned_at > PRUNE_INTERVAL:
+                    self._pruned_at = monotonic()
+                    prune()
+            except Exception as e:
+                print(f"Error dispatching outbox events: {e}")
+
+
+dispatcher = Dispatcher()
+os.register_at_fork(after_in_child=dispatcher.after_fork)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def wake_dispatcher(db):
+    if db.info.pop("outbox_events", None):
+        dispatcher.wake()
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def forget_events(db):
+    db.info.pop("outbox_events", None)
+
+
+def status():
+    db = SessionLocal()
+    try:
+        pending = OutboxEvent.processed_at.is_(None)
+        return {
+            "pending": db.execute(select(func.count()).where(pending, OutboxEvent.attempts < MAX_ATTEMPTS)).scalar(),
+            "dead": db.execute(select(func.count()).where(pending, OutboxEvent.attempts >= MAX_ATTEMPTS)).scalar(),
+            "oldest_pending": db.execute(select(func.min(OutboxEvent.created_at)).where(pending)).scalar(),
+            "by_type": dict(db.execute(
+                select(OutboxEvent.event_type, func.count()).where(pending).group_by(OutboxEvent.event_type)
+            ).all()),
+        }
+    finally:
+        db.close()
+
+
+def retry(event_ids=None):
+    """Give dead events a fresh set of attempts; with ids, also replay delivered ones."""
+    db = SessionLocal()
+    try:
+        statement = update(OutboxEvent).values(attempts=0, last_error=None, processed_at=None, next_attempt_at=None)
+        if event_ids:
+            statement = statement.where(OutboxEvent.event_id.in_(event_ids))
+        else:
+            statement = statement.where(OutboxEvent.processed_at.is_(None), OutboxEvent.attempts >= MAX_ATTEMPTS)
+        count = db.execute(statement).rowcount
+        db.commit()
+        return count
+    finally:
+        db.close()
+
+
+def benchmark(count=200):
+    """complete_transaction() latency with the side effects inline vs left to the dispatcher."""
+    from time import perf_counter
+    from database import engine, create_redemption_request, accept_transaction, complete_transaction
+    from stress import Fixture, ITEM_POINTS, REDEMPTION_COST, percentile
+
+    dispatcher.autostart = False
+    fixture = Fixture(engine)
+    timings = {"outbox": [], "inline": []}
+    tids = []
+    try:
+        buyer = fixture.users(1, REDEMPTION_COST * count * 2)[0]
+        for pid in fixture.products(fixture.users(count * 2, 0)):
+            tid = create_redemption_request(buyer, pid)
+            accept_transaction(tid)
+            tids.append(tid)
+
+        for i, tid in enumerate(tids):
+            mode = "outbox" if i < count else "inline"
+            if i == count:
+                dispatch_batch(count)  # deliver the first half before timing the second
+            started = perf_counter()
+            complete_transaction(tid)
+            if mode == "inline":
+                # What the request used to wait for: the seller's points and both notifications
+                dispatch_batch()
+            timings[mode].append(perf_counter() - started)
+
+        with engine.connect() as conn:
+            earned = conn.execute(
+                select(func.count()).where(PointTransaction.transaction_type == "item_redeemed",
+                                           PointTransaction.reference_id.in_(tids))
+            ).scalar()
+    finally:
+        with engine.begin() as conn:
+            conn.execute(delete(OutboxEvent).where(OutboxEvent.event_type == "transaction_completed",
+                                                   OutboxEvent.aggregate_id.in_(tids)))
+        fixture.cleanup()
+
+    for mode, latencies in timings.items():
+        print(f"{mode:<8} p50 {percentile(latencies, 50) * 1000:7.2f} ms   p99 {percentile(latencies, 99) * 1000:7.2f} ms")
+    print(f"{earned}/{len(tids)} sellers paid ({ITEM_POINTS} points per item)")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Outbox dispatcher")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("run", help="deliver events until interrupted")
+    commands.add_parser("status")
+    revive = commands.add_parser("retry")
+    revive.add_argument("event_ids", type=int, nargs="*")
+    bench = commands.add_parser("benchmark")
+    bench.add_argument("count", type=int, nargs="?", default=200)
+    args = parser.parse_args()
+
+    try:
+        if args.command == "run":
+            dispatcher.autostart = False
+            dispatcher.run()
+        elif args.command == "status":
+            print(status())
+        elif args.command == "retry":
+            print(f"{retry(args.event_ids)} events queued for delivery")
+        else:
+            benchmark(args.count)
+    except Exception as e:
+        print(f"Error: {e}")
@@ -0,0 +1,319 @@
+"""Overload protection: query deadlines, bounded waits and admission control.
+
+Every request is put in a class by its endpoint:
+
+  browse     cheap catalog reads (landing, product pages, product API, suggestions)
+  standard   admin typeahead and everything else that isn't listed
+  expensive  admin pages, exports, imports, moderation, swaps and redemptions
+
+and gets a deadline for its database work (DEADLINES_MS, overridden per
+endpoint by ROUTE_DEADLINES_MS). On Postgres each pooled connection is set to
+the route's statement_timeout when checked out (only when it changes), on
+SQLite a progress handler aborts statements past the deadline; in both cases
+a statement that would start after the deadline raises DeadlineExceeded
+without reaching the database, and one stopped by the deadline while running
+raises StatementCancelled. Pool checkouts wait at most DB_POOL_TIMEOUT seconds
+(database.py). All of these (OVERLOAD_ERRORS) end in a fast 503 with
+Retry-After. The data helpers log and return an empty default on errors, which
+for these would render as "not found" or "wrong password"; guard() (applied to
+every helper of a module by guard_module) raises an overload error the helper
+swallowed once it returns. Other database errors keep the helpers' handling.
+
+Admission is per worker process. Browse requests are always admitted. The
+other classes together may only occupy threads - BROWSE_RESERVED threads, so
+a slow database can't tie up every thread of a worker with work that will
+time out anyway; expensive requests additionally share EXPENSIVE_SLOTS
+slots and are turned away at once when none is free, standard requests wait
+up to STANDARD_WAIT seconds for one.
+
+    python chaos.py --db-delay-ms 200    # slow the database, check browse p99
+"""
+import inspect
+import os
+import threading
+from collections import Counter
+from functools import wraps
+from time import perf_counter
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+WORKER_THREADS = int(os.getenv("GUNICORN_THREADS", "4"))
+BROWSE_RESERVED = int(os.getenv("OVERLOAD_BROWSE_RESERVED", "1"))
+EXPENSIVE_SLOTS = int(os.getenv("OVERLOAD_EXPENSIVE_SLOTS", "1"))
+STANDARD_WAIT = float(os.getenv("OVERLOAD_STANDARD_WAIT", "0.25"))
+RETRY_AFTER_SECONDS = 2
+
+DEADLINES_MS = {
+    "browse": int(os.getenv("DEADLINE_BROWSE_MS", "2000")),
+    "standard": int(os.getenv("DEADLINE_STANDARD_MS", "5000")),
+    "expensive": int(os.getenv("DEADLINE_EXPENSIVE_MS", "15000")),
+}
+
+# Endpoints whose work doesn't fit their class's deadline
+ROUTE_DEADLINES_MS = {
+    "export_table": 300000,
+    "import_products": 120000,
+}
+
+BROWSE_ENDPOINTS = {
+    "static", "index", "landing_page", "product_detail",
+    "api_v1.products", "api_v1.trending", "api_v1.product", "api_v1.facets", "suggest.suggest",
+}
+EXPENSIVE_ENDPOINTS = {"moderate_products", "import_products", "export_table"}
+EXPENSIVE_KEYWORDS = ("admin", "swap", "redeem", "redemption", "export")
+# Admin typeahead enforces its own 200 ms budget (admin_search.py); sharing the
+# expensive slots with exports and the streamed admin panel would turn every
+# keystroke into a 503 while one of those is open
+STANDARD_ENDPOINTS = {"admin_search_users", "admin_search_transactions"}
+# Long-lived streams hold a thread by design (notifications.py caps them per worker);
+# they are not counted or given a deadline
+EXEMPT_ENDPOINTS = {"notifications.stream"}
+
+
+class DeadlineExceeded(Exception):
+    """The request's database deadline passed before a statement could start."""
+
+
+class StatementCancelled(DeadlineExceeded):
+    """A running statement was stopped by the request's deadline (statement_timeout or the progress handler)."""
+
+
+# What guard() raises through the helpers' error handling, and init_overload turns into a 503
+OVERLOAD_ERRORS = (DeadlineExceeded, PoolTimeoutError)
+
+
+def classify(endpoint):
+    """'browse', 'standard', 'expensive', or None for requests left alone."""
+    if endpoint is None or endpoint in EXEMPT_ENDPOINTS:
+        return None
+    if endpoint in BROWSE_ENDPOINTS:
+        return "browse"
+    if endpoint in STANDARD_ENDPOINTS:
+        return "standard"
+    name = endpoint.rsplit(".", 1)[-1]
+    if endpoint in EXPENSIVE_ENDPOINTS or any(keyword in name for keyword in EXPENSIVE_KEYWORDS):
+        return "expensive"
+    return "standard"
+
+
+def deadline_ms(endpoint, kind):
+    return ROUTE_DEADLINES_MS.get(endpoint, DEADLINES_MS[kind])
+
+
+class _Budget(threading.local):
+    deadline = None    # perf_counter() by which the current request's statements must have started
+    timeout_ms = None  # statement_timeout for its Postgres statements
+    overload = None    # the last overload error raised in this thread, for guard()
+    depth = 0          # guarded helpers currently running in this thread
+
+
+budget = _Budget()
+
+
+def set_deadline(timeout_ms):
+    budget.deadline = perf_counter() + timeout_ms / 1000
+    budget.timeout_ms = timeout_ms
+    budget.overload = None
+
+
+def clear_deadline():
+    budget.deadline = budget.timeout_ms = None
+    budget.overload = None
+
+
+def _noted(error):
+    budget.overload = error
+    return error
+
+
+def guard(f):
+    """Raise an overload error that `f`'s own except-Exception handling logged and swallowed."""
+    @wraps(f)
+    def guarded(*args, **kwargs):
+        if budget.depth == 0:
+            budget.overload = None
+        budget.depth += 1
+        try:
+            result = f(*args, **kwargs)
+        finally:
+            budget.depth -= 1
+        if budget.overload is not None:
+            raise budget.overload
+        return result
+    return guarded
+
+
+def guard_module(namespace, module_name):
+    """guard() every plain function defined in a module's namespace (as profiling.instrument_module does)."""
+    for name, value in list(namespace.items()):
+        if (inspect.isfunction(value) and value.__module__ == module_name
+                and not name.startswith("_") and not inspect.isgeneratorfunction(value)):
+            namespace[name] = guard(value)
+
+
+def is_cancelled(error):
+    """A statement stopped by statement_timeout (57014) or the SQLite progress handler."""
+    orig = getattr(error, "orig", error)
+    return getattr(orig, "pgcode", None) == "57014" or "interrupted" in str(orig)
+
+
+class GuardedQueuePool(QueuePool):
+    """QueuePool whose checkout timeouts are noted for guard(); no pool event sees them."""
+
+    def _do_get(self):
+        try:
+            return super()._do_get()
+        except PoolTimeoutError as e:
+            raise _noted(e)
+
+
+def install_deadlines(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def check_deadline(conn, cursor, statement, parameters, context, executemany):
+        if budget.deadline is not None and perf_counter() > budget.deadline:
+            raise _noted(DeadlineExceeded(f"deadline of {budget.timeout_ms} ms passed"))
+
+    @event.listens_for(engine, "handle_error")
+    def cancelled_by_deadline(context):
+        # Only cancellations at or past the request's deadline: a statement's own
+        # shorter timeout (admin_search.run_within) stays an OperationalError
+        if (budget.deadline is not None and perf_counter() >= budget.deadline
+                and is_cancelled(context.original_exception)):
+            return _noted(StatementCancelled(f"statement cancelled at the {budget.timeout_ms} ms deadline"))
+        return None
+
+    if engine.dialect.name == "postgresql":
+        @event.listens_for(engine, "checkout")
+        def apply_statement_timeout(dbapi_connection, connection_record, connection_proxy):
+            wanted = budget.timeout_ms
+            if connection_record.info.get("statement_timeout") == wanted:
+                return
+            cursor = dbapi_connection.cursor()
+            if wanted:
+                cursor.execute(f"SET statement_timeout = {int(wanted)}")
+            else:
+                # Background work (flushers, CLIs) runs with the server's setting
+                cursor.execute("SET statement_timeout TO DEFAULT")
+            cursor.close()
+            # Commit so a later rollback doesn't undo the SET
+            dbapi_connection.commit()
+            connection_record.info["statement_timeout"] = wanted
+
+    elif engine.dialect.name == "sqlite":
+        @event.listens_for(engine, "connect")
+        def install_progress_handler(dbapi_connection, connection_record):
+            dbapi_connection.set_progress_handler(
+                lambda: budget.deadline is not None and perf_counter() > budget.deadline, 10000
+            )
+
+
+class AdmissionController:
+    """Per-process concurrency limits by request class."""
+
+    def __init__(self, threads=WORKER_THREADS, browse_reserved=BROWSE_RESERVED,
+                 expensive_slots=EXPENSIVE_SLOTS, standard_wait=STANDARD_WAIT):
+        self.shared_limit = max(1, threads - browse_reserved)
+        self.expensive_slots = max(1, min(expensive_slots, self.shared_limit))
+        self.standard_wait = standard_wait
+        self._reset()
+
+    def _reset(self):
+        self._changed = threading.Condition()
+        self.active = Counter()
+        self.admitted = Counter()
+        self.rejected = Counter()
+
+    def after_fork(self):
+        self._reset()
+
+    def _has_room(self, kind):
+        if kind == "browse":
+            return True
+        if self.active["standard"] + self.active["expensive"] >= self.shared_limit:
+            return False
+        return kind != "expensive" or self.active["expensive"] < self.expensive_slots
+
+    def admit(self, kind):
+        with self._changed:
+            if not self._has_room(kind) and kind == "standard":
+                self._changed.wait_for(lambda: self._has_room(kind), timeout=self.standard_wait)
+            if not self._has_room(kind):
+                self.rejected[kind] += 1
+                return False
+            self.active[kind] += 1
+            self.admitted[kind] += 1
+            return True
+
+    def release(self, kind):
+        with self._changed:
+            self.active[kind] -= 1
+            self._changed.notify_all()
+
+    def stats(self):
+        with self._changed:
+            return {"active": dict(self.active), "admitted": dict(self.admitted), "rejected": dict(self.rejected)}
+
+
+admission = AdmissionController()
+os.register_at_fork(after_in_child=admission.after_fork)
+
+
+def init_overload(flask_app):
+    """Admission control and deadlines for every request; 503s for overload errors."""
+    from flask import request, jsonify
+
+    def overloaded(reason):
+        if request.path.startswith("/api") or request.accept_mimetypes.best == "application/json":
+            response = jsonify({"error": "Service temporarily overloaded, please retry", "reason": reason})
+        else:
+            response = flask_app.response_class(
+                "ReWear is busy right now. Please try again in a moment.", mimetype="text/plain"
+            )
+        response.status_code = 503
+        response.headers["Retry-After"] = str(RETRY_AFTER_SECONDS)
+        response.headers["Cache-Control"] = "no-store"
+        return response
+
+    def finish(kind):
+        clear_deadline()
+        admission.release(kind)
+
+    @flask_app.before_request
+    def admit_request():
+        kind = classify(request.endpoint)
+        if kind is None:
+            return None
+        if not admission.admit(kind):
+            return overloaded("admission")
+        request.environ["rewear.admission"] = kind
+        set_deadline(deadline_ms(request.endpoint, kind))
+        return None
+
+    @flask_app.after_request
+    def hold_for_stream(response):
+        # A streamed body (exports) does its database work after teardown: keep the
+        # slot and the deadline until the server closes the response
+        kind = request.environ.get("rewear.admission")
+        if kind is not None and response.is_streamed:
+            request.environ["rewear.admission"] = None
+            response.call_on_close(lambda: finish(kind))
+        return response
+
+    @flask_app.teardown_request
+    def release_request(exc):
+        kind = request.environ.pop("rewear.admission", None)
+        if kind is not None:
+            finish(kind)
+
+    @flask_app.errorhandler(DeadlineExceeded)
+    def deadline_exceeded(e):
+        return overloaded("deadline")
+
+    @flask_app.errorhandler(StatementCancelled)
+    def statement_cancelled(e):
+        return overloaded("statement_timeout")
+
+    @flask_app.errorhandler(PoolTimeoutError)
+    def pool_exhausted(e):
+        return overloaded("pool")
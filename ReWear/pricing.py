@@ -0,0 +1,400 @@
+"""Table-driven pricing rules and bulk re-pricing.
+
+A pricing version is a full rule set stored in pricing_versions /
+pricing_rules: base points per category, point modifiers per (category,
+subcategory) and multipliers per condition, plus the default base and the
+minimum. One version is active. Each process keeps it as a PricingTable
+(plain dicts) and checks every PRICING_RELOAD_INTERVAL seconds whether
+another version was activated; calculate_points() in database.py prices with
+it, falling back to the rules in database.py when nothing can be loaded.
+
+Activating a version only prices new listings. `reprice` brings existing
+products in line: it walks them by pid in batches, prices each batch with
+vectorized NumPy lookups (columns factorized into small index arrays, then
+one gather per rule), and either reports the differences (the default, a
+dry run) or writes them with set-based UPDATE ... FROM (VALUES ...)
+statements, one transaction per batch. Each update is guarded by the old
+point_value, so a product edited in the meantime is left alone.
+
+    python pricing.py show [VERSION]
+    python pricing.py create rules.json --note "Winter economy"   # new, inactive
+    python pricing.py activate 3
+    python pricing.py reprice [--version 3] [--diff-file changes.csv]   # dry run
+    python pricing.py reprice --apply
+    python pricing.py benchmark 5000000
+
+rules.json uses the layout printed by `show`.
+"""
+import csv
+import json
+import os
+import threading
+from collections import Counter
+from datetime import datetime
+from time import monotonic, perf_counter
+from sqlalchemy import select, insert, update, values, column, true, Integer
+from database import (
+    engine,
+    Product,
+    PricingVersion,
+    PricingRule,
+    BASE_POINTS,
+    SUBCATEGORY_MODIFIERS,
+    CONDITION_MULTIPLIERS,
+)
+
+RELOAD_INTERVAL = float(os.getenv("PRICING_RELOAD_INTERVAL", "30"))
+REPRICE_BATCH = 100000
+UPDATE_CHUNK = 5000
+REPRICED_STATUSES = ("pending", "available")
+
+
+class PricingTable:
+    """The rules of one pricing version as in-memory lookups."""
+
+    def __init__(self, base, modifiers, multipliers, default_base=30, min_points=10, version_id=None):
+        self.base = dict(base)                # category -> points
+        self.modifiers = dict(modifiers)      # (category, subcategory) -> points
+        self.multipliers = dict(multipliers)  # condition -> factor
+        self.default_base = default_base
+        self.min_points = min_points
+        self.version_id = version_id
+
+    @classmethod
+    def defaults(cls):
+        modifiers = {
+            (category, subcategory): modifier
+            for category, subcategories in SUBCATEGORY_MODIFIERS.items()
+            for subcategory, modifier in subcategories.items()
+        }
+        return cls(BASE_POINTS, modifiers, CONDITION_MULTIPLIERS)
+
+    @classmethod
+    def from_rules(cls, rules):
+        """Build from the JSON layout of `show` / `create`."""
+        modifiers = {
+            (category, subcategory): modifier
+            for category, subcategories in rules.get("subcategory_modifiers", {}).items()
+            for subcategory, modifier in subcategories.items()
+        }
+        return cls(rules.get("base_points", {}), modifiers, rules.get("condition_multipliers", {}),
+                   rules.get("default_base_points", 30), rules.get("min_points", 10))
+
+    def to_rules(self):
+        modifiers = {}
+        for (category, subcategory), modifier in sorted(self.modifiers.items()):
+            modifiers.setdefault(category, {})[subcategory] = modifier
+        return {
+            "version_id": self.version_id,
+            "default_base_points": self.default_base,
+            "min_points": self.min_points,
+            "base_points": dict(sorted(self.base.items())),
+            "subcategory_modifiers": modifiers,
+            "condition_multipliers": dict(sorted(self.multipliers.items())),
+        }
+
+    def points(self, category, subcategory, condition):
+        base = self.base.get(category, self.default_base)
+        modifier = self.modifiers.get((category, subcategory), 0)
+        total = int((base + modifier) * self.multipliers.get(condition, 1.0))
+        return max(self.min_points, total)
+
+    def points_batch(self, categories, subcategories, conditions):
+        """points() over whole columns; returns a NumPy int64 array.
+
+        Each column is factorized to small integer codes, the rules become
+        arrays indexed by those codes, and the price is three gathers and a
+        multiply, whatever the number of rows.
+        """
+        import numpy as np
+
+        category_keys, category_codes = np.unique(np.asarray(categories, dtype=str), return_inverse=True)
+        subcategory_keys, subcategory_codes = np.unique(np.asarray(subcategories, dtype=str), return_inverse=True)
+        condition_keys, condition_codes = np.unique(np.asarray(conditions, dtype=str), return_inverse=True)
+
+        base = np.array([self.base.get(key, self.default_base) for key in category_keys], dtype=np.float64)
+        modifier = np.array(
+            [[self.modifiers.get((category, subcategory), 0) for subcategory in subcategory_keys]
+             for category in category_keys],
+            dtype=np.float64
+        ).reshape(len(category_keys), len(subcategory_keys))
+        multiplier = np.array([self.multipliers.get(key, 1.0) for key in condition_keys], dtype=np.float64)
+
+        category_codes = category_codes.reshape(-1)
+        total = (base[category_codes] + modifier[category_codes, subcategory_codes.reshape(-1)]) \
+            * multiplier[condition_codes.reshape(-1)]
+        # int() truncates toward zero, as np.trunc does
+        return np.maximum(np.trunc(total).astype(np.int64), self.min_points)
+
+
+def load_table(conn, version_id):
+    version = conn.execute(
+        select(PricingVersion.default_base_points, PricingVersion.min_points)
+        .where(PricingVersion.version_id == version_id)
+    ).first()
+    if version is None:
+        raise ValueError(f"pricing version {version_id} does not exist")
+
+    base, modifiers, multipliers = {}, {}, {}
+    rules = conn.execute(
+        select(PricingRule.rule, PricingRule.category, PricingRule.subcategory, PricingRule.condition, PricingRule.value)
+        .where(PricingRule.version_id == version_id)
+    )
+    for rule, category, subcategory, condition, value in rules:
+        if rule == "base":
+            base[category] = value
+        elif rule == "modifier":
+            modifiers[(category, subcategory)] = value
+        else:
+            multipliers[condition] = value
+    return PricingTable(base, modifiers, multipliers, version.default_base_points, version.min_points, version_id)
+
+
+def active_version_id(conn):
+    return conn.execute(select(PricingVersion.version_id).where(PricingVersion.is_active == true())).scalar()
+
+
+class _ActiveTable:
+    """The active version's table, re-checked every RELOAD_INTERVAL seconds."""
+
+    def __init__(self):
+        self.table = None
+        self.checked = 0.0
+        self.lock = threading.Lock()
+
+    def after_fork(self):
+        self.lock = threading.Lock()
+
+    def get(self):
+        if self.table is not None and monotonic() - self.checked < RELOAD_INTERVAL:
+            return self.table
+        with self.lock:
+            if self.table is None or monotonic() - self.checked >= RELOAD_INTERVAL:
+                self.checked = monotonic()
+                try:
+                    with engine.connect() as conn:
+                        version_id = active_version_id(conn)
+                        if version_id is None:
+                            self.table = PricingTable.defaults()
+                        elif self.table is None or self.table.version_id != version_id:
+                            self.table = load_table(conn, version_id)
+                except Exception as e:
+                    print(f"Error loading pricing rules: {e}")
+                    self.table = self.table or PricingTable.defaults()
+        return self.table
+
+    def invalidate(self):
+        self.checked = 0.0
+
+
+_active = _ActiveTable()
+os.register_at_fork(after_in_child=_active.after_fork)
+
+
+def current_table():
+    return _active.get()
+
+
+# Versions
+def _rule_rows(version_id, table):
+    rows = [{"version_id": version_id, "rule": "base", "category": category, "subcategory": "", "condition": "",
+             "value": value} for category, value in table.base.items()]
+    rows += [{"version_id": version_id, "rule": "modifier", "category": category, "subcategory": subcategory,
+              "condition": "", "value": value} for (category, subcategory), value in table.modifiers.items()]
+    rows += [{"version_id": version_id, "rule": "multiplier", "category": "", "subcategory": "", "condition": condition,
+              "value": value} for condition, value in table.multipliers.items()]
+    return rows
+
+
+def create_version(table, note=None):
+    """Store `table` as a new, inactive version; returns its id."""
+    with engine.begin() as conn:
+        version_id = conn.execute(
+            insert(PricingVersion).values(
+                note=note, default_base_points=table.default_base, min_points=table.min_points, is_active=False
+            ).returning(PricingVersion.version_id)
+        ).scalar()
+        conn.execute(insert(PricingRule), _rule_rows(version_id, table))
+    return version_id
+
+
+def activate_version(version_id):
+    with engine.begin() as conn:
+        # Row lock on the target first: concurrent activations serialize here
+        found = conn.execute(
+            select(PricingVersion.version_id).where(PricingVersion.version_id == version_id).with_for_update()
+        ).scalar()
+        if found is None:
+            raise ValueError(f"pricing version {version_id} does not exist")
+        conn.execute(update(PricingVersion).where(PricingVersion.is_active == true()).values(is_active=False))
+        conn.execute(
+            update(PricingVersion).where(PricingVersion.version_id == version_id)
+            .values(is_active=True, activated_at=datetime.utcnow())
+        )
+    _active.invalidate()
+
+
+def ensure_default_version():
+    """Seed version 1 from the rules in database.py when no version exists yet."""
+    with engine.connect() as conn:
+        if conn.execute(select(PricingVersion.version_id).limit(1)).first() is not None:
+            return None
+    version_id = create_version(PricingTable.defaults(), note="Initial rules from database.py")
+    activate_version(version_id)
+    return version_id
+
+
+# Re-pricing
+def reprice_update(rows, now):
+    """UPDATE products FROM (VALUES (pid, old points, new points), ...), skipping rows changed since read."""
+    batch = values(
+        column("pid", Integer), column("old_points", Integer), column("new_points", Integer), name="batch"
+    ).data(rows)
+    return (
+        update(Product)
+        .where(Product.pid == batch.c.pid, Product.point_value == batch.c.old_points)
+        .values(point_value=batch.c.new_points, updated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def reprice(version_id=None, apply=False, diff_file=None, statuses=REPRICED_STATUSES):
+    """Compare (and with apply=True, write) every product's point_value against a version's rules."""
+    import numpy as np
+
+    with engine.connect() as conn:
+        version_id = version_id or active_version_id(conn)
+        table = load_table(conn, version_id) if version_id else PricingTable.defaults()
+
+    statement = (
+        select(Product.pid, Product.category, Product.subcategory, Product.condition, Product.point_value)
+        .where(Product.status.in_(statuses))
+        .order_by(Product.pid)
+        .limit(REPRICE_BATCH)
+    )
+    report = {"version_id": version_id, "scanned": 0, "changed": 0, "written": 0, "points_delta": 0,
+              "changes": Counter()}  # (category, subcategory, condition, old, new) -> products
+    started = perf_counter()
+    diff_handle = open(diff_file, "w", newline="") if diff_file else None
+    try:
+        diff = csv.writer(diff_handle) if diff_handle else None
+        if diff:
+            diff.writerow(["pid", "category", "subcategory", "condition", "old_points", "new_points"])
+        last_pid = 0
+        while True:
+            with engine.connect() as conn:
+                rows = conn.execute(statement.where(Product.pid > last_pid)).all()
+            if not rows:
+                break
+            last_pid = rows[-1].pid
+            report["scanned"] += len(rows)
+
+            pids, categories, subcategories, conditions, old = zip(*rows)
+            old = np.asarray(old, dtype=np.int64)
+            new = table.points_batch(categories, subcategories, conditions)
+            changed = np.flatnonzero(new != old)
+            if not changed.size:
+                continue
+
+            report["changed"] += int(changed.size)
+            report["points_delta"] += int((new[changed] - old[changed]).sum())
+            updates = []
+            for i, old_points, new_points in zip(changed.tolist(), old[changed].tolist(), new[changed].tolist()):
+                report["changes"][(categories[i], subcategories[i], conditions[i], old_points, new_points)] += 1
+                updates.append((pids[i], old_points, new_points))
+                if diff:
+                    diff.writerow([pids[i], categories[i], subcategories[i], conditions[i], old_points, new_points])
+
+            if apply:
+                now = datetime.utcnow()
+                with engine.begin() as conn:
+                    for start in range(0, len(updates), UPDATE_CHUNK):
+                        result = conn.execute(reprice_update(updates[start:start + UPDATE_CHUNK], now))
+                        report["written"] += result.rowcount
+    finally:
+        if diff_handle:
+            diff_handle.close()
+
+    report["seconds"] = perf_counter() - started
+    return report
+
+
+def print_report(report, apply, limit=30):
+    seconds = max(report["seconds"], 1e-9)
+    print(f"pricing version {report['version_id'] or 'defaults'}: scanned {report['scanned']} products "
+          f"in {report['seconds']:.1f}s ({report['scanned'] / seconds:,.0f} rows/s)")
+    print(f"{report['changed']} would change, total points {report['points_delta']:+d}")
+    if apply:
+        skipped = report["changed"] - report["written"]
+        print(f"updated {report['written']}" + (f", {skipped} skipped (edited since read)" if skipped else ""))
+    if report["changes"]:
+        print(f"\n{'category':<16}{'subcategory':<18}{'condition':<12}{'old':>6}{'new':>6}{'products':>10}")
+        for (category, subcategory, condition, old, new), count in report["changes"].most_common(limit):
+            print(f"{category:<16}{subcategory:<18}{condition:<12}{old:>6}{new:>6}{count:>10}")
+        if len(report["changes"]) > limit:
+            print(f"... {len(report['changes']) - limit} more groups")
+
+
+def benchmark(count):
+    """Per-row points() against points_batch() on `count` synthetic rows."""
+    import random
+
+    table = PricingTable.defaults()
+    pairs = [(category, subcategory) for category, subcategories in SUBCATEGORY_MODIFIERS.items()
+             for subcategory in subcategories] + [("Other", "Other")]
+    conditions = list(CONDITION_MULTIPLIERS)
+    rows = [random.choice(pairs) + (random.choice(conditions),) for _ in range(count)]
+    categories, subcategories, condition_column = zip(*rows)
+
+    started = perf_counter()
+    expected = [table.points(*row) for row in rows]
+    per_row = perf_counter() - started
+
+    started = perf_counter()
+    actual = table.points_batch(categories, subcategories, condition_column)
+    vectorized = perf_counter() - started
+
+    assert actual.tolist() == expected
+    print(f"{count} rows: per-row {per_row:.2f}s ({count / per_row:,.0f} rows/s), "
+          f"vectorized {vectorized:.2f}s ({count / vectorized:,.0f} rows/s), {per_row / vectorized:.1f}x")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Pricing rule versions and bulk re-pricing")
+    commands = parser.add_subparsers(dest="command", required=True)
+    show = commands.add_parser("show", help="print a version's rules (default: the active one)")
+    show.add_argument("version", type=int, nargs="?")
+    create = commands.add_parser("create", help="store rules from a JSON file as a new inactive version")
+    create.add_argument("rules")
+    create.add_argument("--note")
+    activate = commands.add_parser("activate", help="make a version the active one")
+    activate.add_argument("version", type=int)
+    run = commands.add_parser("reprice", help="re-price existing products (dry run unless --apply)")
+    run.add_argument("--version", type=int, help="price with this version (default: the active one)")
+    run.add_argument("--apply", action="store_true", help="write the new point values")
+    run.add_argument("--diff-file", help="write every change as CSV")
+    bench = commands.add_parser("benchmark", help="per-row vs vectorized pricing")
+    bench.add_argument("count", type=int, nargs="?", default=1000000)
+    args = parser.parse_args()
+
+    try:
+        if args.command == "show":
+            with engine.connect() as conn:
+                version_id = args.version or active_version_id(conn)
+                table = load_table(conn, version_id) if version_id else PricingTable.defaults()
+            print(json.dumps(table.to_rules(), indent=2))
+        elif args.command == "create":
+            with open(args.rules) as f:
+                version_id = create_version(PricingTable.from_rules(json.load(f)), note=args.note)
+            print(f"Created pricing version {version_id} (inactive)")
+        elif args.command == "activate":
+            activate_version(args.version)
+            print(f"Pricing version {args.version} is active; run `reprice` to update existing products")
+        elif args.command == "reprice":
+            print_report(reprice(args.version, apply=args.apply, diff_file=args.diff_file), args.apply)
+        else:
+            benchmark(args.count)
+    except Exception as e:
+        print(f"Error: {e}")
@@ -0,0 +1,365 @@
+"""On-demand request profiling.
+
+A request is profiled when it carries an X-Profile header (the PROFILE_TOKEN,
+or "1" from a logged-in admin) or when its endpoint has been switched on from
+the admin panel, which stores a sampling rate per endpoint in
+PROFILE_DIR/routes.json so every worker picks it up within a second.
+
+A profiled request produces two files in PROFILE_DIR:
+
+  <stamp>-<endpoint>.trace.json  Chrome trace events (chrome://tracing, Perfetto,
+                                 speedscope): the request, every database.py
+                                 function, every SQL statement, every template render
+  <stamp>-<endpoint>.folded      stacks of the request thread sampled every
+                                 PROFILE_SAMPLE_INTERVAL seconds, in the collapsed
+                                 format of flamegraph.pl / speedscope / inferno
+
+Spans come from wrappers installed once at import time; when the current
+thread isn't being profiled a wrapper costs one thread-local attribute read.
+`python profiling.py --benchmark` measures that against unwrapped calls.
+"""
+import functools
+import inspect
+import json
+import os
+import random
+import re
+import secrets
+import sys
+import threading
+from collections import Counter
+from datetime import datetime
+from time import monotonic, perf_counter, perf_counter_ns
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_HEADER = "X-Profile"
+SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.001"))
+TOGGLE_CHECK_INTERVAL = 1.0
+MAX_SQL_LABEL = 200
+
+
+class _State(threading.local):
+    trace = None  # the Trace of the request running on this thread, if profiled
+
+
+_state = _State()
+
+
+class Sampler(threading.Thread):
+    """Samples one thread's Python stack at a fixed interval into collapsed stacks."""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if frames:
+                self.stacks[";".join(reversed(frames))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class Trace:
+    """Spans and stack samples of one request."""
+
+    def __init__(self, name, sample=True):
+        self.name = name
+        label = re.sub(r"[^A-Za-z0-9_.-]+", "_", name).strip("_")[:80]
+        self.filename = f"{datetime.utcnow():%Y%m%dT%H%M%S.%f}-{os.getpid()}-{label}"
+        self.thread_id = threading.get_ident()
+        self.origin = perf_counter_ns()
+        self.events = []
+        self.open_templates = []
+        self.sampler = Sampler(self.thread_id) if sample else None
+        if self.sampler is not None:
+            self.sampler.start()
+
+    def add(self, name, category, started_ns, ended_ns, args=None):
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": (started_ns - self.origin) / 1000,
+            "dur": (ended_ns - started_ns) / 1000,
+            "pid": os.getpid(),
+            "tid": self.thread_id,
+        }
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    def finish(self, directory=PROFILE_DIR):
+        """Stop sampling and write the trace (and flamegraph) files; returns their base path."""
+        self.add(self.name, "request", self.origin, perf_counter_ns())
+        if self.sampler is not None:
+            self.sampler.stop()
+
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, self.filename)
+        with open(base + ".trace.json", "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+        if self.sampler is not None:
+            with open(base + ".folded", "w") as f:
+                f.write(self.sampler.folded())
+        return base
+
+
+def start_trace(name, sample=True):
+    _state.trace = Trace(name, sample)
+    return _state.trace
+
+
+def end_trace(directory=PROFILE_DIR):
+    trace, _state.trace = _state.trace, None
+    return trace.finish(directory) if trace is not None else None
+
+
+def traced(function, category="db"):
+    """Wrap `function` so it emits a span whenever the calling thread is profiled."""
+    name = f"{function.__module__}.{function.__qualname__}"
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        trace = _state.trace
+        if trace is None:
+            return function(*args, **kwargs)
+        started = perf_counter_ns()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            trace.add(name, category, started, perf_counter_ns())
+
+    return wrapper
+
+
+def instrument_module(namespace, module_name, category="db"):
+    """Replace every plain function defined in a module's namespace with a traced one.
+
+    Call it at the end of the module, before anything imports its functions by
+    name. Generator functions are left alone (a span would only time creating
+    the generator).
+    """
+    for name, value in list(namespace.items()):
+        if (inspect.isfunction(value) and value.__module__ == module_name
+                and not name.startswith("__") and not inspect.isgeneratorfunction(value)):
+            namespace[name] = traced(value, category)
+
+
+def instrument_engine(engine):
+    """A span per SQL statement, covering lazy loads that no wrapped function sees."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _state.trace is not None:
+            conn.info.setdefault("profile_started", []).append(perf_counter_ns())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        trace = _state.trace
+        if trace is None or not conn.info.get("profile_started"):
+            return
+        started = conn.info["profile_started"].pop()
+        label = " ".join(statement.split())[:MAX_SQL_LABEL]
+        trace.add(label, "sql", started, perf_counter_ns(), {"executemany": executemany})
+
+    @event.listens_for(engine, "handle_error")
+    def _failed(context):
+        started = context.connection.info.get("profile_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+
+class RouteToggles:
+    """Per-endpoint sampling rates, shared between workers through a JSON file."""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(PROFILE_DIR, "routes.json")
+        self.rates = {}
+        self._mtime = None
+        self._checked = 0.0
+
+    def _refresh(self):
+        now = monotonic()
+        if now - self._checked < TOGGLE_CHECK_INTERVAL:
+            return
+        self._checked = now
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            self.rates, self._mtime = {}, None
+            return
+        if mtime != self._mtime:
+            try:
+                with open(self.path) as f:
+                    self.rates = {endpoint: float(rate) for endpoint, rate in json.load(f).items()}
+                self._mtime = mtime
+            except (OSError, ValueError) as e:
+                print(f"Error reading profiling toggles: {e}")
+
+    def rate(self, endpoint):
+        self._refresh()
+        return self.rates.get(endpoint, 0.0)
+
+    def all(self):
+        self._checked = 0.0
+        self._refresh()
+        return dict(self.rates)
+
+    def set(self, endpoint, rate):
+        """Profile `rate` (0..1) of the requests to `endpoint`; 0 switches it off."""
+        rates = self.all()
+        if rate > 0:
+            rates[endpoint] = min(rate, 1.0)
+        else:
+            rates.pop(endpoint, None)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(rates, f)
+        os.replace(temporary, self.path)
+        self._checked = 0.0
+        return rates
+
+
+toggles = RouteToggles()
+
+
+def init_profiling(flask_app, is_admin=None):
+    """Profile requests on demand and span template renders.
+
+    `is_admin` is called (only for requests sending X-Profile: 1) to check
+    that the logged-in user may profile.
+    """
+    from flask import request, before_render_template, template_rendered
+
+    def wanted():
+        header = request.headers.get(PROFILE_HEADER)
+        if header:
+            if PROFILE_TOKEN and secrets.compare_digest(header, PROFILE_TOKEN):
+                return True
+            return header == "1" and is_admin is not None and is_admin()
+        rate = toggles.rate(request.endpoint)
+        return rate > 0 and random.random() < rate
+
+    @flask_app.before_request
+    def start_profile():
+        if wanted():
+            start_trace(f"{request.method} {request.endpoint or request.path}")
+
+    @flask_app.after_request
+    def label_profile(response):
+        if _state.trace is not None:
+            response.headers["X-Profile-Trace"] = _state.trace.filename
+        return response
+
+    @flask_app.teardown_request
+    def finish_profile(exc):
+        # Teardown runs after streamed bodies are generated too
+        if _state.trace is not None:
+            path = end_trace()
+            print(f"Profile written to {path}.trace.json")
+
+    def template_started(sender, template, context, **extra):
+        trace = _state.trace
+        if trace is not None:
+            trace.open_templates.append(perf_counter_ns())
+
+    def template_finished(sender, template, context, **extra):
+        trace = _state.trace
+        if trace is not None and trace.open_templates:
+            trace.add(f"render {template.name}", "template", trace.open_templates.pop(), perf_counter_ns())
+
+    before_render_template.connect(template_started, flask_app, weak=False)
+    template_rendered.connect(template_finished, flask_app, weak=False)
+
+
+def benchmark(calls=1000000, requests=20000):
+    """Overhead of the instrumentation while profiling is off."""
+
+    def work(a, b=1):
+        return a + b
+
+    wrapped = traced(work)
+
+    def per_call(function):
+        best = float("inf")
+        for _ in range(5):
+            started = perf_counter()
+            for i in range(calls):
+                function(i)
+            best = min(best, perf_counter() - started)
+        return best / calls * 1e9
+
+    bare_ns = per_call(work)
+    off_ns = per_call(wrapped)
+    start_trace("benchmark", sample=False)
+    on_ns = per_call(wrapped)
+    _state.trace = None
+
+    print(f"function call: bare {bare_ns:.0f} ns, traced (off) {off_ns:.0f} ns, traced (on) {on_ns:.0f} ns")
+    print(f"  off-overhead {off_ns - bare_ns:.0f} ns per wrapped call")
+
+    from flask import Flask, render_template_string
+
+    def make_app(profiled):
+        bench_app = Flask("profiling_benchmark")
+
+        @bench_app.route("/")
+        def index():
+            return render_template_string("{% for i in range(20) %}{{ i }}{% endfor %}")
+
+        if profiled:
+            init_profiling(bench_app)
+        return bench_app
+
+    def per_request(bench_app):
+        client = bench_app.test_client()
+        for _ in range(200):
+            client.get("/")
+        best = float("inf")
+        for _ in range(3):
+            started = perf_counter()
+            for _ in range(requests):
+                client.get("/")
+            best = min(best, perf_counter() - started)
+        return best / requests * 1e6
+
+    plain_us = per_request(make_app(False))
+    hooked_us = per_request(make_app(True))
+    print(f"request: plain {plain_us:.1f} us, with profiling hooks (off) {hooked_us:.1f} us "
+          f"({(hooked_us - plain_us) / plain_us * 100:+.1f}%)")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Request profiling tools")
+    parser.add_argument("--benchmark", action="store_true")
+    parser.add_argument("--enable", metavar="ENDPOINT", help="profile requests to ENDPOINT")
+    parser.add_argument("--rate", type=float, default=1.0, help="fraction of requests to profile")
+    parser.add_argument("--disable", metavar="ENDPOINT")
+    args = parser.parse_args()
+
+    if args.enable:
+        print(toggles.set(args.enable, args.rate))
+    if args.disable:
+        print(toggles.set(args.disable, 0))
+    if args.benchmark:
+        benchmark()
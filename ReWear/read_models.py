@@ -0,0 +1,286 @@
+"""Read models for the hot list queries.
+
+Each list is one Core select() over plain columns, built once at import with
+bind parameters so every call reuses SQLAlchemy's compiled-statement cache.
+Rows come back as NamedTuple records; no ORM identity map, no attribute
+instrumentation, no per-row image lookups (primary images are correlated
+subqueries in the same statement).
+
+Run `python read_models.py` to compare rows/sec and peak memory per 10k rows
+against ORM hydration.
+"""
+from datetime import datetime
+from typing import NamedTuple, Optional
+from sqlalchemy import select, bindparam, or_, true, func
+from sqlalchemy.orm import aliased
+from database import engine, Product, ProductImage, Transaction, TransactionSummary, PointTransaction
+from catalog_snapshot import current_snapshot
+
+
+class ProductCard(NamedTuple):
+    pid: int
+    title: str
+    category: str
+    subcategory: str
+    point_value: int
+    condition: str
+    is_featured: bool
+    image_url: Optional[str]
+
+
+class TrendingProduct(NamedTuple):
+    pid: int
+    title: str
+    category: str
+    subcategory: str
+    point_value: int
+    condition: str
+    view_count: Optional[int]
+    trending_score: float
+    image_url: Optional[str]
+
+
+class UserProduct(NamedTuple):
+    pid: int
+    title: str
+    category: str
+    subcategory: str
+    point_value: int
+    status: str
+    condition: str
+    image_url: Optional[str]
+
+
+class TransactionRow(NamedTuple):
+    tid: int
+    transaction_type: str
+    status: str
+    created_at: datetime
+    completed_at: Optional[datetime]
+    points_exchanged: int
+    requester_uid: Optional[int]
+    receiver_uid: Optional[int]
+    requester_pid: Optional[int]
+    requester_title: Optional[str]
+    requester_image_url: Optional[str]
+    receiver_pid: Optional[int]
+    receiver_title: Optional[str]
+    receiver_image_url: Optional[str]
+
+
+class OrderSummary(NamedTuple):
+    tid: int
+    is_requester: bool
+    transaction_type: str
+    status: str
+    points_exchanged: int
+    created_at: datetime
+    completed_at: Optional[datetime]
+    counterpart_uid: Optional[int]
+    counterpart_name: Optional[str]
+    requester_pid: Optional[int]
+    requester_title: Optional[str]
+    requester_point_value: Optional[int]
+    requester_thumbnail_url: Optional[str]
+    receiver_pid: Optional[int]
+    receiver_title: Optional[str]
+    receiver_point_value: Optional[int]
+    receiver_thumbnail_url: Optional[str]
+
+
+class LedgerEntry(NamedTuple):
+    transaction_id: int
+    amount: int
+    transaction_type: str
+    description: Optional[str]
+    created_at: datetime
+
+
+def primary_image_url(pid_column, fallback=False):
+    """Correlated subquery: the product's primary image (or, with fallback, its first image)."""
+    query = select(ProductImage.image_url).where(ProductImage.pid == pid_column)
+    if fallback:
+        query = query.order_by(ProductImage.is_primary.desc(), ProductImage.image_id)
+    else:
+        query = query.where(ProductImage.is_primary == true()).order_by(ProductImage.image_id)
+    return query.limit(1).scalar_subquery()
+
+
+_AVAILABLE_PRODUCTS = (
+    select(
+        Product.pid, Product.title, Product.category, Product.subcategory, Product.point_value,
+        Product.condition, Product.is_featured, primary_image_url(Product.pid)
+    )
+    .where(Product.status == "available")
+    .order_by(Product.is_featured.desc(), Product.created_at.desc())
+    .limit(bindparam("limit"))
+    .offset(bindparam("offset"))
+)
+_AVAILABLE_PRODUCTS_IN_CATEGORY = _AVAILABLE_PRODUCTS.where(Product.category == bindparam("category"))
+
+# trending_score is the log of time-weighted views (see counters.py): its order is the decayed order
+_TRENDING_PRODUCTS = (
+    select(
+        Product.pid, Product.title, Product.category, Product.subcategory, Product.point_value,
+        Product.condition, Product.view_count, Product.trending_score, primary_image_url(Product.pid)
+    )
+    .where(Product.status == "available", Product.trending_score.is_not(None))
+    .order_by(Product.trending_score.desc())
+    .limit(bindparam("limit"))
+)
+
+_CATEGORY_COUNTS = (
+    select(Product.category, Product.subcategory, func.count())
+    .where(Product.status == "available")
+    .group_by(Product.category, Product.subcategory)
+)
+
+_USER_PRODUCTS = select(
+    Product.pid, Product.title, Product.category, Product.subcategory, Product.point_value,
+    Product.status, Product.condition, primary_image_url(Product.pid)
+).where(Product.uid == bindparam("uid"))
+
+_requester_product = aliased(Product)
+_receiver_product = aliased(Product)
+_USER_TRANSACTIONS = (
+    select(
+        Transaction.tid, Transaction.transaction_type, Transaction.status, Transaction.created_at,
+        Transaction.completed_at, Transaction.points_exchanged, Transaction.requester_uid,
+        Transaction.receiver_uid,
+        _requester_product.pid, _requester_product.title,
+        primary_image_url(_requester_product.pid, fallback=True),
+        _receiver_product.pid, _receiver_product.title,
+        primary_image_url(_receiver_product.pid, fallback=True),
+    )
+    .outerjoin(_requester_product, _requester_product.pid == Transaction.requester_pid)
+    .outerjoin(_receiver_product, _receiver_product.pid == Transaction.receiver_pid)
+    .where(or_(Transaction.requester_uid == bindparam("uid"), Transaction.receiver_uid == bindparam("uid")))
+    .order_by(Transaction.created_at.desc())
+)
+
+# transaction_summaries is denormalized: one range scan on (uid, created_at), no joins
+_ORDER_HISTORY = (
+    select(*(getattr(TransactionSummary, field) for field in OrderSummary._fields))
+    .where(TransactionSummary.uid == bindparam("uid"))
+    .order_by(TransactionSummary.created_at.desc())
+)
+
+_LEDGER = (
+    select(
+        PointTransaction.transaction_id, PointTransaction.amount, PointTransaction.transaction_type,
+        PointTransaction.description, PointTransaction.created_at
+    )
+    .where(PointTransaction.uid == bindparam("uid"))
+    .order_by(PointTransaction.created_at.desc())
+    .limit(bindparam("limit"))
+    .offset(bindparam("offset"))
+)
+
+
+def _fetch(statement, record, params):
+    with engine.connect() as conn:
+        return [record._make(row) for row in conn.execute(statement, params)]
+
+
+def available_products(limit=20, offset=0, category=None):
+    if category:
+        return _fetch(_AVAILABLE_PRODUCTS_IN_CATEGORY, ProductCard,
+                      {"limit": limit, "offset": offset, "category": category})
+    return _fetch(_AVAILABLE_PRODUCTS, ProductCard, {"limit": limit, "offset": offset})
+
+
+def category_facets():
+    """{category: {"count": n, "subcategories": {name: n}}} over available products."""
+    snapshot = current_snapshot()
+    if snapshot is not None:
+        return snapshot.facets
+    facets = {}
+    with engine.connect() as conn:
+        for category, subcategory, count in conn.execute(_CATEGORY_COUNTS):
+            entry = facets.setdefault(category or "", {"count": 0, "subcategories": {}})
+            entry["count"] += count
+            entry["subcategories"][subcategory or ""] = count
+    return facets
+
+
+def trending_products(limit=20):
+    return _fetch(_TRENDING_PRODUCTS, TrendingProduct, {"limit": limit})
+
+
+def user_products(uid):
+    return _fetch(_USER_PRODUCTS, UserProduct, {"uid": uid})
+
+
+def user_transactions(uid):
+    return _fetch(_USER_TRANSACTIONS, TransactionRow, {"uid": uid})
+
+
+def order_history(uid):
+    return _fetch(_ORDER_HISTORY, OrderSummary, {"uid": uid})
+
+
+def iter_order_history(uid, batch_size=500):
+    """order_history() as a generator over a server-side cursor, `batch_size` rows per fetch.
+
+    For streamed pages: the connection stays checked out until the generator
+    is exhausted or closed.
+    """
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(
+            _ORDER_HISTORY, {"uid": uid}
+        )
+        for row in result:
+            yield OrderSummary._make(row)
+
+
+def point_transactions(uid, limit=20, offset=0):
+    return _fetch(_LEDGER, LedgerEntry, {"uid": uid, "limit": limit, "offset": offset})
+
+
+def benchmark(rows=10000, repeat=5):
+    import tracemalloc
+    from time import perf_counter
+    from sqlalchemy.orm import joinedload
+    from database import SessionLocal
+
+    any_products = select(
+        Product.pid, Product.title, Product.category, Product.subcategory, Product.point_value,
+        Product.status, Product.condition, primary_image_url(Product.pid)
+    ).limit(rows)
+
+    def orm():
+        db = SessionLocal()
+        try:
+            products = db.query(Product).options(joinedload(Product.images)).limit(rows).all()
+            return [{
+                "pid": p.pid, "title": p.title, "category": p.category, "subcategory": p.subcategory,
+                "point_value": p.point_value, "status": p.status, "condition": p.condition,
+                "image_url": next((i.image_url for i in p.images if i.is_primary), None),
+            } for p in products]
+        finally:
+            db.close()
+
+    def core():
+        return _fetch(any_products, UserProduct, {})
+
+    for label, run in (("ORM entities", orm), ("Core records", core)):
+        run()  # warm the statement cache and the pool
+        best = None
+        for _ in range(repeat):
+            started = perf_counter()
+            count = len(run())
+            elapsed = perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+
+        tracemalloc.start()
+        result = run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del result
+
+        per_10k = peak / max(count, 1) * 10000
+        print(f"{label:<13} {count:>7} rows  {count / best:>10,.0f} rows/s  peak {per_10k / 1e6:6.2f} MB per 10k rows")
+
+
+if __name__ == "__main__":
+    benchmark()
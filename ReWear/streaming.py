@@ -0,0 +1,289 @@
+"""Streamed page rendering and response compression that works with it.
+
+stream_page() renders a template as a stream: Jinja emits the page as it
+goes, and any iterable in the context (a generator over a server-side
+cursor, see read_models.iter_order_history) is only read when the loop over
+it renders. The first bytes leave before the heavy query has been read, and
+a worker holds one STREAM_CHUNK_BYTES chunk of HTML and one fetch batch of
+rows at a time instead of the whole history and the whole page. Jinja's
+small pieces are coalesced into chunks; the first chunk is cut early
+(FIRST_CHUNK_BYTES) so the <head> and its stylesheets reach the browser
+quickly. Pending flash messages are taken off the session before the first
+byte, since the session cookie is written ahead of the body. Setting
+STREAM_TEMPLATES = False renders the same pages buffered, which turns errors
+in the middle of a template back into ordinary 500 pages while debugging.
+
+init_compression() compresses text responses for clients that accept it,
+preferring brotli (when the module is installed) over gzip. A buffered
+response is compressed in one go if it is at least MIN_COMPRESS_BYTES. A
+streamed one is read ahead until MIN_COMPRESS_BYTES: if it ends before that,
+it goes out as it is; otherwise it is compressed chunk by chunk, flushing the
+compressor after each chunk so compression never holds back what has been
+rendered. Responses that already carry a Content-Encoding (precompressed
+assets), downloads (exports gzip themselves on request) and event streams
+are left alone. A compressed response's ETag becomes weak, since the bytes
+differ per encoding.
+
+    python streaming.py --benchmark 10000   # TTFB, peak RSS and bytes for /my-orders
+"""
+import os
+import zlib
+from flask import current_app, render_template, stream_template, request, get_flashed_messages
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+FIRST_CHUNK_BYTES = 2048
+STREAM_CHUNK_BYTES = 16384
+MIN_COMPRESS_BYTES = int(os.getenv("MIN_COMPRESS_BYTES", "1024"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # fast enough to run per request; 11 is for assets.py's build-time files
+COMPRESSIBLE_TYPES = {
+    "text/html", "text/plain", "text/css", "application/json", "application/javascript", "image/svg+xml",
+}
+
+
+def _coalesce(pieces, first=FIRST_CHUNK_BYTES, size=STREAM_CHUNK_BYTES):
+    """Join Jinja's small string pieces into encoded chunks of about `size` bytes."""
+    buffer, buffered, limit = [], 0, first
+    try:
+        for piece in pieces:
+            data = piece.encode("utf-8")
+            buffer.append(data)
+            buffered += len(data)
+            if buffered >= limit:
+                yield b"".join(buffer)
+                buffer, buffered, limit = [], 0, size
+        if buffer:
+            yield b"".join(buffer)
+    finally:
+        close = getattr(pieces, "close", None)
+        if close is not None:
+            close()
+
+
+def stream_page(template_name, **context):
+    """Response rendering `template_name` as it is sent (buffered when STREAM_TEMPLATES is off)."""
+    if not current_app.config.get("STREAM_TEMPLATES", True):
+        context = {key: list(value) if _is_lazy(value) else value for key, value in context.items()}
+        return current_app.response_class(render_template(template_name, **context), mimetype="text/html")
+    # The session cookie is written before the body: take the flashes off it now
+    # (Flask keeps them for the template's get_flashed_messages calls)
+    get_flashed_messages()
+    # stream_template keeps the request context alive while the body is generated
+    return current_app.response_class(_coalesce(stream_template(template_name, **context)), mimetype="text/html")
+
+
+def _is_lazy(value):
+    return hasattr(value, "__next__")
+
+
+# Compression
+def _gzip_chunks(chunks):
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        # Sync flush: everything rendered so far can be decoded by the client now
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def _brotli_chunks(chunks):
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    for chunk in chunks:
+        yield compressor.process(chunk) + compressor.flush()
+    yield compressor.finish()
+
+
+ENCODERS = {"br": _brotli_chunks, "gzip": _gzip_chunks}
+
+
+def choose_encoding(accepted=None):
+    """'br', 'gzip' or None: the best encoding in `accepted` (default: the Flask request's Accept-Encoding)."""
+    if accepted is None:
+        accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def _compressible(response):
+    return (
+        response.status_code == 200
+        and response.mimetype in COMPRESSIBLE_TYPES
+        and "Content-Encoding" not in response.headers
+        and "Content-Disposition" not in response.headers
+        and not response.direct_passthrough
+    )
+
+
+def _read_ahead(chunks, size):
+    """(first chunks totalling at least `size` bytes, or all of them; whether the stream ended)."""
+    prefix, total = [], 0
+    for chunk in chunks:
+        prefix.append(chunk)
+        total += len(chunk)
+        if total >= size:
+            return prefix, False
+    return prefix, True
+
+
+def _closing(chunks, source):
+    """Iterate `chunks`, closing `source` (the original body) when done or abandoned."""
+    try:
+        yield from chunks
+    finally:
+        close = getattr(source, "close", None)
+        if close is not None:
+            close()
+
+
+def compress_bytes(data, encoding):
+    return b"".join(ENCODERS[encoding]([data]))
+
+
+def mark_encoded(response, encoding):
+    """Label a response whose body is now `encoding`; its ETag no longer names these bytes exactly."""
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def compress_response(response, encoding):
+    if response.is_streamed:
+        source = iter(response.response)
+        prefix, ended = _read_ahead(source, MIN_COMPRESS_BYTES)
+        if ended and sum(len(chunk) for chunk in prefix) < MIN_COMPRESS_BYTES:
+            response.set_data(b"".join(prefix))
+            return response
+
+        def body():
+            yield from prefix
+            yield from source
+
+        response.response = _closing(ENCODERS[encoding](body()), source)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < MIN_COMPRESS_BYTES:
+            return response
+        response.set_data(compress_bytes(data, encoding))
+    return mark_encoded(response, encoding)
+
+
+def init_compression(flask_app):
+    @flask_app.after_request
+    def compress(response):
+        if request.method == "HEAD" or not _compressible(response):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = choose_encoding()
+        if encoding is None:
+            return response
+        return compress_response(response, encoding)
+
+
+def _measure(uid, warm_uid, encoding, streamed):
+    """One /my-orders request in this process: (TTFB s, total s, bytes, peak RSS growth in KB)."""
+    import resource
+    from time import perf_counter
+    from app import app
+
+    app.config["STREAM_TEMPLATES"] = streamed
+    app.jinja_env.get_template("my_orders.html")
+    client = app.test_client()
+    headers = {"Accept-Encoding": encoding} if encoding else {}
+    # Warm the pool, statements and imports on an empty history, so the baseline
+    # high-water mark doesn't already include a large page
+    with client.session_transaction() as session:
+        session["uid"] = warm_uid
+    client.get("/my-orders", headers=headers)
+    with client.session_transaction() as session:
+        session["uid"] = uid
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    started = perf_counter()
+    response = client.get("/my-orders", headers=headers, buffered=False)
+    body = iter(response.response)
+    sent = len(next(body, b""))
+    first_byte = perf_counter() - started
+    for chunk in body:
+        sent += len(chunk)
+    total = perf_counter() - started
+    response.close()
+    return first_byte, total, sent, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+
+
+def _seed_history(count):
+    """A throwaway user with `count` completed swaps in their order history."""
+    from datetime import datetime, timedelta
+    from sqlalchemy import insert
+    from database import engine, Transaction, TransactionSummary
+    from stress import Fixture
+
+    fixture = Fixture(engine)
+    uid, other = fixture.users(2, 0)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        tids = conn.execute(insert(Transaction).returning(Transaction.tid), [
+            {"transaction_type": "swap", "requester_uid": uid, "receiver_uid": other, "status": "completed",
+             "points_exchanged": 0, "created_at": now - timedelta(minutes=n)}
+            for n in range(count)
+        ]).scalars().all()
+        conn.execute(insert(TransactionSummary), [
+            {"tid": tid, "uid": uid, "is_requester": True, "transaction_type": "swap", "status": "completed",
+             "points_exchanged": 0, "created_at": now - timedelta(minutes=n), "counterpart_uid": other,
+             "counterpart_name": "Benchmark partner", "requester_title": f"Offered item {n}",
+             "requester_point_value": 40, "requester_thumbnail_url": f"/static/uploads/bench/{n}-320.webp",
+             "receiver_title": f"Requested item {n}", "receiver_point_value": 45,
+             "receiver_thumbnail_url": f"/static/uploads/bench/{n}-r-320.webp"}
+            for n, tid in enumerate(tids)
+        ])
+    return fixture, uid, other
+
+
+def benchmark(count=10000):
+    """Buffered vs streamed /my-orders for a user with `count` transactions, each mode in a fresh process."""
+    import json
+    import subprocess
+    import sys
+
+    fixture, uid, empty_uid = _seed_history(count)
+    try:
+        print(f"/my-orders with {count} transactions")
+        print(f"{'mode':<10}{'encoding':<10}{'TTFB ms':>10}{'total ms':>10}{'bytes':>12}{'peak RSS +MB':>14}")
+        for streamed in (False, True):
+            for encoding in (None, "gzip", "br"):
+                if encoding == "br" and brotli is None:
+                    continue
+                output = subprocess.run(
+                    [sys.executable, __file__, "--measure", str(uid), str(empty_uid), encoding or "",
+                     "1" if streamed else "0"],
+                    capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+                ).stdout.strip().splitlines()[-1]
+                first_byte, total, sent, rss_kb = json.loads(output)
+                print(f"{'streamed' if streamed else 'buffered':<10}{encoding or 'identity':<10}"
+                      f"{first_byte * 1000:>10.1f}{total * 1000:>10.1f}{sent:>12,}{rss_kb / 1024:>14.1f}")
+    finally:
+        fixture.cleanup()
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Streamed rendering benchmark")
+    parser.add_argument("--benchmark", type=int, metavar="TRANSACTIONS")
+    parser.add_argument("--measure", nargs=4, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        uid, warm_uid, encoding, streamed = args.measure
+        print(json.dumps(_measure(int(uid), int(warm_uid), encoding or None, streamed == "1")))
+    elif args.benchmark:
+        benchmark(args.benchmark)
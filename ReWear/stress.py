@@ -0,0 +1,313 @@
+"""Concurrency stress test for the transaction lifecycle.
+
+Seeds throwaway users and products, then fires the real database.py
+functions from many threads at once (all released by one barrier):
+
+  redemption   --contenders buyers redeem the same available product
+  swap         one requester offers the same item in --contenders swaps at once
+  points       --contenders threads call add_points(+1) on one user --repeat times
+  overdraw     buyers with points for exactly one redemption try several at once
+
+and then checks the invariants:
+
+  one winner per product   at most one live (requested/accepted/completed)
+                           transaction holds any product
+  ledger                   each user's points moved by exactly the sum of their
+                           new point_transactions
+  no negative balances
+  no stuck reservations    every reserved product has a live transaction
+
+Reports throughput, latency and lock waits per scenario. On Postgres
+pg_stat_activity is sampled for backends waiting on a lock. On both, every
+write statement is timed and its time above the scenario's fastest writes
+(p10) is summed as "write stall": on SQLite that is the busy-timeout wait for
+the database lock. Exits non-zero when an invariant fails.
+
+    python stress.py                                   # the configured Postgres
+    python stress.py --url sqlite:////tmp/stress.db    # a scratch SQLite file
+"""
+import argparse
+import sys
+import threading
+import uuid
+from datetime import datetime
+from time import perf_counter
+from sqlalchemy import create_engine, event, select, insert, delete, func, or_, text
+import database
+from database import Base, User, Product, Transaction, PointTransaction, DATABASE_URL, create_swap_request, \
+    create_redemption_request, add_points
+
+LIVE_STATUSES = ("requested", "accepted", "completed")
+ITEM_POINTS = 40
+REDEMPTION_COST = int(ITEM_POINTS * 1.5)
+# Scenarios where the contenders race for one thing and "wins" counts who got it;
+# in points every call should land, and the ledger invariant is what checks that
+CONTESTED = {"redemption", "swap", "overdraw"}
+
+
+def make_engine(url, pool_size):
+    if url.startswith("sqlite"):
+        engine = create_engine(url, pool_size=pool_size, max_overflow=0,
+                               connect_args={"timeout": 30, "check_same_thread": False})
+
+        @event.listens_for(engine, "connect")
+        def sqlite_pragmas(dbapi_connection, connection_record):
+            dbapi_connection.execute("PRAGMA journal_mode=WAL")
+            dbapi_connection.execute("PRAGMA foreign_keys=ON")
+
+        Base.metadata.create_all(engine)
+        return engine
+    return create_engine(url, pool_size=pool_size, max_overflow=0, pool_pre_ping=True)
+
+
+class Fixture:
+    """Users and products created for one run, tagged so they can be removed."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.tag = f"stress-{uuid.uuid4().hex[:8]}"
+        self.uids = []
+        self.opening = {}  # uid -> points at creation
+        self.started_at = datetime.utcnow()
+
+    def users(self, count, points):
+        with self.engine.begin() as conn:
+            rows = conn.execute(insert(User).returning(User.uid), [
+                {"name": f"{self.tag} {n}", "email": f"{self.tag}-{uuid.uuid4().hex[:12]}@example.test",
+                 "password": "x", "points": points}
+                for n in range(count)
+            ]).scalars().all()
+        self.uids.extend(rows)
+        self.opening.update((uid, points) for uid in rows)
+        return rows
+
+    def products(self, owners):
+        with self.engine.begin() as conn:
+            return conn.execute(insert(Product).returning(Product.pid), [
+                {"uid": uid, "title": f"{self.tag} item", "description": "stress test item",
+                 "category": "Tops", "subcategory": "T-Shirts", "size": "M", "condition": "Good",
+                 "point_value": ITEM_POINTS, "status": "available"}
+                for uid in owners
+            ]).scalars().all()
+
+    def cleanup(self):
+        with self.engine.begin() as conn:
+            conn.execute(delete(Transaction).where(or_(
+                Transaction.requester_uid.in_(self.uids), Transaction.receiver_uid.in_(self.uids)
+            )))
+            # products, ledger rows and notifications go with their users (ON DELETE CASCADE)
+            conn.execute(delete(User).where(User.uid.in_(self.uids)))
+
+
+class LockWaitSampler(threading.Thread):
+    """Samples how many backends wait on a lock; the sum times the interval estimates lock-wait time."""
+
+    def __init__(self, engine, interval=0.01):
+        super().__init__(name="lock-wait-sampler", daemon=True)
+        self.engine = engine
+        self.interval = interval
+        self.waiting_samples = 0
+        self.peak = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        query = text("SELECT count(*) FROM pg_stat_activity WHERE wait_event_type = 'Lock' AND datname = current_database()")
+        with self.engine.connect() as conn:
+            while not self._stop_event.wait(self.interval):
+                waiting = conn.execute(query).scalar()
+                self.waiting_samples += waiting
+                self.peak = max(self.peak, waiting)
+                conn.rollback()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        return self.waiting_samples * self.interval
+
+
+class WriteTimer:
+    """Durations of INSERT/UPDATE/DELETE statements, collected while `active`."""
+
+    def __init__(self, engine):
+        self.durations = []
+        self.active = False
+        self._lock = threading.Lock()
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def before(conn, cursor, statement, parameters, context, executemany):
+            conn.info["stress_started"] = perf_counter()
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after(conn, cursor, statement, parameters, context, executemany):
+            started = conn.info.pop("stress_started", None)
+            if self.active and started is not None and statement.lstrip()[:6].upper() in ("INSERT", "UPDATE", "DELETE"):
+                with self._lock:
+                    self.durations.append(perf_counter() - started)
+
+    def take_stall(self):
+        """Seconds spent above the fastest writes since the last call."""
+        with self._lock:
+            durations, self.durations = self.durations, []
+        if not durations:
+            return 0.0
+        floor = percentile(durations, 10)
+        return sum(duration - floor for duration in durations if duration > floor)
+
+
+def run_concurrently(calls):
+    """Run zero-argument callables in one thread each, released together; returns (results, latencies, wall)."""
+    barrier = threading.Barrier(len(calls) + 1)
+    results = [None] * len(calls)
+    latencies = [0.0] * len(calls)
+
+    def run(index, call):
+        barrier.wait()
+        started = perf_counter()
+        try:
+            results[index] = call()
+        except Exception as e:
+            results[index] = e
+        latencies[index] = perf_counter() - started
+
+    threads = [threading.Thread(target=run, args=(i, call)) for i, call in enumerate(calls)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = perf_counter()
+    for thread in threads:
+        thread.join()
+    return results, latencies, perf_counter() - started
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else 0.0
+
+
+def scenarios(fixture, contenders, repeat, rounds):
+    """Yield (name, calls) for each round of each scenario."""
+    sellers = fixture.users(rounds, 0)
+    buyers = fixture.users(contenders, REDEMPTION_COST * 10)
+    for pid in fixture.products(sellers):
+        yield "redemption", [lambda uid=uid, pid=pid: create_redemption_request(uid, pid) for uid in buyers]
+
+    for _ in range(rounds):
+        requester = fixture.users(1, 1000)[0]
+        owners = fixture.users(contenders, 0)
+        offered = fixture.products([requester])[0]
+        wanted = fixture.products(owners)
+        yield "swap", [lambda pid=pid, uid=requester, offered=offered: create_swap_request(uid, pid, offered)
+                       for pid in wanted]
+
+    for _ in range(rounds):
+        target = fixture.users(1, 0)[0]
+        yield "points", [lambda uid=target: [add_points(uid, 1, "stress_test") for _ in range(repeat)]
+                         for _ in range(contenders)]
+
+    for _ in range(rounds):
+        buyer = fixture.users(1, REDEMPTION_COST)[0]
+        items = fixture.products(fixture.users(min(contenders, 10), 0))
+        yield "overdraw", [lambda pid=pid, uid=buyer: create_redemption_request(uid, pid) for pid in items]
+
+
+def check_invariants(fixture):
+    violations = []
+    with fixture.engine.connect() as conn:
+        products = conn.execute(select(Product.pid, Product.status).where(Product.uid.in_(fixture.uids))).all()
+        live = conn.execute(
+            select(Transaction.transaction_type, Transaction.requester_pid, Transaction.receiver_pid)
+            .where(Transaction.status.in_(LIVE_STATUSES), or_(
+                Transaction.requester_uid.in_(fixture.uids), Transaction.receiver_uid.in_(fixture.uids)
+            ))
+        ).all()
+        ledger = dict(conn.execute(
+            select(PointTransaction.uid, func.sum(PointTransaction.amount))
+            .where(PointTransaction.uid.in_(fixture.uids), PointTransaction.created_at >= fixture.started_at)
+            .group_by(PointTransaction.uid)
+        ).all())
+        balances = dict(conn.execute(select(User.uid, User.points).where(User.uid.in_(fixture.uids))).all())
+
+    # A redemption holds the product it redeems; a swap holds the requester's offered item
+    holders = {}
+    for transaction_type, requester_pid, receiver_pid in live:
+        held = receiver_pid if transaction_type == "redemption" else requester_pid
+        holders[held] = holders.get(held, 0) + 1
+    for pid, count in holders.items():
+        if count > 1:
+            violations.append(f"product {pid} is held by {count} live transactions")
+
+    for pid, status in products:
+        if status == "reserved" and pid not in holders:
+            violations.append(f"product {pid} is reserved without a live transaction")
+
+    for uid, points in balances.items():
+        moved = points - fixture.opening[uid]
+        if moved != (ledger.get(uid) or 0):
+            violations.append(f"user {uid}: points moved by {moved}, ledger says {ledger.get(uid) or 0}")
+        if points < 0:
+            violations.append(f"user {uid} has a negative balance ({points})")
+    return violations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=DATABASE_URL, help="database URL (default: the configured Postgres)")
+    parser.add_argument("--contenders", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20, help="add_points calls per thread")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--keep", action="store_true", help="leave the seeded rows in place")
+    args = parser.parse_args()
+
+    engine = make_engine(args.url, args.contenders + 2)
+    # Point the lifecycle functions at the database under test
+    database.SessionLocal.configure(bind=engine)
+    fixture = Fixture(engine)
+    postgres = engine.dialect.name == "postgresql"
+
+    timer = WriteTimer(engine)
+
+    stats = {}
+    try:
+        for name, calls in scenarios(fixture, args.contenders, args.repeat, args.rounds):
+            entry = stats.setdefault(name, {"ops": 0, "wins": 0, "wall": 0.0, "latencies": [],
+                                            "lock_wait": 0.0, "stall": 0.0})
+            sampler = LockWaitSampler(engine) if postgres else None
+            if sampler:
+                sampler.start()
+            timer.active = True
+            results, latencies, wall = run_concurrently(calls)
+            timer.active = False
+            if sampler:
+                entry["lock_wait"] += sampler.stop()
+            entry["stall"] += timer.take_stall()
+            entry["ops"] += len(calls) * (args.repeat if name == "points" else 1)
+            if name in CONTESTED:
+                entry["wins"] += sum(1 for result in results if result and not isinstance(result, Exception))
+            entry["wall"] += wall
+            entry["latencies"].extend(latencies)
+
+        violations = check_invariants(fixture)
+    finally:
+        if not args.keep:
+            fixture.cleanup()
+
+    print(f"{engine.dialect.name}: {args.contenders} contenders, {args.rounds} rounds per scenario")
+    print(f"{'scenario':<12}{'ops':>7}{'wins':>7}{'ops/s':>10}{'p50 ms':>9}{'p99 ms':>9}"
+          f"{'lock wait s':>13}{'write stall s':>15}")
+    for name, entry in stats.items():
+        lock_wait = f"{entry['lock_wait']:.2f}" if postgres else "n/a"
+        wins = entry["wins"] if name in CONTESTED else "n/a"
+        print(f"{name:<12}{entry['ops']:>7}{wins:>7}{entry['ops'] / entry['wall']:>10.1f}"
+              f"{percentile(entry['latencies'], 50) * 1000:>9.1f}{percentile(entry['latencies'], 99) * 1000:>9.1f}"
+              f"{lock_wait:>13}{entry['stall']:>15.2f}")
+
+    if violations:
+        print(f"\n{len(violations)} invariant violations:")
+        for violation in violations[:50]:
+            print(f"  {violation}")
+        sys.exit(1)
+    print("\nall invariants hold")
+
+
+if __name__ == "__main__":
+    main()
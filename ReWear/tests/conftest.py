@@ -0,0 +1,24 @@
+import os
+import sys
+
+# The app's modules are imported by name from the ReWear directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing asgi runs configure_app(); tests start no background threads
+os.environ.setdefault("REWEAR_THREADS_AFTER_FORK", "1")
+
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def sqlite_engine(tmp_path):
+    """A scratch SQLite database with the app's schema, bound to SessionLocal (as stress.py does)."""
+    import database
+    from stress import make_engine
+
+    engine = make_engine(f"sqlite:///{tmp_path / 'rewear.db'}", pool_size=5)
+    database.SessionLocal.configure(bind=engine)
+    yield engine
+    database.SessionLocal.configure(bind=database.engine)
+    engine.dispose()
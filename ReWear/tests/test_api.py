@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import insert
+from app import app
+from database import User, Notification
+
+CREATED = datetime(2025, 5, 1, 9, 30)
+
+
+@pytest.fixture
+def client(sqlite_engine):
+    with sqlite_engine.begin() as conn:
+        conn.execute(insert(User).values(uid=1, name="Reader", email="reader@example.test", password="x"))
+        # Ids and timestamps disagree on purpose: id 3 is the oldest, 1 and 2 share a timestamp
+        conn.execute(insert(Notification), [
+            {"notification_id": 1, "uid": 1, "message": "a", "notification_type": "system", "created_at": CREATED},
+            {"notification_id": 2, "uid": 1, "message": "b", "notification_type": "system", "created_at": CREATED},
+            {"notification_id": 3, "uid": 1, "message": "c", "notification_type": "system",
+             "created_at": CREATED - timedelta(days=1)},
+            {"notification_id": 4, "uid": 1, "message": "d", "notification_type": "system",
+             "created_at": CREATED + timedelta(days=1)},
+        ])
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["uid"] = 1
+    return client
+
+
+def test_me_responses_are_private(client):
+    response = client.get("/api/v1/me/notifications")
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == "private, no-cache"
+    assert "Cookie" in response.headers["Vary"]
+    assert response.headers["ETag"]
+
+
+def test_notification_cursor_follows_the_listing_order(client):
+    seen, cursor = [], None
+    while True:
+        url = "/api/v1/me/notifications?limit=1" + (f"&cursor={cursor}" if cursor else "")
+        body = client.get(url).get_json()
+        seen.extend(row["notification_id"] for row in body["data"])
+        cursor = body["next_cursor"]
+        if not cursor:
+            break
+    assert seen == [4, 2, 1, 3]
+
+
+def test_invalid_notification_cursor(client):
+    assert client.get("/api/v1/me/notifications?cursor=nope").status_code == 400
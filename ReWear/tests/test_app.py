@@ -0,0 +1,25 @@
+import pytest
+from app import app, configure_app
+
+
+def registered_hooks():
+    return (
+        {key: list(funcs) for key, funcs in app.before_request_funcs.items()},
+        {key: list(funcs) for key, funcs in app.after_request_funcs.items()},
+        {key: dict(handlers) for key, handlers in app.error_handler_spec.items()},
+    )
+
+
+def test_configure_app_sets_up_once():
+    configure_app(precompile=False)
+    hooks = registered_hooks()
+
+    configure_app(precompile=False)
+    configure_app({"TEMPLATES_AUTO_RELOAD": app.config.get("TEMPLATES_AUTO_RELOAD")})
+    assert registered_hooks() == hooks
+
+
+def test_configure_app_refuses_to_change_settings_later():
+    configure_app(precompile=False)
+    with pytest.raises(RuntimeError, match="SECRET_KEY"):
+        configure_app({"SECRET_KEY": "another"})
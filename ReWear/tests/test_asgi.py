@@ -0,0 +1,68 @@
+import asyncio
+import gzip
+from datetime import datetime
+import pytest
+from werkzeug.routing import Map, Rule
+import http_cache
+from http_cache import page_etag
+from loadtest import DEFAULT_PATHS
+
+asgi = pytest.importorskip("asgi")
+
+STAMPS = (datetime(2025, 5, 1, 9, 30), None)
+
+
+def native_rules(url_map):
+    return {rule.rule for rule in url_map.iter_rules() if not rule.build_only and rule.endpoint != "static"}
+
+
+def test_loadtest_paths_are_served_by_both_modes():
+    flask_map = Map([Rule(rule.rule, endpoint=rule.endpoint) for rule in asgi.flask_app.url_map.iter_rules()])
+    quart_map = Map([Rule(rule) for rule in native_rules(asgi.quart_app.url_map)])
+    for path in DEFAULT_PATHS:
+        flask_map.bind("").match(path)
+        quart_map.bind("").match(path)
+
+
+def test_product_revalidation_matches_flask(monkeypatch):
+    import app as app_module
+
+    views = []
+    monkeypatch.setattr(http_cache, "get_product_freshness", lambda pid: STAMPS)
+    monkeypatch.setattr(app_module, "record_product_view", views.append)
+    monkeypatch.setattr(asgi, "record_product_view", views.append)
+    etag, _ = page_etag(STAMPS, None)
+    headers = {"If-None-Match": f'W/"{etag}"'}
+
+    flask_response = asgi.flask_app.test_client().get("/product/5", headers=headers)
+
+    async def quart_get():
+        return await asgi.quart_app.test_client().get("/product/5", headers=headers)
+
+    quart_response = asyncio.run(quart_get())
+    for response in (flask_response, quart_response):
+        assert response.status_code == 304
+        assert response.headers["ETag"] == f'"{etag}"'
+        assert response.headers["Cache-Control"] == "private, no-cache"
+        assert "Cookie" in response.headers["Vary"]
+    assert views == [5, 5]
+
+
+def test_quart_pages_are_compressed_like_flask():
+    from quart import Response
+
+    async def compressed():
+        async with asgi.quart_app.test_request_context("/home", headers={"Accept-Encoding": "gzip"}):
+            response = Response("<p>swap</p>" * 500, mimetype="text/html")
+            response.set_etag("abc")
+            response = await asgi.compress(response)
+            return response, await response.get_data()
+
+    response, body = asyncio.run(compressed())
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.get_etag() == ("abc", True)
+    assert gzip.decompress(body) == b"<p>swap</p>" * 500
+
+
+def test_notification_stream_is_served_natively():
+    assert "/notifications/stream" in native_rules(asgi.quart_app.url_map)
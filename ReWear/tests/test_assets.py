@@ -0,0 +1,51 @@
+import os
+import pytest
+from flask import Flask
+import assets
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    source = tmp_path / "src"
+    source.mkdir()
+    dist = tmp_path / "dist"
+    monkeypatch.setattr(assets, "SOURCE_DIR", str(source))
+    monkeypatch.setattr(assets, "DIST_DIR", str(dist))
+    monkeypatch.setattr(assets, "MANIFEST_PATH", str(dist / "manifest.json"))
+    monkeypatch.setattr(assets, "BUNDLES", {"page.css": ["page.css"]})
+    # load_manifest() replaces these; put the app's back afterwards
+    monkeypatch.setattr(assets, "_manifest", assets._manifest)
+    monkeypatch.setattr(assets, "_manifest_version", assets._manifest_version)
+
+    def build(css):
+        (source / "page.css").write_text(css)
+        return assets.build()["page.css"]
+    return build, dist
+
+
+def test_rebuild_keeps_the_previous_build_only(pipeline):
+    build, dist = pipeline
+    first = build("body { color: red; }")
+    second = build("body { color: blue; }")
+    third = build("body { color: green; }")
+
+    files = set(os.listdir(dist))
+    assert {second, third} <= files
+    assert first not in files and first + ".gz" not in files
+    assert "manifest.json" in files
+
+
+def test_served_encoding_respects_q_zero(pipeline):
+    build, dist = pipeline
+    filename = build("body { color: red; }" * 50)
+    (dist / (filename + ".br")).write_bytes(b"br")
+    assets.load_manifest()
+
+    app = Flask(__name__)
+    app.add_url_rule(assets.URL_PREFIX + "<path:filename>", "assets", assets.serve_asset)
+    client = app.test_client()
+    response = client.get(assets.URL_PREFIX + filename, headers={"Accept-Encoding": "br;q=0, gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    response = client.get(assets.URL_PREFIX + filename, headers={"Accept-Encoding": "br"})
+    assert response.headers["Content-Encoding"] == "br"
+    assert client.get(assets.URL_PREFIX + "manifest.json").status_code == 404
@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta
+from sqlalchemy import insert, update
+import autocomplete
+from autocomplete import SuggestionIndex
+from database import User, Product
+
+
+def add_product(conn, pid, title, status="available", updated_at=None):
+    conn.execute(insert(Product).values(
+        pid=pid, uid=1, title=title, description="", category="Tops", subcategory="Shirts", size="M",
+        condition="Good", point_value=40, status=status, updated_at=updated_at or datetime.utcnow(),
+    ))
+
+
+def test_sync_picks_up_rows_that_commit_below_the_high_water_mark(sqlite_engine, monkeypatch):
+    monkeypatch.setattr(autocomplete, "engine", sqlite_engine)
+    monkeypatch.setattr(autocomplete, "current_snapshot", lambda: None)
+    now = datetime.utcnow()
+    with sqlite_engine.begin() as conn:
+        conn.execute(insert(User).values(uid=1, name="Seller", email="seller@example.test", password="x"))
+        add_product(conn, 1, "Linen shirt", updated_at=now)
+
+    index = SuggestionIndex()
+    index.rebuild()
+    assert index.high_water == now
+
+    # Stamped before the mark, committed after the index read it
+    with sqlite_engine.begin() as conn:
+        add_product(conn, 2, "Lined parka", updated_at=now - timedelta(seconds=2))
+        conn.execute(update(Product).where(Product.pid == 1).values(status="reserved", updated_at=now))
+    index.sync()
+
+    assert [entry["text"] for entry in index.suggest("lin")] == ["Lined parka"]
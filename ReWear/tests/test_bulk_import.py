@@ -0,0 +1,41 @@
+import io
+import json
+from sqlalchemy import insert, select
+from database import User, Product, ProductImage, PointTransaction
+from bulk_import import import_listings
+
+LISTING = {"title": "Denim jacket", "description": "Barely worn", "category": "Tops",
+           "subcategory": "Jackets", "size": "M", "condition": "Good", "image_urls": ["/static/a.jpg"]}
+
+
+def jsonl(*rows):
+    return io.StringIO("".join((row if isinstance(row, str) else json.dumps(row)) + "\n" for row in rows))
+
+
+def test_malformed_rows_are_reported_not_raised(sqlite_engine):
+    with sqlite_engine.begin() as conn:
+        conn.execute(insert(User).values(uid=1, name="Seller", email="seller@example.test", password="x"))
+
+    report = import_listings(jsonl(
+        LISTING,
+        [1, 2],
+        {**LISTING, "title": 123},
+        {**LISTING, "size": None},
+        "{not json",
+        {**LISTING, "title": "Wool scarf", "image_urls": []},
+    ), "jsonl", default_uid=1)
+
+    assert report["imported"] == 2
+    assert [(error["line"], error["error"].split(":")[0]) for error in report["errors"]] == [
+        (2, "row must be an object"),
+        (3, "title must be text"),
+        (4, "missing size"),
+        (5, "invalid JSON"),
+    ]
+
+    with sqlite_engine.connect() as conn:
+        assert conn.execute(select(Product.title, Product.status).order_by(Product.pid)).all() == [
+            ("Denim jacket", "pending"), ("Wool scarf", "pending"),
+        ]
+        assert conn.execute(select(ProductImage.image_url, ProductImage.is_primary)).all() == [("/static/a.jpg", True)]
+        assert conn.execute(select(PointTransaction.amount)).scalars().all() == [10, 10]
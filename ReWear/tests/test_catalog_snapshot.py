@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+import pytest
+from catalog_snapshot import CatalogSnapshot, encode
+
+NOW = datetime(2025, 6, 1, 12, 0, 0, 123456)
+CATEGORIES = ["Tops", "Bottoms", "Dresses"]
+
+
+def catalog(count=50):
+    """Rows in listing order, with ties on created_at broken by pid."""
+    rows = [
+        (pid, f"Item {pid} ☂", CATEGORIES[pid % 3], "Casual", 10 + pid, "Good", pid % 7 == 0,
+         f"/static/uploads/{pid}.webp" if pid % 5 else None, NOW - timedelta(seconds=pid // 2), pid * 3)
+        for pid in range(1, count + 1)
+    ]
+    return sorted(rows, key=lambda row: (row[8], row[0]), reverse=True)
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    path = tmp_path / "catalog.snapshot"
+    path.write_bytes(encode(catalog(), 7, high_water=NOW))
+    return CatalogSnapshot(str(path))
+
+
+def test_round_trip(snapshot):
+    rows = catalog()
+    assert len(snapshot) == len(rows)
+    assert snapshot.version == 7
+    assert snapshot.high_water == NOW
+    assert [tuple(card) for card in snapshot.cards()] == rows
+    assert tuple(snapshot.get(10)) == next(row for row in rows if row[0] == 10)
+    assert snapshot.get(999) is None
+    assert snapshot.facets["Tops"]["count"] == sum(1 for row in rows if row[2] == "Tops")
+
+
+@pytest.mark.parametrize("category", [None, "Tops", "Dresses"])
+def test_keyset_pages_cover_the_listing_once(snapshot, category):
+    expected = [row[0] for row in catalog() if category in (None, row[2])]
+    seen, after = [], None
+    while True:
+        cards, after = snapshot.page(limit=4, after=after, category=category)
+        seen.extend(card.pid for card in cards)
+        if after is None:
+            break
+        assert after == (cards[-1].created_at, cards[-1].pid)
+    assert seen == expected
+
+
+def test_unknown_category_is_empty(snapshot):
+    assert snapshot.page(category="Hats") == ([], None)
+
+
+def test_api_listing_is_served_from_the_snapshot(snapshot, monkeypatch):
+    import database
+    from app import app
+
+    def no_database():
+        raise AssertionError("the listing should not query the database")
+
+    monkeypatch.setattr(database, "current_snapshot", lambda: snapshot)
+    monkeypatch.setattr(database, "SessionLocal", no_database)
+    client = app.test_client()
+
+    first = client.get("/api/v1/products?category=Tops&limit=3").get_json()
+    second = client.get(f"/api/v1/products?category=Tops&limit=3&cursor={first['next_cursor']}").get_json()
+    expected = [row[0] for row in catalog() if row[2] == "Tops"]
+    assert [row["pid"] for row in first["data"] + second["data"]] == expected[:6]
@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import insert, select
+import counters
+from counters import WriteBehindBuffer, decayed_score
+from database import User, Product
+
+NOW = datetime(2025, 6, 1, 12)
+
+
+@pytest.fixture
+def listing(sqlite_engine, monkeypatch):
+    monkeypatch.setattr(counters, "engine", sqlite_engine)
+    with sqlite_engine.begin() as conn:
+        conn.execute(insert(User).values(uid=1, name="Seller", email="seller@example.test", password="x"))
+        conn.execute(insert(Product).values(pid=1, uid=1, title="Item", description="", category="Tops",
+                                            subcategory="Shirts", size="M", condition="Good", point_value=10,
+                                            status="available"))
+    return sqlite_engine
+
+
+def test_flush_writes_views_and_logins(listing):
+    buffer = WriteBehindBuffer(interval=0)
+    buffer.record_view(1, NOW - timedelta(hours=24))
+    buffer.record_view(1, NOW)
+    buffer.record_login(1, NOW)
+    assert buffer.flush() == 2
+    buffer.record_view(1, NOW)
+    assert buffer.flush() == 1
+    assert buffer.pending() == (0, 0)
+
+    with listing.connect() as conn:
+        views, score, seen = conn.execute(
+            select(Product.view_count, Product.trending_score, Product.last_viewed_at)
+        ).one()
+        assert conn.execute(select(User.last_login)).scalar() == NOW
+    assert views == 3
+    assert seen == NOW
+    # Two views now and one a half-life ago
+    assert decayed_score(score, NOW) == pytest.approx(2.5)
+
+
+def test_failing_flush_is_dropped_after_max_failures(listing, monkeypatch):
+    monkeypatch.setattr(counters, "views_update", lambda rows, dialect: 1 / 0)
+    buffer = WriteBehindBuffer(interval=0)
+    buffer.record_view(1, NOW)
+    for _ in range(counters.MAX_FLUSH_FAILURES - 1):
+        assert buffer.flush() == 0
+        assert buffer.pending() == (1, 0)
+    assert buffer.flush() == 0
+    assert buffer.pending() == (0, 0)
@@ -0,0 +1,92 @@
+from datetime import datetime
+import pytest
+from flask import Flask, flash
+from http_cache import conditional_page, page_etag
+
+STAMPS = [datetime(2025, 5, 1, 9, 30, 15, 250000), None, datetime(2025, 4, 1)]
+
+
+@pytest.fixture
+def page():
+    flask_app = Flask(__name__)
+    flask_app.secret_key = "test"
+    renders = []
+
+    @flask_app.route("/page/<int:pid>")
+    @conditional_page(lambda pid: STAMPS if pid == 1 else None)
+    def show(pid):
+        renders.append(pid)
+        return f"page {pid}"
+
+    @flask_app.route("/flash")
+    def add_flash():
+        flash("Saved")
+        return ""
+
+    return flask_app.test_client(), renders
+
+
+def test_fresh_render_is_tagged(page):
+    client, renders = page
+    response = client.get("/page/1")
+    etag, _ = page_etag(STAMPS, None)
+    assert response.status_code == 200
+    assert response.headers["ETag"] == f'"{etag}"'
+    assert response.headers["Last-Modified"] == "Thu, 01 May 2025 09:30:15 GMT"
+    assert response.headers["Cache-Control"] == "private, no-cache"
+    assert "Cookie" in response.vary
+    assert renders == [1]
+
+
+def test_matching_etag_skips_the_view(page):
+    client, renders = page
+    etag = client.get("/page/1").headers["ETag"]
+    response = client.get("/page/1", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert renders == [1]
+
+
+def test_weak_etag_from_compressed_copy_matches(page):
+    client, _ = page
+    etag = client.get("/page/1").headers["ETag"]
+    assert client.get("/page/1", headers={"If-None-Match": f"W/{etag}"}).status_code == 304
+
+
+def test_if_modified_since(page):
+    client, _ = page
+    assert client.get("/page/1", headers={"If-Modified-Since": "Thu, 01 May 2025 09:30:15 GMT"}).status_code == 304
+    assert client.get("/page/1", headers={"If-Modified-Since": "Thu, 01 May 2025 09:30:14 GMT"}).status_code == 200
+    # If-None-Match wins when both are sent
+    response = client.get("/page/1", headers={"If-None-Match": '"stale"',
+                                              "If-Modified-Since": "Thu, 01 May 2025 09:30:15 GMT"})
+    assert response.status_code == 200
+
+
+def test_etag_differs_per_user(page):
+    assert len({page_etag(STAMPS, uid)[0] for uid in (1, 2, None)}) == 3
+
+
+def test_pending_flashes_are_rendered(page):
+    client, renders = page
+    etag = client.get("/page/1").headers["ETag"]
+    client.get("/flash")
+    response = client.get("/page/1", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert renders == [1, 1]
+
+
+def test_pages_without_validators_render_untagged(page):
+    client, renders = page
+    response = client.get("/page/2")
+    assert response.status_code == 200
+    assert "ETag" not in response.headers
+    assert renders == [2]
+
+
+def test_asset_rebuild_changes_the_etag(monkeypatch):
+    import assets
+
+    before = page_etag(STAMPS, 1)[0]
+    monkeypatch.setattr(assets, "_manifest_version", "rebuilt")
+    assert page_etag(STAMPS, 1)[0] != before
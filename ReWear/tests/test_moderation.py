@@ -0,0 +1,83 @@
+import pytest
+from sqlalchemy import insert, select
+import outbox
+import saved_searches
+from saved_searches import SavedSearchIndex
+from database import User, Product, PointTransaction, Notification, SavedSearch
+from moderation import bulk_moderate
+
+
+@pytest.fixture
+def catalog(sqlite_engine, monkeypatch):
+    monkeypatch.setattr(saved_searches, "index", SavedSearchIndex())
+    monkeypatch.setattr(saved_searches, "engine", sqlite_engine)
+    monkeypatch.setattr(outbox.dispatcher, "autostart", False)
+    with sqlite_engine.begin() as conn:
+        conn.execute(insert(User), [
+            {"uid": 1, "name": "Seller", "email": "seller@example.test", "password": "x", "points": 100},
+            {"uid": 2, "name": "Searcher", "email": "searcher@example.test", "password": "x", "points": 100},
+        ])
+        conn.execute(insert(Product), [
+            {"pid": pid, "uid": 1, "title": f"Item {pid}", "description": "", "category": "Tops",
+             "subcategory": "Shirts", "size": "M", "condition": "Good", "point_value": 10 * pid, "status": status}
+            for pid, status in ((1, "pending"), (2, "pending"), (3, "available"))
+        ])
+        conn.execute(insert(SavedSearch).values(search_id=1, uid=2, category="Tops"))
+    return sqlite_engine
+
+
+def state(engine):
+    with engine.connect() as conn:
+        return {
+            "statuses": dict(conn.execute(select(Product.pid, Product.status)).all()),
+            "points": conn.execute(select(User.points).where(User.uid == 1)).scalar(),
+            "ledger": conn.execute(select(PointTransaction.uid, PointTransaction.amount,
+                                          PointTransaction.reference_id).order_by(PointTransaction.reference_id)).all(),
+            "notifications": conn.execute(select(Notification.uid, Notification.notification_type,
+                                                 Notification.reference_id)
+                                          .order_by(Notification.uid, Notification.reference_id)).all(),
+        }
+
+
+def test_bulk_approve(catalog):
+    outcomes = bulk_moderate([1, 2, 3, 99, 1], "approve")
+    assert outcomes == {1: "approved", 2: "approved", 3: "not_pending:available", 99: "not_found"}
+    # The status change commits first; its side effects are outbox events
+    assert state(catalog)["ledger"] == []
+    assert outbox.dispatch_batch() == 2
+
+    after = state(catalog)
+    assert after["statuses"] == {1: "available", 2: "available", 3: "available"}
+    assert after["points"] == 100 + 10 + 20
+    assert after["ledger"] == [(1, 10, 1), (1, 20, 2)]
+    assert after["notifications"] == [
+        (1, "product_approved", 1), (1, "product_approved", 2),
+        (2, "saved_search_match", 1), (2, "saved_search_match", 2),
+    ]
+
+
+def test_bulk_approve_twice_awards_points_once(catalog):
+    bulk_moderate([1, 2], "approve")
+    assert bulk_moderate([1, 2], "approve") == {1: "not_pending:available", 2: "not_pending:available"}
+    outbox.dispatch_batch()
+    delivered = state(catalog)
+    assert delivered["points"] == 130
+
+    # A replayed delivery, as after a crash between effects and delivery mark, changes nothing
+    outbox.retry([1, 2])
+    assert outbox.dispatch_batch() == 2
+    assert state(catalog) == delivered
+
+
+def test_bulk_reject(catalog):
+    assert bulk_moderate([1, 3], "reject") == {1: "rejected", 3: "not_pending:available"}
+    outbox.dispatch_batch()
+    after = state(catalog)
+    assert after["statuses"] == {2: "pending", 3: "available"}
+    assert after["ledger"] == []
+    assert after["notifications"] == [(1, "product_rejected", 1)]
+
+
+def test_unknown_action():
+    with pytest.raises(ValueError):
+        bulk_moderate([1], "feature")
@@ -0,0 +1,79 @@
+import asyncio
+import threading
+import pytest
+import notifications
+from app import app
+
+NOTIFICATION = {"notification_id": 8, "message": "Your swap was accepted", "is_read": False,
+                "notification_type": "swap_accepted", "reference_id": 3, "created_at": None}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(notifications, "get_latest_notification_id", lambda uid: 7)
+    monkeypatch.setattr(notifications, "get_notifications_after",
+                        lambda uid, last_id: [NOTIFICATION] if last_id < 8 else [])
+    monkeypatch.setattr(notifications, "get_unread_count", lambda uid: 1)
+    monkeypatch.setattr(notifications.broker, "ensure_listener", lambda: None)
+    monkeypatch.setattr(notifications.broker, "stream_slots", threading.BoundedSemaphore(1))
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["uid"] = 42
+    return client
+
+
+def test_streams_past_the_cap_get_a_one_shot_poll_reply(client):
+    stream = client.get("/notifications/stream", buffered=False)
+    assert next(iter(stream.response)) == b"retry: 5000\n\n"
+
+    fallback = client.get("/notifications/stream")
+    body = fallback.get_data(as_text=True)
+    assert fallback.status_code == 200
+    assert body.startswith(f"retry: {notifications.POLL_RETRY_MS}\n\n")
+    assert "id: 8\nevent: notification" in body
+    assert 'event: unread\ndata: {"count": 1}' in body
+
+    # Closing the open stream frees its slot
+    stream.close()
+    again = client.get("/notifications/stream", buffered=False)
+    assert next(iter(again.response)) == b"retry: 5000\n\n"
+    again.close()
+
+
+def test_async_stream_wakes_on_publish(client):
+    async def read():
+        events = notifications.event_stream(42, 8)
+        first = [await events.__anext__(), await events.__anext__()]
+        pending = asyncio.ensure_future(events.__anext__())
+        await asyncio.sleep(0.05)
+        assert not pending.done()
+        # The wake-up comes from another thread, as the LISTEN thread's would
+        threading.Thread(target=notifications.broker.publish, args=([42],)).start()
+        woken = await asyncio.wait_for(pending, 2)
+        await events.aclose()
+        return first, woken
+
+    first, woken = asyncio.run(read())
+    assert first == ["retry: 5000\n\n", 'event: unread\ndata: {"count": 1}\n\n']
+    assert woken == 'event: unread\ndata: {"count": 1}\n\n'
+    assert 42 not in notifications.broker._subscribers
+
+
+def test_read_all_keeps_notifications_queued_meanwhile(sqlite_engine):
+    from sqlalchemy import insert, select
+    from database import User, Notification, queue_notifications, mark_all_notifications_read, SessionLocal
+
+    with sqlite_engine.begin() as conn:
+        conn.execute(insert(User).values(uid=1, name="Buyer", email="buyer@example.test", password="x"))
+    db = SessionLocal()
+    queue_notifications(db, [(1, "First", "swap_accepted", None), (1, "Second", "swap_accepted", None)])
+    db.commit()
+    db.close()
+    # One more counted but not yet visible to the UPDATE of rows, as if it committed in between
+    with sqlite_engine.begin() as conn:
+        conn.execute(User.__table__.update().values(unread_notifications=User.unread_notifications + 1))
+
+    assert mark_all_notifications_read(1) == 2
+    with sqlite_engine.connect() as conn:
+        assert conn.execute(select(User.unread_notifications)).scalar() == 1
+        assert conn.execute(select(Notification.is_read)).scalars().all() == [True, True]
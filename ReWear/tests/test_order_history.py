@@ -0,0 +1,40 @@
+from sqlalchemy import insert, select
+import outbox
+from database import (
+    User, Product, TransactionSummary,
+    add_product_image, create_swap_request, set_product_image_variants,
+)
+from order_history import check
+
+
+def test_rendered_variants_reach_the_order_history(sqlite_engine, monkeypatch):
+    monkeypatch.setattr(outbox.dispatcher, "autostart", False)
+    with sqlite_engine.begin() as conn:
+        conn.execute(insert(User), [
+            {"uid": uid, "name": f"User {uid}", "email": f"user{uid}@example.test", "password": "x", "points": 100}
+            for uid in (1, 2)
+        ])
+        conn.execute(insert(Product), [
+            {"pid": pid, "uid": pid, "title": f"Item {pid}", "description": "", "category": "Tops",
+             "subcategory": "Shirts", "size": "M", "condition": "Good", "point_value": 10, "status": "available"}
+            for pid in (1, 2)
+        ])
+    tid = create_swap_request(2, 1, 2)
+
+    image_id = add_product_image(1, "/media/originals/a.jpg", is_primary=True)
+
+    def thumbnails():
+        with sqlite_engine.connect() as conn:
+            return set(conn.execute(
+                select(TransactionSummary.receiver_thumbnail_url).where(TransactionSummary.tid == tid)
+            ).scalars())
+
+    assert thumbnails() == {"/media/originals/a.jpg"}
+
+    set_product_image_variants(image_id, 1200, 900, [
+        {"width": 320, "format": "jpg", "url": "/media/variants/a/320.jpg"},
+        {"width": 640, "format": "jpg", "url": "/media/variants/a/640.jpg"},
+    ])
+    assert thumbnails() == {"/media/variants/a/320.jpg"}
+    report = check()
+    assert not report["missing"] and not report["stale"]
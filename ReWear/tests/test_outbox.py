@@ -0,0 +1,129 @@
+import pytest
+from sqlalchemy import insert, select, update
+import outbox
+import saved_searches
+from saved_searches import SavedSearchIndex
+from database import (
+    User, Product, PointTransaction, Notification, SavedSearch, OutboxEvent,
+    approve_product, create_product, create_swap_request, reject_transaction,
+)
+
+
+@pytest.fixture
+def catalog(sqlite_engine, monkeypatch):
+    monkeypatch.setattr(saved_searches, "index", SavedSearchIndex())
+    monkeypatch.setattr(saved_searches, "engine", sqlite_engine)
+    monkeypatch.setattr(outbox.dispatcher, "autostart", False)
+    with sqlite_engine.begin() as conn:
+        conn.execute(insert(User), [
+            {"uid": 1, "name": "Seller", "email": "seller@example.test", "password": "x", "points": 100},
+            {"uid": 2, "name": "Searcher", "email": "searcher@example.test", "password": "x", "points": 100},
+        ])
+        conn.execute(insert(Product), [
+            {"pid": pid, "uid": 1, "title": f"Item {pid}", "description": "", "category": "Tops",
+             "subcategory": "Shirts", "size": "M", "condition": "Good", "point_value": 10 * pid, "status": "pending"}
+            for pid in (1, 2)
+        ])
+        conn.execute(insert(SavedSearch).values(search_id=1, uid=2, category="Tops"))
+    return sqlite_engine
+
+
+def effects(engine):
+    with engine.connect() as conn:
+        return {
+            "points": conn.execute(select(User.points).where(User.uid == 1)).scalar(),
+            "ledger": conn.execute(select(PointTransaction.uid, PointTransaction.amount,
+                                          PointTransaction.reference_id).order_by(PointTransaction.reference_id)).all(),
+            "notifications": conn.execute(select(Notification.uid, Notification.notification_type,
+                                                 Notification.reference_id)
+                                          .order_by(Notification.uid, Notification.reference_id)).all(),
+        }
+
+
+def events(engine):
+    with engine.connect() as conn:
+        return conn.execute(
+            select(OutboxEvent.event_id, OutboxEvent.processed_at.isnot(None), OutboxEvent.attempts,
+                   OutboxEvent.last_error.isnot(None))
+            .order_by(OutboxEvent.event_id)
+        ).all()
+
+
+def test_approval_side_effects_wait_for_the_dispatcher(catalog):
+    assert approve_product(1, admin_uid=1)
+    assert effects(catalog)["ledger"] == []
+    assert outbox.status()["pending"] == 1
+
+    assert outbox.dispatch_batch() == 1
+    assert effects(catalog) == {
+        "points": 110,
+        "ledger": [(1, 10, 1)],
+        "notifications": [(1, "product_approved", 1), (2, "saved_search_match", 1)],
+    }
+    assert events(catalog) == [(1, True, 1, False)]
+    assert outbox.dispatch_batch() == 0
+
+
+def test_replayed_events_change_nothing(catalog):
+    approve_product(1, admin_uid=1)
+    approve_product(2, admin_uid=1)
+    outbox.dispatch_batch()
+    delivered = effects(catalog)
+
+    assert outbox.retry([1, 2]) == 2
+    assert outbox.dispatch_batch() == 2
+    assert effects(catalog) == delivered
+    assert delivered["points"] == 130
+
+
+def test_failing_event_does_not_hold_back_its_batch(catalog):
+    approve_product(1, admin_uid=1)
+    with catalog.begin() as conn:
+        conn.execute(insert(OutboxEvent).values(event_type="unknown", aggregate_id=1, payload={}))
+    approve_product(2, admin_uid=1)
+
+    assert outbox.dispatch_batch() == 3
+    assert events(catalog) == [(1, True, 1, False), (2, False, 1, True), (3, True, 1, False)]
+    assert effects(catalog)["points"] == 130
+
+
+def test_failed_event_backs_off(catalog):
+    with catalog.begin() as conn:
+        conn.execute(insert(OutboxEvent).values(event_type="unknown", aggregate_id=1, payload={}))
+
+    assert outbox.dispatch_batch() == 1
+    # Failed once: not claimed again until its next_attempt_at
+    assert outbox.dispatch_batch() == 0
+    with catalog.connect() as conn:
+        attempts, retry_at = conn.execute(select(OutboxEvent.attempts, OutboxEvent.next_attempt_at)).one()
+    assert attempts == 1 and retry_at is not None
+    assert outbox.retry_delay(1) < outbox.retry_delay(3) <= outbox.RETRY_MAX_SECONDS
+
+    with catalog.begin() as conn:
+        conn.execute(update(OutboxEvent).values(next_attempt_at=None))
+    assert outbox.dispatch_batch() == 1
+    assert events(catalog) == [(1, False, 2, True)]
+
+
+def test_listing_bonus_and_rejection_refund_go_through_the_outbox(catalog):
+    with catalog.begin() as conn:
+        conn.execute(insert(Product).values(pid=3, uid=2, title="Offered", description="", category="Tops",
+                                            subcategory="Shirts", size="M", condition="Good", point_value=10,
+                                            status="available"))
+        conn.execute(update(Product).where(Product.pid == 1).values(status="available"))
+    pid = create_product(1, {"title": "New", "description": "", "category": "Tops", "subcategory": "Shirts",
+                             "size": "M", "condition": "Good"})
+    tid = create_swap_request(2, 1, 3)
+    assert reject_transaction(tid)
+    before = effects(catalog)
+    assert (1, 10, pid) not in before["ledger"]
+
+    outbox.dispatch_batch()
+    after = effects(catalog)
+    assert (1, 10, pid) in after["ledger"]
+    assert (2, 5, tid) in after["ledger"]
+    assert (2, "transaction_rejected", tid) in after["notifications"]
+
+    outbox.retry([e[0] for e in events(catalog)])
+    outbox.dispatch_batch()
+    assert effects(catalog) == after
@@ -0,0 +1,76 @@
+import pytest
+from sqlalchemy import text
+import database
+import overload
+from app import app
+from overload import AdmissionController, StatementCancelled, classify, guard, install_deadlines, set_deadline, clear_deadline
+
+
+@pytest.fixture
+def client(sqlite_engine, monkeypatch):
+    # Every request's deadline has already passed when its first statement starts
+    install_deadlines(sqlite_engine)
+    monkeypatch.setattr(overload, "DEADLINES_MS", {kind: -1 for kind in overload.DEADLINES_MS})
+    app.config["TESTING"] = True
+    return app.test_client()
+
+
+def test_timed_out_login_returns_503(client):
+    response = client.post("/login", data={"email": "someone@example.test", "password": "secret"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"]
+    assert b"Invalid email or password" not in response.data
+
+
+def test_timed_out_api_returns_json_503(client):
+    response = client.get("/api/v1/products/1")
+    assert response.status_code == 503
+    assert response.get_json()["reason"] == "deadline"
+
+
+def test_other_database_errors_keep_the_helpers_handling(sqlite_engine):
+    @guard
+    def broken_helper():
+        db = database.SessionLocal()
+        try:
+            return db.execute(text("SELECT no_such_column FROM users")).all()
+        except Exception as e:
+            print(f"Error in helper: {e}")
+            return []
+        finally:
+            db.close()
+
+    install_deadlines(sqlite_engine)
+    set_deadline(60000)
+    try:
+        assert broken_helper() == []
+    finally:
+        clear_deadline()
+
+
+def test_statement_stopped_at_the_deadline_is_cancelled(sqlite_engine):
+    install_deadlines(sqlite_engine)
+    slow = text("WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT count(*) FROM n")
+    # The progress handler is installed on connect: drop the connections create_all opened
+    sqlite_engine.dispose()
+    set_deadline(50)
+    try:
+        with sqlite_engine.connect() as conn:
+            with pytest.raises(StatementCancelled):
+                conn.execute(slow)
+    finally:
+        clear_deadline()
+
+
+def test_admin_typeahead_is_not_expensive():
+    assert classify("admin_panel") == "expensive"
+    assert classify("export_table") == "expensive"
+    assert classify("admin_search_users") == "standard"
+    assert classify("admin_search_transactions") == "standard"
+
+
+def test_typeahead_admitted_while_export_holds_the_expensive_slot():
+    controller = AdmissionController(threads=4, browse_reserved=1, expensive_slots=1, standard_wait=0)
+    assert controller.admit(classify("export_table"))
+    assert not controller.admit(classify("admin_panel"))
+    assert controller.admit(classify("admin_search_users"))
@@ -0,0 +1,29 @@
+from datetime import datetime
+import pytest
+import app as app_module
+import http_cache
+from http_cache import page_etag
+
+STAMPS = (datetime(2025, 5, 1, 9, 30), None)
+
+
+@pytest.fixture
+def views(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(app_module, "record_product_view", recorded.append)
+    return recorded
+
+
+def test_revalidated_views_are_counted(views, monkeypatch):
+    monkeypatch.setattr(http_cache, "get_product_freshness", lambda pid: STAMPS)
+    etag, _ = page_etag(STAMPS, None)
+
+    response = app_module.app.test_client().get("/product/5", headers={"If-None-Match": f'"{etag}"'})
+    assert response.status_code == 304
+    assert views == [5]
+
+
+def test_missing_products_are_not_counted(views, sqlite_engine):
+    response = app_module.app.test_client().get("/product/404")
+    assert response.status_code == 404
+    assert views == []
@@ -0,0 +1,88 @@
+from types import SimpleNamespace
+from sqlalchemy import insert
+import saved_searches
+from saved_searches import SavedSearchIndex, notify_saved_searches
+from database import SessionLocal, User, SavedSearch, Notification
+
+SEARCHES = [
+    # search_id, category, size, condition, max_points
+    (1, "Tops", "M", None, 50),
+    (2, "Tops", None, None, None),
+    (3, None, "M", "Good", 30),
+    (4, "Bottoms", "M", None, None),
+    (5, None, None, None, 45),
+]
+
+
+def test_match_applies_every_criterion():
+    index = SavedSearchIndex()
+    index.build(SEARCHES)
+    assert sorted(index.match("Tops", "M", "Good", 40)) == [1, 2, 5]
+    assert sorted(index.match("Tops", "M", "Good", 30)) == [1, 2, 3, 5]
+    assert sorted(index.match("Tops", "L", "Fair", 60)) == [2]
+    assert index.match("Dresses", "S", "New", 100) == []
+
+
+def test_added_and_forgotten_searches():
+    index = SavedSearchIndex()
+    index.build(SEARCHES)
+    index.add(6, "Dresses", None, None, 80)
+    assert index.match("Dresses", "S", "New", 80) == [6]
+    index.forget([6, 2])
+    assert index.match("Dresses", "S", "New", 80) == []
+    assert sorted(index.match("Tops", "L", "Fair", 10)) == [5]
+
+
+def save(conn, search_id, **criteria):
+    conn.execute(insert(SavedSearch).values(search_id=search_id, uid=1, **criteria))
+
+
+def test_sync_keeps_searches_other_workers_saved_with_lower_ids(sqlite_engine, monkeypatch):
+    monkeypatch.setattr(saved_searches, "engine", sqlite_engine)
+    with sqlite_engine.begin() as conn:
+        conn.execute(insert(User).values(uid=1, name="Searcher", email="searcher@example.test", password="x"))
+        save(conn, 1, category="Tops")
+    index = SavedSearchIndex()
+    index.rebuild()
+
+    # This worker saves 3; another worker's 2 commits afterwards
+    with sqlite_engine.begin() as conn:
+        save(conn, 3, category="Bottoms")
+    index.add(3, "Bottoms", None, None, None)
+    with sqlite_engine.begin() as conn:
+        save(conn, 2, category="Dresses")
+
+    db = SessionLocal()
+    try:
+        index.sync(db)
+        index.sync(db)
+    finally:
+        db.close()
+    assert index.match("Dresses", "M", "Good", 10) == [2]
+    assert index.match("Bottoms", "M", "Good", 10) == [3]
+    assert index.size == 3
+
+
+def test_notify_queues_one_alert_per_user_and_product(sqlite_engine, monkeypatch):
+    monkeypatch.setattr(saved_searches, "index", SavedSearchIndex())
+    monkeypatch.setattr(saved_searches, "engine", sqlite_engine)
+    with sqlite_engine.begin() as conn:
+        conn.execute(insert(User), [
+            {"uid": 1, "name": "Searcher", "email": "searcher@example.test", "password": "x"},
+            {"uid": 2, "name": "Seller", "email": "seller@example.test", "password": "x"},
+        ])
+        save(conn, 1, category="Tops")
+        save(conn, 2, size="M")
+        conn.execute(insert(SavedSearch).values(search_id=3, uid=2, category="Tops"))
+
+    product = SimpleNamespace(pid=9, uid=2, title="Linen shirt", category="Tops", size="M",
+                              condition="Good", point_value=40)
+    db = SessionLocal()
+    try:
+        assert notify_saved_searches(db, [product]) == 1
+        db.commit()
+        alerts = db.query(Notification.uid, Notification.reference_id).all()
+    finally:
+        db.close()
+    # Two matching searches, one alert; none for the seller's own search
+    assert alerts == [(1, 9)]
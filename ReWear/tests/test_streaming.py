@@ -0,0 +1,80 @@
+import gzip
+import zlib
+import pytest
+from flask import Flask
+import streaming
+from streaming import init_compression, MIN_COMPRESS_BYTES
+
+PAGE = "".join(f"<li>Item {n}</li>" for n in range(2000))
+
+
+@pytest.fixture
+def client():
+    flask_app = Flask(__name__)
+    closed = []
+
+    def chunks(text, size=500):
+        try:
+            for start in range(0, len(text), size):
+                yield text[start:start + size].encode()
+        finally:
+            closed.append(True)
+
+    @flask_app.route("/stream")
+    def stream():
+        response = flask_app.response_class(chunks(PAGE), mimetype="text/html")
+        response.set_etag("page")
+        return response
+
+    @flask_app.route("/small")
+    def small():
+        return flask_app.response_class(chunks("<p>short</p>"), mimetype="text/html")
+
+    @flask_app.route("/buffered")
+    def buffered():
+        return PAGE
+
+    init_compression(flask_app)
+    client = flask_app.test_client()
+    client.closed = closed
+    return client
+
+
+def test_streamed_body_is_gzipped_chunk_by_chunk(client, monkeypatch):
+    monkeypatch.setattr(streaming, "brotli", None)
+    response = client.get("/stream", headers={"Accept-Encoding": "gzip"}, buffered=False)
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    assert response.headers["ETag"] == 'W/"page"'
+    assert "Accept-Encoding" in response.vary
+
+    # Every chunk is sync-flushed: what has been sent so far decodes on its own
+    decoder = zlib.decompressobj(31)
+    chunks = list(response.response)
+    assert len(chunks) > 2
+    first = decoder.decompress(chunks[0])
+    assert first and PAGE.encode().startswith(first)
+    assert first + b"".join(decoder.decompress(chunk) for chunk in chunks[1:]) == PAGE.encode()
+    response.close()
+    assert client.closed == [True]
+
+
+def test_short_stream_goes_out_uncompressed(client):
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert len(b"<p>short</p>") < MIN_COMPRESS_BYTES
+    assert "Content-Encoding" not in response.headers
+    assert response.data == b"<p>short</p>"
+
+
+def test_identity_when_not_accepted(client):
+    response = client.get("/stream", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["ETag"] == '"page"'
+    assert response.data == PAGE.encode()
+
+
+def test_buffered_body_is_compressed_in_one_go(client, monkeypatch):
+    monkeypatch.setattr(streaming, "brotli", None)
+    response = client.get("/buffered", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.data) == PAGE.encode()